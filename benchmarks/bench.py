@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+
+"""
+Benchmarks for the Unruly and Net solvers, with a regression check
+
+Times each of the hot paths below on the corpus from corpus.py, repeating each
+case and keeping the minimum and median wall-clock times:
+
+ * unruly.propagate/SIZE: the tactics, on every puzzle of that size
+ * unruly_z3.solve_board/SIZE: Z3, on every puzzle of that size
+ * minimize_z3.minimize/SIZE: Z3 minimisation from the solution (6x6 only,
+   since it rebuilds the solver for every clue)
+ * minimize_z3.minimize_incremental/SIZE: the same, incrementally
+ * untactical_z3.find_puzzles/4x4: the whole untactical search at 4x4, which
+   proves there are no such puzzles
+ * untactical_z3.find_puzzle/6x6: the first untactical 6x6 puzzle. This varies
+   from a few seconds to minutes from run to run, so it's only run with --slow
+ * net.Board.solve/SIZE-wrap|nowrap: a fixed number of Tabu search steps
+   from a fixed seed, on every Net board of that size
+
+Results go to a JSON file. Given a baseline (a results file from an earlier
+run), any case whose median has grown by more than the threshold factor, and by
+more than the noise floor in seconds, is reported as a regression, and the exit
+status is 1:
+
+  bench.py --out results.json --baseline baseline.json
+  bench.py --out baseline.json                            # refresh the baseline
+
+baseline.json was recorded on a single-core Linux x86_64 machine with Python
+3.11, so compare against a baseline from your own machine where you can.
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+import corpus
+
+import minimize_z3  # noqa: E402 (corpus puts the solvers on sys.path)
+import net  # noqa: E402
+import unruly  # noqa: E402
+import unruly_z3  # noqa: E402
+import untactical_z3  # noqa: E402
+
+NET_STEPS = 2000
+SLOW = {'untactical_z3.find_puzzle/6x6'}
+
+
+def unruly_cases(boards):
+    cases = {}
+    for size, pairs in boards.items():
+        puzzles = [board for board, solution in pairs]
+        cases[f'unruly.propagate/{size}x{size}'] = lambda puzzles=puzzles: [
+            unruly.propagate([row[:] for row in board]) for board in puzzles
+        ]
+        cases[f'unruly_z3.solve_board/{size}x{size}'] = lambda puzzles=puzzles: [
+            unruly_z3.solve_board(board) for board in puzzles
+        ]
+        if size <= 8:
+            if size == 6:
+                cases[f'minimize_z3.minimize/{size}x{size}'] = lambda pairs=pairs: [
+                    minimize_z3.minimize([row[:] for row in solution], solution) for board, solution in pairs
+                ]
+            cases[f'minimize_z3.minimize_incremental/{size}x{size}'] = lambda pairs=pairs: [
+                minimize_z3.minimize_incremental([row[:] for row in solution], solution) for board, solution in pairs
+            ]
+    cases['untactical_z3.find_puzzles/4x4'] = lambda: list(untactical_z3.find_puzzles(2, seed=0, progress=False))
+    cases['untactical_z3.find_puzzle/6x6'] = lambda: next(untactical_z3.find_puzzles(3, seed=0, progress=False))
+    return cases
+
+
+def net_cases(boards):
+    cases = {}
+    for (size, wrap), boards_of_size in boards.items():
+        def solve(boards_of_size=boards_of_size, wrap=wrap):
+            for k, lines in enumerate(boards_of_size):
+                board = net.Board(lines, wrap=wrap, rng=np.random.default_rng(k))
+                board.solve(steps=NET_STEPS)
+        cases[f'net.Board.solve/{size}x{size}-{"wrap" if wrap else "nowrap"}'] = solve
+    return cases
+
+
+def time_case(function, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return dict(min=min(times), median=statistics.median(times), repeats=repeats)
+
+
+def run(cases, repeats, only=None, slow=False):
+    results = {}
+    for name, function in cases.items():
+        if only and not any(pattern in name for pattern in only):
+            continue
+        if name in SLOW and not slow:
+            continue
+        results[name] = time_case(function, repeats)
+        print(f"{name:50} {results[name]['median']:10.4f}s", file=sys.stderr)
+    return results
+
+
+def regressions(results, baseline, threshold, noise):
+    """[(name, baseline median, new median)] for every case which got slower"""
+    slower = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        old, new = baseline[name]['median'], result['median']
+        if new > old * threshold and new - old > noise:
+            slower.append((name, old, new))
+    return slower
+
+
+def test_regressions():
+    baseline = {'a': dict(median=1.0), 'b': dict(median=0.001), 'c': dict(median=1.0)}
+    results = {'a': dict(median=2.0), 'b': dict(median=0.003), 'c': dict(median=1.1), 'd': dict(median=5.0)}
+    assert regressions(results, baseline, threshold=1.5, noise=0.01) == [('a', 1.0, 2.0)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--out', type=Path, default=Path('results.json'))
+    parser.add_argument('--baseline', type=Path, help="results file to compare against")
+    parser.add_argument('--threshold', type=float, default=1.5, help="slowdown factor counted as a regression")
+    parser.add_argument('--noise', type=float, default=0.005, help="ignore slowdowns smaller than this (seconds)")
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--count', type=int, default=3, help="boards of each size")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--only', nargs='*', help="only run cases whose names contain one of these")
+    parser.add_argument('--slow', action='store_true', help="include the cases with very variable timings")
+    args = parser.parse_args()
+    cases = {}
+    cases.update(unruly_cases(corpus.unruly_corpus(count=args.count, seed=args.seed)))
+    cases.update(net_cases(corpus.net_corpus(count=args.count, seed=args.seed)))
+    results = run(cases, args.repeats, args.only, args.slow)
+    args.out.write_text(json.dumps(dict(
+        python=platform.python_version(),
+        machine=platform.machine(),
+        count=args.count,
+        seed=args.seed,
+        results=results,
+    ), indent=2) + "\n")
+    if args.baseline is not None:
+        baseline = json.loads(args.baseline.read_text())['results']
+        slower = regressions(results, baseline, args.threshold, args.noise)
+        for name, old, new in slower:
+            print(f"REGRESSION {name}: {old:.4f}s -> {new:.4f}s ({new / old:.2f}x)")
+        if slower:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline}")
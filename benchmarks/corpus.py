@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+"""
+Reproducible corpora of Unruly and Net boards for the benchmarks in bench.py
+
+Every board comes from its own seeded random generator, so the same seed always
+gives the same corpus, whatever else has been generated:
+
+ * Unruly: puzzles from unruly/generate.py (a random complete grid, with clues
+   removed in a random order for as long as the solution stays unique). Sizes
+   6x6 to 16x16.
+ * Net: a random spanning tree of the grid with no cell of degree 4 (there's no
+   piece for that), turned into piece letters. Sizes 5x5 to 20x20, with and
+   without wrapping.
+
+Boards are written under corpus/ the first time they're asked for, as text in
+the formats the solvers already read (an Unruly file holds the puzzle, a blank
+line, then the solution), and read back from there after that.
+"""
+
+import argparse
+import random
+import sys
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+sys.path[:0] = [str(HERE.parent / 'unruly'), str(HERE.parent / 'net')]
+
+import generate  # noqa: E402
+import unruly  # noqa: E402
+import unruly_search  # noqa: E402
+
+UNRULY_SIZES = [6, 8, 10, 12, 14, 16]
+NET_SIZES = [5, 10, 15, 20]
+CORPUS_DIR = HERE / 'corpus'
+
+
+def random_net(size, wrap, rng):
+    """A random Net board, as lines of piece letters"""
+    moves = [(0, -1), (-1, 0), (0, 1), (1, 0)]
+    while True:
+        exits = {(i, j): set() for i in range(size) for j in range(size)}
+        seen = {(0, 0)}
+        frontier = [((0, 0), d) for d in range(4)]
+        while frontier:
+            cell, d = frontier.pop(rng.randrange(len(frontier)))
+            if len(exits[cell]) >= 3:
+                continue
+            i, j = cell[0] + moves[d][0], cell[1] + moves[d][1]
+            if wrap:
+                i, j = i % size, j % size
+            elif not (0 <= i < size and 0 <= j < size):
+                continue
+            if (i, j) in seen:
+                continue
+            seen.add((i, j))
+            exits[cell].add(d)
+            exits[(i, j)].add((d + 2) % 4)
+            frontier.extend(((i, j), e) for e in range(4))
+        # Very occasionally the degree limit cuts a cell off; try again
+        if len(seen) == size * size:
+            break
+    lines = []
+    for i in range(size):
+        line = ''
+        for j in range(size):
+            e = exits[(i, j)]
+            if len(e) == 1:
+                line += 'Q'
+            elif len(e) == 3:
+                line += 'T'
+            else:
+                line += 'I' if max(e) - min(e) == 2 else 'L'
+        lines.append(line)
+    return lines
+
+
+def unruly_corpus(sizes=UNRULY_SIZES, count=3, seed=0, directory=CORPUS_DIR):
+    """{size: [(puzzle, solution), ...]}, generating anything not already on disk"""
+    corpus = {}
+    for size in sizes:
+        corpus[size] = []
+        for k in range(count):
+            path = Path(directory) / 'unruly' / f'{size}x{size}_{seed}_{k}'
+            if not path.exists():
+                board, solution = generate.random_puzzle(size, random.Random(f'unruly {size} {seed} {k}'))
+                path.parent.mkdir(parents=True, exist_ok=True)
+                path.write_text(unruly.board_to_str(board) + "\n\n" + unruly.board_to_str(solution) + "\n")
+            rows = path.read_text().split()
+            corpus[size].append((unruly.read_board(rows[:size]), unruly.read_board(rows[size:])))
+    return corpus
+
+
+def net_corpus(sizes=NET_SIZES, count=3, seed=0, directory=CORPUS_DIR):
+    """{(size, wrap): [lines, ...]}, generating anything not already on disk"""
+    corpus = {}
+    for size in sizes:
+        for wrap in (False, True):
+            corpus[(size, wrap)] = []
+            for k in range(count):
+                name = f'{size}x{size}_{"wrap" if wrap else "nowrap"}_{seed}_{k}'
+                path = Path(directory) / 'net' / name
+                if not path.exists():
+                    lines = random_net(size, wrap, random.Random(f'net {name}'))
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    path.write_text("\n".join(lines) + "\n")
+                corpus[(size, wrap)].append(path.read_text().split())
+    return corpus
+
+
+def test_unruly_corpus(tmp_path):
+    corpus = unruly_corpus([6, 8], count=2, directory=tmp_path)
+    assert unruly_corpus([6, 8], count=2, directory=tmp_path) == corpus
+    for size, boards in corpus.items():
+        for board, solution in boards:
+            assert unruly_search.count_solutions(board) == 1
+            assert unruly_search.solve_board(board) == solution
+    assert corpus[6][0] != corpus[6][1]
+
+
+def test_net_corpus(tmp_path):
+    import net_exact
+    corpus = net_corpus([4], count=2, directory=tmp_path)
+    for (size, wrap), boards in corpus.items():
+        for lines in boards:
+            assert len(lines) == size and all(len(line) == size for line in lines)
+            # Built from a spanning tree, so there's a solution
+            assert net_exact.solve(lines, wrap) is not None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=3, help="boards of each size")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--dir', type=Path, default=CORPUS_DIR)
+    args = parser.parse_args()
+    unruly_corpus(count=args.count, seed=args.seed, directory=args.dir)
+    net_corpus(count=args.count, seed=args.seed, directory=args.dir)
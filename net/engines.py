@@ -0,0 +1,222 @@
+"""
+Local search engines for Net, sharing the move kernel in net.Board
+
+Every engine repeatedly picks a cell with a non-zero penalty and tries to
+rotate it, using the Board for the bookkeeping: Board.delta gives the change
+in total penalty for a rotation in O(1), Board.move makes it (updating exits,
+penalties and the set of conflicted cells in O(1)), and Board.update does the
+same subject to the Tabu list.
+
+ * TabuEngine is the original search from net.py: choose a cell with
+   probability proportional to its penalty, then an orientation with weight
+   1 / (1 + penalty), or exp(-penalty / temperature), and let the Tabu list
+   veto it.
+ * AnnealingEngine is simulated annealing: propose a random rotation of a
+   conflicted cell, and accept it if it doesn't make things worse, or with
+   probability exp(-delta / temperature) if it does. The temperature falls
+   geometrically or linearly each step, down to a floor.
+ * MinConflictsEngine rotates a conflicted cell to whichever orientation
+   gives the lowest total penalty, with a random walk step now and then to
+   get out of local minima.
+
+Engine.run drives all of them, and keeps track of the best board seen. If a
+hook is given, it's called after every step as hook(engine, step, i, j,
+orientation, accepted); with no hook, this costs nothing. Recorder is a hook
+which collects statistics about the run for export as JSON: steps per second,
+moves accepted and rejected (by the Tabu list, or the annealing acceptance
+test) and the penalty every so many steps.
+"""
+
+import math
+import time
+
+import numpy as np
+
+
+class Engine:
+    """Base class: subclasses implement step(), which tries a single move"""
+
+    def __init__(self, board, hook=None):
+        self.board = board
+        self.rng = board.rng
+        self.hook = hook
+
+    def step(self):
+        """Try one move. Returns (i, j, orientation, accepted)."""
+        raise NotImplementedError
+
+    def run(self, steps=None, stop=None):
+        """Search for up to steps moves, or until the penalty reaches zero
+
+        stop is an optional function which is checked every 100 steps, and ends
+        the search early if it returns True. Returns (steps taken, lowest
+        penalty, step at which it was reached, orientations at that step)."""
+        board = self.board
+        hook = self.hook
+        count = 0
+        min_penalty, best_iteration = np.inf, 0
+        best_orientations = np.copy(board.orientations)
+        while steps is None or count < steps:
+            if stop is not None and count % 100 == 0 and stop():
+                break
+            count += 1
+            error = board.error
+            if error < min_penalty:
+                min_penalty = error
+                best_iteration = count - 1
+                best_orientations = np.copy(board.orientations)
+            if error == 0:
+                # Finished!
+                break
+            i, j, orientation, accepted = self.step()
+            if hook is not None:
+                hook(self, count, i, j, orientation, accepted)
+        return count, min_penalty, best_iteration, best_orientations
+
+    def other_orientation(self, i, j):
+        """A random orientation for cell (i, j) other than its current one"""
+        return (self.board.orientations[i, j] + 1 + int(self.rng.random() * 3)) % 4
+
+
+class TabuEngine(Engine):
+    def __init__(self, board, temperature=None, hook=None):
+        super().__init__(board, hook)
+        self.temperature = temperature
+
+    def step(self):
+        board = self.board
+        i, j = board.weighted_conflicted()
+        options = np.array([board.penalty(i, j, o) for o in range(4)])
+        if self.temperature is None:
+            weights = 1 / (1 + options)
+        else:
+            weights = np.exp(-options / self.temperature)
+        weights = weights / np.sum(weights)
+        orientation = self.rng.choice(np.arange(4), p=weights)
+        return i, j, orientation, board.update(i, j, orientation)
+
+
+class AnnealingEngine(Engine):
+    def __init__(self, board, temperature=2.0, cooling=0.999, schedule='geometric', minimum=0.05, hook=None):
+        """cooling is the factor (geometric) or amount (linear) by which the
+        temperature falls each step"""
+        super().__init__(board, hook)
+        if schedule not in ('geometric', 'linear'):
+            raise ValueError(f"Unknown cooling schedule {schedule}")
+        self.temperature = temperature
+        self.cooling = cooling
+        self.schedule = schedule
+        self.minimum = minimum
+
+    def step(self):
+        board = self.board
+        i, j = board.random_conflicted()
+        orientation = self.other_orientation(i, j)
+        delta = board.delta(i, j, orientation)
+        accepted = delta <= 0 or self.rng.random() < math.exp(-delta / self.temperature)
+        if accepted:
+            board.move(i, j, orientation)
+        if self.schedule == 'geometric':
+            self.temperature *= self.cooling
+        else:
+            self.temperature -= self.cooling
+        self.temperature = max(self.temperature, self.minimum)
+        return i, j, orientation, accepted
+
+
+class MinConflictsEngine(Engine):
+    def __init__(self, board, walk=0.1, hook=None):
+        """walk is the probability of a random rotation instead of the best one"""
+        super().__init__(board, hook)
+        self.walk = walk
+
+    def step(self):
+        board = self.board
+        i, j = board.random_conflicted()
+        if self.rng.random() < self.walk:
+            orientation = self.other_orientation(i, j)
+        else:
+            current = board.orientations[i, j]
+            best, candidates = None, []
+            for o in range(4):
+                if o == current:
+                    continue
+                delta = board.delta(i, j, o)
+                if best is None or delta < best:
+                    best, candidates = delta, [o]
+                elif delta == best:
+                    candidates.append(o)
+            orientation = candidates[int(self.rng.random() * len(candidates))]
+        board.move(i, j, orientation)
+        return i, j, orientation, True
+
+
+class Recorder:
+    """A hook which counts steps, accepted and rejected moves, and records the
+    penalty every `every` steps
+
+    trace, if given, is another hook, which is called after this one. The
+    clock starts when the Recorder is made."""
+
+    def __init__(self, every=100, trace=None):
+        self.every = every
+        self.trace = trace
+        self.engine = None
+        self.steps = 0
+        self.accepted = 0
+        self.trajectory = []
+        self.start = time.perf_counter()
+
+    def __call__(self, engine, step, i, j, orientation, accepted):
+        self.steps += 1
+        self.accepted += bool(accepted)
+        if (step - 1) % self.every == 0:
+            self.engine = type(engine).__name__
+            self.trajectory.append((step, int(engine.board.error)))
+        if self.trace is not None:
+            self.trace(engine, step, i, j, orientation, accepted)
+
+    def as_dict(self):
+        seconds = time.perf_counter() - self.start
+        return dict(
+            engine=self.engine,
+            steps=self.steps,
+            accepted=self.accepted,
+            rejected=self.steps - self.accepted,
+            seconds=seconds,
+            steps_per_second=self.steps / seconds if seconds > 0 else None,
+            penalties=self.trajectory,
+        )
+
+
+ENGINES = {
+    'tabu': TabuEngine,
+    'anneal': AnnealingEngine,
+    'min-conflicts': MinConflictsEngine,
+}
+
+
+def test_engines():
+    from net import Board
+    lines = ['QQL', 'LIT', 'QIL']
+    for name, engine in ENGINES.items():
+        board = Board(lines, rng=np.random.default_rng(1))
+        steps = []
+        count, min_penalty, best_iteration, best_orientations = engine(
+            board, hook=lambda engine, step, *move: steps.append(step)).run(10000)
+        assert min_penalty == 0 == board.error, name
+        assert steps == list(range(1, count)), name
+        assert (best_orientations == board.orientations).all(), name
+
+
+def test_recorder():
+    from net import Board
+    board = Board(['QQL', 'LIT', 'QIL'], rng=np.random.default_rng(1))
+    steps = []
+    recorder = Recorder(every=10, trace=lambda engine, step, *move: steps.append(step))
+    count, *_ = TabuEngine(board, hook=recorder).run(10000)
+    stats = recorder.as_dict()
+    assert stats['steps'] == len(steps) == count - 1
+    assert stats['accepted'] + stats['rejected'] == stats['steps']
+    assert stats['engine'] == 'TabuEngine'
+    assert [step for step, penalty in stats['penalties']] == list(range(1, count, 10))
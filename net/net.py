@@ -1,14 +1,19 @@
 #!/usr/bin/env python
 
 """
-Solve Net puzzles using Tabu search
+Solve Net puzzles using Tabu search (see engines.py for other local searches)
 """
 
+import argparse
 import fileinput
+import json
+from collections import deque
 from random import random
 
 import numpy as np
 
+import engines
+
 
 shapes = {
     'T': (True, False, True, True),
@@ -31,22 +36,57 @@ pics = {
 
 
 class Board:
-    def __init__(self, lines, wrap=False, tabu_length=20):
+    """A Net board, with the state needed for Tabu search
+
+    With tabu_mode='board', the Tabu list holds the last tabu_length whole-board
+    configurations, identified by a Zobrist hash of the orientations which is
+    updated in O(1) on every move. With tabu_mode='move', a cell may not rotate
+    back to an orientation it left within the last tabu_length moves.
+
+    rng is the source of randomness for solve(): a np.random.Generator, or by
+    default the global np.random state."""
+
+    def __init__(self, lines, wrap=False, tabu_length=20, tabu_mode='board', rng=None):
         self.size = len(lines)
         self.wrap = wrap
         self.pieces = [line.rstrip('\n') for line in lines]
         self.orientations = np.zeros((self.size, self.size), dtype=int)
         # If the board doesn't wrap, add an extra line at the edge which is always False
         self.exit_size = self.size + (not wrap)
-        self.left = np.zeros((self.exit_size, self.exit_size))
-        self.up = np.zeros((self.exit_size, self.exit_size))
-        self.right = np.zeros((self.exit_size, self.exit_size))
-        self.down = np.zeros((self.exit_size, self.exit_size))
+        self.left = np.zeros((self.exit_size, self.exit_size), dtype=bool)
+        self.up = np.zeros((self.exit_size, self.exit_size), dtype=bool)
+        self.right = np.zeros((self.exit_size, self.exit_size), dtype=bool)
+        self.down = np.zeros((self.exit_size, self.exit_size), dtype=bool)
         for i in range(self.size):
             for j in range(self.size):
                 self.set_exits(i, j)
-        self.tabu_list = []
+        # Kept up to date by update(), which only recomputes the cells it touches
+        self.penalty_grid = self.compute_penalties()
+        self.error = int(np.sum(self.penalty_grid))
+        # Cells with non-zero penalty, as a list and a map back to list positions,
+        # so that cells can be added, removed and sampled in O(1)
+        self.conflicted = []
+        self.conflicted_index = {}
+        for i in range(self.size):
+            for j in range(self.size):
+                if self.penalty_grid[i, j]:
+                    self.add_conflicted(i, j)
         self.tabu_length = tabu_length
+        self.tabu_mode = tabu_mode
+        self.rng = np.random if rng is None else rng
+        # Fixed seed, so hashes don't depend on the search's random state
+        zobrist = np.random.default_rng(0).integers(2 ** 63, size=(self.size, self.size, 4))
+        self.zobrist = zobrist.tolist()
+        self.hash = 0
+        for i in range(self.size):
+            for j in range(self.size):
+                self.hash ^= self.zobrist[i][j][self.orientations[i, j]]
+        # Ring buffer of recent hashes, and the same hashes as a set for lookups
+        self.tabu_list = deque()
+        self.tabu_set = set()
+        # Move number until which each (cell, orientation) is Tabu
+        self.tabu_until = np.zeros((self.size, self.size, 4), dtype=int)
+        self.moves = 0
 
     def set_exits(self, i, j):
         if self.wrap:
@@ -71,13 +111,81 @@ class Board:
             int(down != self.up[(i + 1) % self.exit_size, j])
         )
 
+    def compute_penalties(self):
+        """Penalty for every cell, computed from scratch"""
+        n = self.size
+        mismatches = (
+            (self.left != np.roll(self.right, 1, axis=1)).astype(int) +
+            (self.up != np.roll(self.down, 1, axis=0)) +
+            (self.right != np.roll(self.left, -1, axis=1)) +
+            (self.down != np.roll(self.up, -1, axis=0))
+        )
+        return mismatches[:n, :n]
+
     def penalties(self):
-        ret = np.zeros((self.size, self.size))
-        # TODO vectorise this
-        for i in range(self.size):
-            for j in range(self.size):
-                ret[i, j] = self.penalty(i, j, self.orientations[i, j])
-        return ret
+        return self.penalty_grid.copy()
+
+    def neighbourhood(self, i, j):
+        """The cell (i, j) and those of its neighbours which are on the board"""
+        for (ii, jj) in ((i, j), (i - 1, j), (i + 1, j), (i, j - 1), (i, j + 1)):
+            if self.wrap:
+                yield ii % self.size, jj % self.size
+            elif 0 <= ii < self.size and 0 <= jj < self.size:
+                yield ii, jj
+
+    def update_penalties(self, i, j):
+        for (ii, jj) in self.neighbourhood(i, j):
+            new_penalty = self.penalty(ii, jj, self.orientations[ii, jj])
+            self.error += new_penalty - self.penalty_grid[ii, jj]
+            self.penalty_grid[ii, jj] = new_penalty
+            if new_penalty and (ii, jj) not in self.conflicted_index:
+                self.add_conflicted(ii, jj)
+            elif not new_penalty and (ii, jj) in self.conflicted_index:
+                self.remove_conflicted(ii, jj)
+
+    def add_conflicted(self, i, j):
+        self.conflicted_index[(i, j)] = len(self.conflicted)
+        self.conflicted.append((i, j))
+
+    def remove_conflicted(self, i, j):
+        k = self.conflicted_index.pop((i, j))
+        last = self.conflicted.pop()
+        if last != (i, j):
+            self.conflicted[k] = last
+            self.conflicted_index[last] = k
+
+    def random_conflicted(self):
+        """A cell with non-zero penalty, chosen uniformly"""
+        return self.conflicted[int(self.rng.random() * len(self.conflicted))]
+
+    def weighted_conflicted(self):
+        """A cell chosen with probability proportional to its penalty"""
+        while True:
+            i, j = self.random_conflicted()
+            if self.rng.random() * 4 < self.penalty_grid[i, j]:
+                return i, j
+
+    def delta(self, i, j, new_orientation):
+        """Change in the total penalty if cell (i, j) were rotated to new_orientation"""
+        old_exits = self.exits(i, j, self.orientations[i, j])
+        new_exits = self.exits(i, j, new_orientation)
+        neighbour_exits = (
+            self.right[i, j - 1],
+            self.down[i - 1, j],
+            self.left[i, (j + 1) % self.exit_size],
+            self.up[(i + 1) % self.exit_size, j],
+        )
+        if self.wrap:
+            on_board = (True, True, True, True)
+        else:
+            on_board = (j > 0, i > 0, j < self.size - 1, i < self.size - 1)
+        change = 0
+        for d in range(4):
+            if old_exits[d] != new_exits[d]:
+                # A mismatch counts against the cells on both sides of it
+                weight = 2 if on_board[d] else 1
+                change += weight * (int(new_exits[d] != neighbour_exits[d]) - int(old_exits[d] != neighbour_exits[d]))
+        return change
 
     def __str__(self, orientations=None):
         if orientations is None:
@@ -87,55 +195,124 @@ class Board:
             for i in range(self.size)
         ])
 
-    def update(self, i, j, new_orientation):
+    def is_tabu(self, i, j, new_orientation):
+        if self.tabu_mode == 'move':
+            return self.tabu_until[i, j, new_orientation] > self.moves
         old_orientation = self.orientations[i, j]
+        new_hash = self.hash ^ self.zobrist[i][j][old_orientation] ^ self.zobrist[i][j][new_orientation]
+        return new_hash in self.tabu_set
+
+    def move(self, i, j, new_orientation):
+        """Rotate cell (i, j), updating exits, penalties and hash in O(1)"""
+        old_orientation = self.orientations[i, j]
+        self.hash ^= self.zobrist[i][j][old_orientation] ^ self.zobrist[i][j][new_orientation]
         self.orientations[i, j] = new_orientation
-        new_orientations = self.orientations.tolist()
-        if new_orientations in self.tabu_list:
-            self.orientations[i, j] = old_orientation
-            return
-        self.tabu_list.append(new_orientations)
-        if len(self.tabu_list) > self.tabu_length:
-            self.tabu_list.pop(0)
         self.set_exits(i, j)
         self.set_exits(i - 1, j)
         self.set_exits(i + 1, j)
         self.set_exits(i, j - 1)
         self.set_exits(i, j + 1)
+        self.update_penalties(i, j)
+
+    def update(self, i, j, new_orientation):
+        """Rotate cell (i, j), unless that's Tabu. Returns whether it moved."""
+        old_orientation = self.orientations[i, j]
+        if self.is_tabu(i, j, new_orientation):
+            return False
+        self.moves += 1
+        self.move(i, j, new_orientation)
+        if self.tabu_mode == 'move':
+            if new_orientation != old_orientation:
+                self.tabu_until[i, j, old_orientation] = self.moves + self.tabu_length
+        else:
+            self.tabu_list.append(self.hash)
+            self.tabu_set.add(self.hash)
+            if len(self.tabu_list) > self.tabu_length:
+                self.tabu_set.discard(self.tabu_list.popleft())
+        return True
 
+    def solve(self, steps=None, temperature=None, stop=None, hook=None):
+        """Tabu search for up to steps moves, or until the penalty reaches zero
 
-    def solve(self, steps=None):
-        count = 0
-        min_penalty, best_iteration = np.inf, 0
-        while True:
-            if count >= steps:
-                break
-            count += 1
-            penalties = np.reshape(self.penalties(), self.size ** 2)
-            error = np.sum(penalties)
-            if error < min_penalty:
-                min_penalty = error
-                best_iteration = count - 1
-                best_orientations = np.copy(self.orientations)
-            if error == 0:
-                # Finished!
-                break
-            index = np.random.choice(np.arange(self.size ** 2), p=(penalties / error))
-            i, j = divmod(index, self.size)
-            weights = np.array([1 / (1 + self.penalty(i, j, o)) for o in range(4)])
-            weights = weights / np.sum(weights)
-            new_orientation = np.random.choice(np.arange(4), p=weights)
-            self.update(i, j, new_orientation)
-        return count, min_penalty, best_iteration, best_orientations
+        The new orientation for a cell is chosen with weight 1 / (1 + penalty),
+        or exp(-penalty / temperature) if a temperature is given. stop is an
+        optional function which is checked every 100 steps, and ends the search
+        early if it returns True. See engines.py for the other search strategies
+        and for hook."""
+        return engines.TabuEngine(self, temperature=temperature, hook=hook).run(steps, stop)
+
+
+def test_penalties():
+    with open('board1') as f:
+        lines = f.readlines()
+    for wrap in (False, True):
+        board = Board(lines, wrap=wrap, tabu_length=0)
+        for _ in range(200):
+            i, j = np.random.randint(board.size, size=2)
+            board.update(i, j, np.random.randint(4))
+            expected = [
+                [board.penalty(i, j, board.orientations[i, j]) for j in range(board.size)]
+                for i in range(board.size)
+            ]
+            assert board.penalties().tolist() == expected
+            assert board.compute_penalties().tolist() == expected
+            assert board.error == np.sum(expected)
+
+
+def test_tabu():
+    with open('board1') as f:
+        lines = f.readlines()
+    board = Board(lines, tabu_length=2)
+    assert board.update(0, 0, 1)
+    assert board.update(0, 0, 2)
+    # Back to the configuration after the first move
+    assert not board.update(0, 0, 1)
+    # Back to the starting configuration, which isn't in the list
+    assert board.update(0, 0, 0)
+    # Now the first move has dropped out of the list
+    assert board.update(0, 0, 1)
+    expected_hash = 0
+    for i in range(board.size):
+        for j in range(board.size):
+            expected_hash ^= board.zobrist[i][j][board.orientations[i, j]]
+    assert board.hash == expected_hash
+
+    board = Board(lines, tabu_length=2, tabu_mode='move')
+    assert board.update(0, 0, 1)
+    assert not board.update(0, 0, 0)
+    assert board.update(1, 1, 1)
+    assert not board.update(0, 0, 0)
+    assert board.update(1, 1, 2)
+    assert board.update(0, 0, 0)
+
+
+def test_delta():
+    with open('board1') as f:
+        lines = f.readlines()
+    for wrap in (False, True):
+        board = Board(lines, wrap=wrap, tabu_length=0)
+        for _ in range(200):
+            i, j = np.random.randint(board.size, size=2)
+            o = np.random.randint(4)
+            before = board.error
+            delta = board.delta(i, j, o)
+            board.move(i, j, o)
+            assert board.error - before == delta
+            assert sorted(board.conflicted) == sorted(zip(*np.nonzero(board.penalty_grid)))
 
 
 if __name__ == '__main__':
-    board = Board([line for line in fileinput.input()], wrap=True)
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('files', nargs='*')
+    parser.add_argument('--stats', help="write statistics about the search to this file as JSON (see engines.Recorder)")
+    args = parser.parse_args()
+    board = Board([line for line in fileinput.input(args.files)], wrap=True)
     print(board)
     print(board.penalties())
     print(np.sum(board.penalties()))
     print()
-    count, best_score, best_iteration, best_board = board.solve(steps=50000)
+    recorder = None if args.stats is None else engines.Recorder()
+    count, best_score, best_iteration, best_board = board.solve(steps=50000, hook=recorder)
     print(f"After {count} steps:")
     print(board)
     print(board.penalties())
@@ -144,3 +321,6 @@ if __name__ == '__main__':
     print(f"Best configuration, after {best_iteration} steps:")
     print(best_score)
     print(board.__str__(orientations=best_board))
+    if recorder is not None:
+        with open(args.stats, 'w') as f:
+            json.dump(recorder.as_dict(), f, indent=2)
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+
+"""
+Solve Net puzzles exactly, using constraint propagation and backtracking
+
+Each cell has a domain of allowed orientations, stored as a 4-bit mask
+(orientations which give the same exits as a lower one are dropped up front).
+After every guess we propagate until nothing changes:
+
+ * arc consistency: the exit from a cell in each direction must agree with the
+   exit from its neighbour in the opposite direction (and, on a board which
+   doesn't wrap, there can be no exits off the edge);
+ * no loops: a union-find over the connections which are certain finds any
+   cycle, and rules out undecided connections within a single component;
+ * connectivity: a component with no undecided connections left to the rest of
+   the board means the board can't be completed.
+
+Then we guess an orientation for the cell with the fewest left. Unlike the Tabu
+search in net.py, this always finds a solution if there is one, and proves
+that there isn't if there isn't.
+"""
+
+import argparse
+import fileinput
+
+import numpy as np
+
+from net import Board, rotate, shapes
+
+
+def opposite(d):
+    return (d + 2) % 4
+
+
+def orientations(mask):
+    return [o for o in range(4) if mask >> o & 1]
+
+
+class Solver:
+    def __init__(self, lines, wrap=False):
+        self.pieces = [line.rstrip('\n') for line in lines]
+        self.size = len(self.pieces)
+        self.wrap = wrap
+        size = self.size
+        self.cells = size * size
+        self.initial = []
+        # with_exit[cell][d] is the mask of orientations with an exit in direction d
+        self.with_exit = []
+        for i in range(size):
+            for j in range(size):
+                shape = shapes[self.pieces[i][j]]
+                seen = set()
+                mask = 0
+                for o in range(4):
+                    exits = rotate(shape, o)
+                    if exits not in seen:
+                        seen.add(exits)
+                        mask |= 1 << o
+                self.with_exit.append([
+                    sum(1 << o for o in range(4) if rotate(shape, o)[d])
+                    for d in range(4)
+                ])
+                if not wrap:
+                    # No exits off the edge of the board
+                    for d, off_edge in enumerate((j == 0, i == 0, j == size - 1, i == size - 1)):
+                        if off_edge:
+                            mask &= ~self.with_exit[-1][d]
+                self.initial.append(mask)
+        # (a, d, b): cell b is next to cell a in direction d (right or down)
+        self.edges = []
+        for i in range(size):
+            for j in range(size):
+                for d, (ii, jj) in ((2, (i, j + 1)), (3, (i + 1, j))):
+                    if wrap:
+                        ii, jj = ii % size, jj % size
+                    elif ii >= size or jj >= size:
+                        continue
+                    self.edges.append((i * size + j, d, ii * size + jj))
+
+    def propagate(self, domains):
+        """Prune domains in place until nothing changes. Returns False on a conflict."""
+        while True:
+            if not self.arc_consistency(domains):
+                return False
+            result = self.check_components(domains)
+            if result is None:
+                return False
+            if not result:
+                return True
+
+    def arc_consistency(self, domains):
+        changed = True
+        while changed:
+            changed = False
+            for (a, d, b) in self.edges:
+                da, db = domains[a], domains[b]
+                wa, wb = self.with_exit[a][d], self.with_exit[b][opposite(d)]
+                a_yes, a_no = da & wa, da & ~wa
+                b_yes, b_no = db & wb, db & ~wb
+                new_a = (a_yes if b_yes else 0) | (a_no if b_no else 0)
+                new_b = (b_yes if a_yes else 0) | (b_no if a_no else 0)
+                if not new_a or not new_b:
+                    return False
+                if new_a != da or new_b != db:
+                    domains[a], domains[b] = new_a, new_b
+                    changed = True
+        return True
+
+    def check_components(self, domains):
+        """Look for loops and closed-off components
+
+        Returns None on a conflict, and otherwise whether any domain changed."""
+        parent = list(range(self.cells))
+
+        def find(x):
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        undecided = []
+        for (a, d, b) in self.edges:
+            connected = domains[a] & self.with_exit[a][d]
+            if connected == domains[a]:
+                ra, rb = find(a), find(b)
+                if ra == rb:
+                    # Closes a loop
+                    return None
+                parent[ra] = rb
+            elif connected:
+                undecided.append((a, d, b))
+        changed = False
+        open_components = set()
+        for (a, d, b) in undecided:
+            ra, rb = find(a), find(b)
+            if ra == rb:
+                # Connecting these would close a loop
+                domains[a] &= ~self.with_exit[a][d]
+                domains[b] &= ~self.with_exit[b][opposite(d)]
+                changed = True
+            else:
+                open_components.add(ra)
+                open_components.add(rb)
+        if not changed:
+            components = {find(x) for x in range(self.cells)}
+            if len(components) > 1 and components - open_components:
+                return None
+        return changed
+
+    def solutions(self):
+        """Yield every solution, as an array of orientations"""
+        domains = list(self.initial)
+        if self.propagate(domains):
+            yield from self.search(domains)
+
+    def search(self, domains):
+        best, best_count = None, 5
+        for cell, mask in enumerate(domains):
+            count = mask.bit_count()
+            if 1 < count < best_count:
+                best, best_count = cell, count
+        if best is None:
+            yield np.array(
+                [orientations(mask)[0] for mask in domains]
+            ).reshape(self.size, self.size)
+            return
+        for o in orientations(domains[best]):
+            guess = list(domains)
+            guess[best] = 1 << o
+            if self.propagate(guess):
+                yield from self.search(guess)
+
+
+def solve(lines, wrap=False):
+    """Return the orientations for a solution, or None if there isn't one"""
+    return next(Solver(lines, wrap).solutions(), None)
+
+
+def count_solutions(lines, wrap=False, limit=None):
+    count = 0
+    for _ in Solver(lines, wrap).solutions():
+        count += 1
+        if limit is not None and count >= limit:
+            break
+    return count
+
+
+def test_solve():
+    lines = ['QQL', 'LIT', 'QIL']
+    assert count_solutions(lines) == 1
+    orientations = solve(lines)
+    board = Board(lines, tabu_length=0)
+    for i in range(board.size):
+        for j in range(board.size):
+            board.update(i, j, orientations[i, j])
+    assert board.error == 0
+    assert solve(['QQQ', 'QQQ', 'QQQ']) is None
+
+
+def test_unsolvable():
+    # Tabu search can get board1 down to zero penalty, but only with a loop
+    with open('board1') as f:
+        lines = f.readlines()
+    assert solve(lines, wrap=True) is None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('files', nargs='*')
+    parser.add_argument('--no-wrap', dest='wrap', action='store_false')
+    args = parser.parse_args()
+    lines = [line for line in fileinput.input(args.files)]
+    orientations = solve(lines, args.wrap)
+    if orientations is None:
+        print("No solution")
+    else:
+        print(Board(lines, wrap=args.wrap).__str__(orientations=orientations))
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+
+"""
+Solve Net puzzles by running many independent Tabu searches in parallel
+
+Each worker process gets its own np.random.Generator, seeded from a single
+SeedSequence so that runs are reproducible, and optionally its own Tabu tenure
+and temperature. The first worker to reach zero penalty tells the others to
+stop, and every worker reports its statistics back.
+"""
+
+import argparse
+import fileinput
+import json
+import multiprocessing
+import queue
+import time
+
+import numpy as np
+
+from engines import Recorder
+from net import Board
+
+
+def worker(k, lines, wrap, steps, seed, tabu_length, temperature, stop, results, record=False):
+    start = time.time()
+    # Whatever happens, post a result so that solve isn't left waiting
+    stats = {
+        'search': None,
+        'worker': k,
+        'tabu_length': tabu_length,
+        'temperature': temperature,
+        'steps': 0,
+        'best_score': None,
+        'best_iteration': None,
+        'orientations': None,
+    }
+    try:
+        board = Board(lines, wrap=wrap, tabu_length=tabu_length, rng=np.random.default_rng(seed))
+        recorder = Recorder() if record else None
+        count, best_score, best_iteration, best_board = board.solve(
+            steps=steps, temperature=temperature, stop=stop.is_set, hook=recorder)
+        if best_score == 0:
+            stop.set()
+        stats.update({
+            'search': None if recorder is None else recorder.as_dict(),
+            'steps': count,
+            # No score if another worker had already finished before the first step
+            'best_score': None if count == 0 else int(best_score),
+            'best_iteration': None if count == 0 else best_iteration,
+            'orientations': best_board.tolist(),
+        })
+    finally:
+        stats['seconds'] = time.time() - start
+        results.put(stats)
+
+
+def solve(lines, wrap=False, workers=None, steps=50000, seed=0, tabu_lengths=None, temperatures=None,
+          record=False):
+    """Run a portfolio of searches, returning (best orientations, stats per worker)
+
+    tabu_lengths and temperatures, if given, are cycled through to give each
+    worker its parameters. If record is set, each worker's stats include
+    'search', the statistics from an engines.Recorder."""
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if tabu_lengths is None:
+        tabu_lengths = [20]
+    if temperatures is None:
+        temperatures = [None]
+    seeds = np.random.SeedSequence(seed).spawn(workers)
+    stop = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=worker, args=(
+            k, lines, wrap, steps, seeds[k],
+            tabu_lengths[k % len(tabu_lengths)], temperatures[k % len(temperatures)],
+            stop, results, record,
+        ))
+        for k in range(workers)
+    ]
+    for p in processes:
+        p.start()
+    stats = []
+    while len(stats) < workers:
+        try:
+            stats.append(results.get(timeout=1))
+        except queue.Empty:
+            # A worker killed from outside never posts its result
+            if not any(p.is_alive() for p in processes) and results.empty():
+                break
+    for p in processes:
+        p.join(timeout=10)
+        if p.is_alive():
+            p.terminate()
+    stats.sort(key=lambda s: s['worker'])
+    scored = [s for s in stats if s['best_score'] is not None]
+    if not scored:
+        raise RuntimeError("No worker finished a search")
+    best = min(scored, key=lambda s: (s['best_score'], s['seconds']))
+    return np.array(best['orientations']), stats
+
+
+def test_solve():
+    with open('board1') as f:
+        lines = f.readlines()
+    orientations, stats = solve(lines, wrap=True, workers=2, steps=20000)
+    assert len(stats) == 2
+    assert min(s['best_score'] for s in stats if s['best_score'] is not None) == 0
+    board = Board(lines, wrap=True)
+    for i in range(board.size):
+        for j in range(board.size):
+            board.update(i, j, orientations[i, j])
+    assert board.error == 0
+
+
+def test_many_workers():
+    # Most of these start after the first has already solved it
+    with open('board1') as f:
+        lines = f.readlines()
+    orientations, stats = solve(lines, wrap=True, workers=16, steps=20000)
+    assert len(stats) == 16
+    assert min(s['best_score'] for s in stats if s['best_score'] is not None) == 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('files', nargs='*')
+    parser.add_argument('--no-wrap', dest='wrap', action='store_false')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--steps', type=int, default=50000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--tabu-lengths', type=int, nargs='+')
+    parser.add_argument('--temperatures', type=float, nargs='+')
+    parser.add_argument('--stats', help="write each worker's statistics to this file as JSON")
+    args = parser.parse_args()
+    lines = [line for line in fileinput.input(args.files)]
+    orientations, stats = solve(lines, args.wrap, args.workers, args.steps, args.seed,
+                                args.tabu_lengths, args.temperatures, record=args.stats is not None)
+    for s in stats:
+        print(f"Worker {s['worker']}: best score {s['best_score']} after {s['best_iteration']} of "
+              f"{s['steps']} steps in {s['seconds']:.2f}s "
+              f"(tabu length {s['tabu_length']}, temperature {s['temperature']})")
+    print()
+    print(Board(lines, wrap=args.wrap).__str__(orientations=orientations))
+    if args.stats is not None:
+        with open(args.stats, 'w') as f:
+            json.dump([{k: v for k, v in s.items() if k != 'orientations'} for s in stats], f, indent=2)
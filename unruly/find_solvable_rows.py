@@ -13,9 +13,14 @@ the size of the search space.
 from collections import defaultdict, Counter
 import sys
 
+import numpy as np
+
 from minizinc import Instance, Model, Solver
 
+import symmetry
 import unruly
+from unruly import BLACK, WHITE, UNKNOWN
+from unruly_numpy import propagate_batch, STUCK
 
 
 # 0 = black, 1 = white, 2 = unknown
@@ -40,45 +45,63 @@ def get_fixpoints(n):
     fixpoints = instance.solve(all_solutions=True)
     indices = {'BLACK': 0, 'WHITE': 1, 'UNKNOWN': 2}
     masks = [[indices[c] for c in f.row] for f in fixpoints]
-    fixed = [unruly.propagate([mask]) for mask in masks]
-    deduped = {unruly.board_to_str(f): f[0] for f in fixed if unruly.UNKNOWN in f[0]}
+    fixed, status = propagate_batch([[mask] for mask in masks])
+    deduped = {
+        unruly.board_to_str(f): f[0].tolist()
+        for f, s in zip(fixed, status) if s == STUCK
+    }
     return list(deduped.values())
 
 
-def filter_by_bit(all_solutions):
-    all_indices = set(range(len(all_solutions)))
-    by_bit = [(set(), set(), all_indices)  for i in range(2 * n)]
-    for i, solution in enumerate(all_solutions):
-        for j in range(2 * n):
-            by_bit[j][solution.row[j]].add(i)
-    return by_bit
+def solution_rows(all_solutions):
+    """The solutions from unruly_row.mzn, as an (S, 2n) array of colours"""
+    return np.array([solution.row for solution in all_solutions], dtype=np.uint8)
+
+
+def index_by_bit(rows, n):
+    """Packed bitsets of the solutions, by square and colour
+
+    index[j, c] is an array of 64-bit words with bit i set if solution i has
+    colour c at square j (or for every solution, if c is UNKNOWN)."""
+    count = len(rows)
+    words = (count + 63) // 64
+    index = np.zeros((2 * n, 3, 64 * words), dtype=bool)
+    index[:, BLACK, :count] = (rows == BLACK).T
+    index[:, WHITE, :count] = (rows == WHITE).T
+    index[:, UNKNOWN, :count] = True
+    return np.packbits(index, axis=-1, bitorder='little').view(np.uint64)
 
 
-def solve_masks(masks, all_solutions):
-    all_indices = set(range(len(all_solutions)))
-    by_bit = filter_by_bit(all_solutions)
-    solutions = {}
-    for mask in masks:
-        matches = set(all_indices)
-        for b in range(2 * n):
-            matches &= by_bit[b][mask[b]]
-        solutions[mask_to_str(mask)] = matches
-    return solutions
+def solve_masks(masks, rows, n, chunk=4096):
+    """Count the solutions which match each mask, as an array
 
+    The bitsets for each square of every mask in a chunk are ANDed together at
+    once. Masks are first reduced to one per family of symmetric masks (see
+    symmetry.line_keys), since symmetric masks match the same number of
+    solutions."""
+    masks = np.asarray(masks, dtype=np.uint8).reshape(-1, 2 * n)
+    index = index_by_bit(rows, n)
+    keys, representatives, inverse = np.unique(
+        symmetry.line_keys(masks), return_index=True, return_inverse=True)
+    unique_masks = masks[representatives]
+    counts = np.zeros(len(unique_masks), dtype=np.int64)
+    squares = np.arange(2 * n)
+    for start in range(0, len(unique_masks), chunk):
+        block = unique_masks[start:start + chunk]
+        # (masks, squares, words) -> (masks, words)
+        matches = np.bitwise_and.reduce(index[squares, block], axis=1)
+        counts[start:start + chunk] = np.unpackbits(matches.view(np.uint8), axis=-1).sum(axis=-1)
+    return counts[inverse.reshape(-1)]
 
-def get_counts(solutions):
-    counts = Counter()
-    for (mask, matches) in solutions.items():
-        counts[len(matches)] += 1
-    return counts
 
+def get_counts(counts):
+    """How many masks match each number of solutions"""
+    return Counter(counts.tolist())
 
-def get_solvable(solutions):
-    solvable = []
-    for (mask, matches) in solutions.items():
-        if len(matches) == 1:
-            solvable.append(mask)
-    return solvable
+
+def get_solvable(masks, counts):
+    """The masks which match exactly one solution"""
+    return [mask_to_str(mask) for mask, count in zip(masks, counts) if count == 1]
 
 
 def get_boards(n, fixpoints):
@@ -105,15 +128,28 @@ def main(n):
     print(f"% Total number of solutions: {len(all_solutions)}")
     fixpoints = get_fixpoints(n)
     print(f"% Total number of fixpoints: {len(fixpoints)}")
-    solutions = solve_masks(fixpoints, all_solutions)
-    print("% ", get_counts(solutions))
-    solvable = get_solvable(solutions)
+    counts = solve_masks(fixpoints, solution_rows(all_solutions), n)
+    print("% ", get_counts(counts))
+    solvable = get_solvable(fixpoints, counts)
     print(f"% Total number of uniquely-solvable fixpoints: {len(solvable)}")
     output_as_minizinc(n, solvable)
     # board = get_boards(n, solvable)
     # print(board)
 
 
+def test_solve_masks():
+    import itertools
+    import line_tables
+    n = 3
+    rows = np.array([[int(row) >> j & 1 for j in range(2 * n)] for row in line_tables.valid_rows(n)])
+    masks = list(itertools.product(range(3), repeat=2 * n))
+    counts = solve_masks(masks, rows, n, chunk=100)
+    for mask, count in zip(masks, counts):
+        expected = sum(all(m in (UNKNOWN, c) for m, c in zip(mask, row)) for row in rows)
+        assert count == expected, mask
+    assert get_counts(counts)[len(rows)] == 1
+    assert get_solvable([(2, 2, 0, 0, 2, 2)], [1]) == ["__BB__"]
+
+
 if __name__ == '__main__':
-    n = int(sys.argv[1])
-    main(n)
+    main(int(sys.argv[1]))
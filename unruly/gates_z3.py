@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+
+"""
+Search for the gate tiles of sat_gates.py with Z3
+
+Z3 chooses the border every tile shares (sat_gates.SIDE), and for each tile
+which inner squares are unknown and the colours of the rest. For each
+combination of port colours that a tile's kind should allow, Z3 also has to
+find a completion of the tile with those colours, so every candidate allows at
+least the right combinations. To make sure it allows no others, Z3 also has to
+prove it, by the deductions a solver makes from the rule against three in a
+row (two squares of a line of three the same colour make the third the other
+colour), up to ROUNDS squares deep:
+
+ * for a wire, copy or not tile, each colour of its first port has to force
+   the colours of the others
+ * for a clause tile, the combination it forbids has to lead to some square
+   being forced both ways
+
+A deduction holds for every completion, so the candidate has exactly the
+relation of its kind. sat_gates.check_tile checks that again by trying every
+completion, along with the ports (which work because of the border and the
+rungs, not anything Z3 has to prove).
+
+For a clause tile, Z3 also chooses which combination to forbid, and for a wire
+which ports are opposite colours. Only the tiles which aren't turned copies of
+others (sat_gates.ROTATIONS) are searched for, all at once since they share the
+border. The tiles under gates/tiles/ came from
+
+  gates_z3.py
+
+Before writing the tiles out, this fills in every unknown square which doesn't
+need to be unknown (fill_in), so that only the squares which carry the signal
+are left.
+"""
+
+import argparse
+import itertools
+from pathlib import Path
+
+from z3 import And, Bool, BoolVal, If, Implies, Not, Or, PbLe, Solver, Xor, is_true, sat
+
+import instrument
+import sat_gates
+import unruly
+from sat_gates import FACING, PORTS, PORT_INDEX, RUNGS, RUNGS_FACING, SIZE
+from unruly import BLACK, WHITE, UNKNOWN
+
+INNER = [(i, j) for i in range(1, SIZE - 1) for j in range(1, SIZE - 1)]
+ROUNDS = 16
+
+# The tiles to search for; the rest are turned copies of them
+CANONICAL = [name for name in sat_gates.KINDS if name not in sat_gates.ROTATIONS]
+
+
+def allowed(kind, n, prefix):
+    """[(guard, port colours)] for the combinations a tile of this kind must
+    allow, as Z3 expressions over n choice variables"""
+    choice = [Bool(f"{prefix}_choice_{k}") for k in range(n)]
+    if kind in ('wire', 'copy', 'not'):
+        rest = choice[1:]
+        if kind != 'wire':
+            rest = [BoolVal(kind == 'not')]
+        return [(BoolVal(True), [BoolVal(False)] + rest), (BoolVal(True), [BoolVal(True)] + [Not(x) for x in rest])]
+    combinations = [[BoolVal(c) for c in t] for t in itertools.product((False, True), repeat=n)]
+    if kind == 'clause':
+        return [(Or([x != c for x, c in zip(choice, t)]), t) for t in combinations]
+    return [(BoolVal(True), t) for t in combinations]
+
+
+def empty_tile(ports, side):
+    """A tile with the border and every inner square unknown"""
+    tile = [[UNKNOWN if 0 < i < SIZE - 1 and 0 < j < SIZE - 1 else sat_gates.ring_colour(i, j, side)
+             for j in range(SIZE)] for i in range(SIZE)]
+    for p in ports:
+        for (i, j) in PORTS[p]:
+            tile[i][j] = UNKNOWN
+    return tile
+
+
+class Search:
+    """The Z3 variables and rules for one tile"""
+
+    def __init__(self, name, solver, side, max_unknowns, rounds=ROUNDS):
+        self.name = name
+        self.ports = sat_gates.ports_of(name)
+        self.side = side
+        self.solver = solver
+        self.unknown = {square: Bool(f"{name}_unknown_{square}") for square in INNER}
+        self.white = {square: Bool(f"{name}_white_{square}") for square in INNER}
+        solver.add(PbLe([(x, 1) for x in self.unknown.values()], max_unknowns))
+        for p in self.ports:
+            (a, b) = RUNGS[p]
+            solver.add(Not(self.unknown[a]), Not(self.unknown[b]), self.white[a] == self.white[b])
+        # The neighbours' rungs don't matter once the ports flip, so the
+        # completions and deductions leave them out
+        behind = {square for p in self.ports for square in RUNGS_FACING[p]}
+        border = sat_gates.surround(empty_tile(self.ports, sat_gates.SIDE), self.ports)
+        self.border = [square for square in border if square not in behind]
+        self.facing = {f: s for p in self.ports for f, s in zip(FACING[p], PORTS[p])}
+        self.triples = list(sat_gates.triples(dict.fromkeys(self.border)))
+        self.combinations = allowed(sat_gates.KINDS[name], len(self.ports), name)
+        for k, (guard, colours) in enumerate(self.combinations):
+            square = {}
+            for (i, j) in self.border:
+                if (i, j) in self.facing:
+                    continue
+                if (i, j) in self.unknown or border[(i, j)] == UNKNOWN:
+                    square[(i, j)] = Bool(f"{name}_completion_{k}_{i}_{j}")
+                else:
+                    square[(i, j)] = self.ring(i, j)
+            for f, s in self.facing.items():
+                square[f] = Not(square[s])
+            rules = [Or(self.unknown[s], square[s] == self.white[s]) for s in INNER]
+            for triple in self.triples:
+                x = [square[t] for t in triple]
+                rules += [Or(x), Not(And(x))]
+            for p, colour in zip(self.ports, colours):
+                rules.append(square[PORTS[p][0]] == colour)
+            solver.add(Implies(guard, And(rules)))
+
+        kind = sat_gates.KINDS[name]
+        signals = [PORTS[p][0] for p in self.ports]
+        if kind in ('wire', 'copy', 'not'):
+            for colour in (False, True):
+                white, black = self.deduce({signals[0]: BoolVal(colour)}, f"{colour}", rounds)
+                for guard, colours in self.combinations:
+                    forced = [If(c, white[s], black[s]) for s, c in zip(signals[1:], colours[1:])]
+                    solver.add(Implies(colours[0] == colour, And(forced)))
+        elif kind == 'clause':
+            choice = [Bool(f"{name}_choice_{k}") for k in range(len(self.ports))]
+            white, black = self.deduce(dict(zip(signals, choice)), 'clause', rounds)
+            solver.add(Or([And(white[s], black[s]) for s in white] +
+                          [And([white[t] for t in triple]) for triple in self.triples] +
+                          [And([black[t] for t in triple]) for triple in self.triples]))
+
+    def ring(self, i, j):
+        return self.side[sat_gates.ring_index(i, j)[1]]
+
+    def deduce(self, start, tag, rounds):
+        """({square: forced white}, {square: forced black}) after some rounds
+        of deductions, starting from some port signals"""
+        ports = {s for p in self.ports for s in PORTS[p]}
+        free = [s for s in self.border if s in self.unknown or s in self.facing or s in ports]
+        white = {s: BoolVal(False) for s in free}
+        black = {s: BoolVal(False) for s in free}
+        for s, x in start.items():
+            white[s], black[s] = x, Not(x)
+
+        def colours():
+            w, b = {}, {}
+            for s in self.border:
+                if s in self.unknown:
+                    w[s] = Or(white[s], And(Not(self.unknown[s]), self.white[s]))
+                    b[s] = Or(black[s], And(Not(self.unknown[s]), Not(self.white[s])))
+                elif s in white:
+                    w[s], b[s] = white[s], black[s]
+                else:
+                    w[s], b[s] = self.ring(*s), Not(self.ring(*s))
+            return w, b
+
+        lines = {s: [] for s in free}
+        for triple in self.triples:
+            for s in triple:
+                if s in lines:
+                    lines[s].append([t for t in triple if t != s])
+        flipped = dict(self.facing)
+        flipped.update({s: f for f, s in self.facing.items()})
+        for k in range(rounds):
+            w, b = colours()
+            new_white, new_black = {}, {}
+            for s in free:
+                new_white[s] = Bool(f"{self.name}_{tag}_white_{k}_{s}")
+                new_black[s] = Bool(f"{self.name}_{tag}_black_{k}_{s}")
+                because_white = [white[s]] + [And([b[t] for t in others]) for others in lines[s]]
+                because_black = [black[s]] + [And([w[t] for t in others]) for others in lines[s]]
+                if s in flipped:
+                    because_white.append(black[flipped[s]])
+                    because_black.append(white[flipped[s]])
+                self.solver.add(new_white[s] == Or(because_white), new_black[s] == Or(because_black))
+            white, black = new_white, new_black
+        return colours()
+
+def find_tiles(names, side=None, max_unknowns=32, rounds=ROUNDS, timeout=None, stats=None):
+    """(side, {name: tile}) for tiles with the relations of their kinds and a
+    shared border, or None if Z3 finds there are no such tiles with at most
+    max_unknowns unknown inner squares each (or runs out of time)
+
+    Given the border, the tiles don't depend on each other, and Z3 is much
+    quicker at finding them one at a time."""
+    if side is not None and len(names) > 1:
+        tiles = {}
+        for name in names:
+            found = find_tiles([name], side, max_unknowns, rounds, timeout, stats)
+            if found is None:
+                return None
+            tiles.update(found[1])
+        return side, tiles
+    s = Solver()
+    if timeout is not None:
+        s.set('timeout', int(timeout * 1000))
+    side_vars = [Bool(f"side_{k}") for k in range(SIZE - 1)]
+    # The squares either side of a port differ, so a port's squares do too
+    s.add(Xor(side_vars[PORT_INDEX - 1], side_vars[PORT_INDEX + 2]))
+    if side is not None:
+        s.add([x == (c == 'W') for x, c in zip(side_vars, side)])
+    searches = [Search(name, s, side_vars, max_unknowns, rounds) for name in names]
+    if instrument.timed(stats, 'check tiles', s.check) != sat:
+        return None
+    m = s.model()
+    side = "".join('W' if is_true(m.eval(x, model_completion=True)) else 'B' for x in side_vars)
+    tiles = {}
+    for search in searches:
+        tile = empty_tile(search.ports, side)
+        for (i, j) in INNER:
+            if not is_true(m.eval(search.unknown[(i, j)], model_completion=True)):
+                tile[i][j] = WHITE if is_true(m.eval(search.white[(i, j)], model_completion=True)) else BLACK
+        tiles[search.name] = tile
+    return side, tiles
+
+
+def fill_in(name, tile, side=sat_gates.SIDE):
+    """Fill in every unknown inner square of a tile which can be filled in
+    without changing its relation, so that only the squares which carry the
+    signal are left unknown"""
+    tile = [row[:] for row in tile]
+    found = sat_gates.check_tile(name, tile, side)
+    for (i, j) in INNER:
+        if tile[i][j] != UNKNOWN:
+            continue
+        for c in (BLACK, WHITE):
+            tile[i][j] = c
+            try:
+                if sat_gates.check_tile(name, tile, side) == found:
+                    break
+            except ValueError:
+                pass
+        else:
+            tile[i][j] = UNKNOWN
+    return tile
+
+
+def test_find_tiles():
+    side, tiles = find_tiles(['blank', 'T_end', 'TB'], side=sat_gates.SIDE, timeout=60)
+    assert side == sat_gates.SIDE
+    for name, tile in tiles.items():
+        found = sat_gates.check_tile(name, tile)
+        assert sat_gates.check_tile(name, fill_in(name, tile)) == found
+    assert not any(UNKNOWN in row for row in fill_in('blank', tiles['blank']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('names', nargs='*', default=CANONICAL, choices=CANONICAL)
+    parser.add_argument('--side', help="the border to use, instead of letting Z3 choose one")
+    parser.add_argument('--max-unknowns', type=int, default=32, help="most unknown inner squares to allow")
+    parser.add_argument('--rounds', type=int, default=ROUNDS, help="how deep the deductions go")
+    parser.add_argument('--timeout', type=float, help="seconds to search for")
+    parser.add_argument('--tiles', type=Path, default=sat_gates.TILE_DIR, help="directory to write the tiles to")
+    args = parser.parse_args()
+    found = find_tiles(args.names, args.side, args.max_unknowns, args.rounds, args.timeout)
+    if found is None:
+        raise SystemExit("No tiles found")
+    side, tiles = found
+    print(f"SIDE = {side!r}")
+    tiles = {name: fill_in(name, tile, side) for name, tile in tiles.items()}
+    for name in sat_gates.KINDS:
+        if name in tiles or sat_gates.ROTATIONS.get(name, (None,))[0] in tiles:
+            tile = sat_gates.rotated(name, tiles)
+            sat_gates.write_tile(name, tile, args.tiles)
+            print(f"{name}:\n{unruly.board_to_str(tile)}")
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+
+"""
+Generate random Unruly puzzles in pure Python, without Z3 or MiniZinc
+
+First a random complete grid: a depth-first search like the one in
+unruly_search.py, trying the two colours in a random order at each guess, with
+whole-line reasoning from line_tables.py after each one. Then clues are removed
+in a random order, keeping each removal only if the puzzle still suits the
+target:
+
+ * any: the solution is still unique. Since the puzzle had a unique solution
+   before, that's the same as there being no solution with the removed square
+   the other colour, which the propagator usually rules out straight away.
+ * tactical: the four tactics from unruly.py still solve it (which also means
+   the solution is unique)
+ * needs-more: the solution is still unique, and at the end the tactics can't
+   solve the puzzle. Removing clues never helps the tactics, so this is
+   checked once, on the minimal puzzle, and if the tactics do solve it we start
+   again from a new grid.
+
+The tactics are applied with unruly_bitboard.propagate, which fills in the same
+squares as unruly.propagate, faster. Every puzzle comes from its own seeded
+random generator, so a given seed and index always give the same puzzle:
+
+  generate.py 10 --count 100 --seed 1 --target needs-more --workers 4
+
+writes 100 10x10 puzzles, separated by blank lines, in the format
+unruly_batch.py and grade.py read.
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import random
+
+import line_tables
+import lookahead
+import unruly
+import unruly_bitboard
+import unruly_search
+from unruly import BLACK, WHITE, UNKNOWN
+from unruly_bitboard import Propagator
+
+TARGETS = ('any', 'tactical', 'needs-more')
+
+
+def random_grid(size, rng, updates=line_tables.line_updates):
+    """A random complete size x size grid, from a random.Random"""
+    p = Propagator(size, size, updates)
+
+    def search():
+        square = unruly_search.choose_square(p)
+        if square is None:
+            return True
+        colours = [BLACK, WHITE]
+        rng.shuffle(colours)
+        for c in colours:
+            try:
+                p.assign(*square, c)
+            except ValueError:
+                p.retract()
+                continue
+            if search():
+                return True
+            p.retract()
+        return False
+
+    search()
+    return p.to_board()
+
+
+def still_unique(board, i, j, value, updates=line_tables.line_updates):
+    """Whether a board with a unique solution, in which square (i, j) was
+    value, still has one now that square (i, j) is unknown"""
+    board[i][j] = unruly.other(value)
+    try:
+        return unruly_search.count_solutions(board, limit=1, updates=updates) == 0
+    finally:
+        board[i][j] = UNKNOWN
+
+
+def tactics_solve(board):
+    result = [row[:] for row in board]
+    try:
+        unruly_bitboard.propagate(result)
+    except ValueError:
+        return False
+    return not any(UNKNOWN in row for row in result)
+
+
+def remove_clues(solution, rng, target='any'):
+    """Remove clues from a complete grid in a random order, for as long as the
+    puzzle still suits the target (see above)"""
+    size = len(solution)
+    board = [row[:] for row in solution]
+    squares = [(i, j) for i in range(size) for j in range(size)]
+    rng.shuffle(squares)
+    for (i, j) in squares:
+        value = board[i][j]
+        board[i][j] = UNKNOWN
+        if target == 'tactical':
+            keep = not tactics_solve(board)
+        else:
+            keep = not still_unique(board, i, j, value)
+        if keep:
+            board[i][j] = value
+    return board
+
+
+def random_puzzle(size, rng, target='any', attempts=1000):
+    """A random puzzle with a unique solution, and the solution
+
+    For the needs-more target, gives up with a ValueError after attempts
+    grids whose minimal puzzles the tactics can all solve."""
+    if target not in TARGETS:
+        raise ValueError(f"Unknown target {target}")
+    for _ in range(attempts):
+        solution = random_grid(size, rng)
+        board = remove_clues(solution, rng, target)
+        if target != 'needs-more' or not tactics_solve(board):
+            return board, solution
+    raise ValueError(f"No {size}x{size} puzzle which needs more than the tactics after {attempts} attempts")
+
+
+def nth_puzzle(size, seed, k, target='any', classify=False):
+    """Puzzle k of the sequence for this seed, and its solution, followed by
+    lookahead.classify of the puzzle if classify is set"""
+    board, solution = random_puzzle(size, random.Random(f"{size} {seed} {k}"), target)
+    if classify:
+        return board, solution, lookahead.classify(board)
+    return board, solution
+
+
+def puzzles(size, count=None, seed=0, target='any', workers=1, classify=False):
+    """Yield (puzzle, solution) pairs, or (puzzle, solution, kind) triples if
+    classify is set, forever if count is None. The workers classify the
+    puzzles too."""
+    indices = itertools.count() if count is None else range(count)
+    if workers <= 1:
+        for k in indices:
+            yield nth_puzzle(size, seed, k, target, classify)
+        return
+    with multiprocessing.Pool(workers) as pool:
+        yield from pool.imap(_nth_puzzle, ((size, seed, k, target, classify) for k in indices), chunksize=4)
+
+
+def _nth_puzzle(args):
+    return nth_puzzle(*args)
+
+
+def test_random_puzzle():
+    for size in (6, 8, 10):
+        for target in ('any', 'tactical'):
+            board, solution = nth_puzzle(size, 0, 0, target)
+            assert unruly_search.count_solutions(board, limit=2) == 1
+            assert unruly_search.solve_board(board) == solution
+            # Minimal: no clue can go without losing uniqueness (or the tactics)
+            for i, j in itertools.product(range(size), repeat=2):
+                if board[i][j] != UNKNOWN:
+                    smaller = [row[:] for row in board]
+                    smaller[i][j] = UNKNOWN
+                    if target == 'any':
+                        assert unruly_search.count_solutions(smaller, limit=2) == 2
+                    else:
+                        assert not tactics_solve(smaller)
+            assert tactics_solve(board) or target == 'any'
+    board, solution = nth_puzzle(10, 0, 0, 'needs-more')
+    assert unruly_search.count_solutions(board, limit=2) == 1
+    assert unruly.propagate([row[:] for row in board]) != solution
+    assert list(puzzles(6, 3, seed=1, workers=2)) == list(puzzles(6, 3, seed=1))
+    classified = list(puzzles(6, 3, seed=1, workers=2, classify=True))
+    assert [(board, solution) for board, solution, _ in classified] == list(puzzles(6, 3, seed=1))
+    assert all(kind == lookahead.classify(board) for board, _, kind in classified)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('size', type=int, help="width and height of the board (even)")
+    parser.add_argument('--count', type=int, help="number of puzzles (default: carry on forever)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--target', choices=TARGETS, default='any')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--json', action='store_true',
+                        help="write JSON lines with the puzzle, the solution and lookahead.classify of the puzzle")
+    args = parser.parse_args()
+    if args.size % 2:
+        parser.error("Unruly boards have an even size")
+    results = puzzles(args.size, args.count, args.seed, args.target, args.workers, classify=args.json)
+    for k, (board, solution, *kind) in enumerate(results):
+        if args.json:
+            print(json.dumps(dict(board=unruly.board_to_str(board), solution=unruly.board_to_str(solution),
+                                  kind=kind[0])), flush=True)
+        else:
+            print(("\n" if k else "") + unruly.board_to_str(board), flush=True)
@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+
+"""
+Grade Unruly puzzles by how much reasoning they need, with a deduction trace
+
+unruly.propagate only says whether the tactics solve a board. This solves it in
+parallel rounds instead, and records each step. Each round uses the easiest
+level of reasoning which finds anything. It makes every deduction that level
+finds from the board as it stood at the start of the round, then drops back to
+the easiest level. The levels, from easiest to hardest, are:
+
+ * pairs: two_in_a_row (_BB_ -> WBBW) and fill_in_holes (B_B -> BWB)
+ * counts: complete_line, when a line already has n squares of one colour
+ * near-counts: nearly_complete_line, the n-1 tactic from unruly.complete_line
+ * lines: whole_line, everything that can be deduced from one line on its own,
+   from the tables in line_tables.py
+ * lookahead: a square is forced if giving it the other colour leads to a
+   conflict, using whole-line reasoning (see lookahead.probe)
+
+Each round adds its level's weight to the score, so a board's score grows with
+both the number of rounds and the difficulty of the reasoning in them. A grade
+holds the status (solved, stuck or conflict), the score, the number of rounds,
+the hardest level used, the final board, and one Step (round, level, tactic, i,
+j, colour) for every square filled in.
+
+All the levels work on the same BitBoard, one line at a time. A line is only
+looked at again by a level once it has changed, so deductions are never
+recomputed from scratch. Give a list of levels to stop before the lookahead, or
+to grade by some other set of levels:
+
+  grade.py puzzles.txt --max-level lines --workers 8
+
+This reads boards as unruly_batch.py does and writes one JSON line per board.
+"""
+
+import argparse
+import collections
+import json
+import multiprocessing
+
+import line_tables
+import lookahead
+import unruly
+from unruly import BLACK, WHITE, UNKNOWN
+from unruly_batch import read_files
+from unruly_bitboard import BitBoard, Propagator, bits, triple_intersection
+
+Level = collections.namedtuple('Level', ['name', 'weight', 'tactics'])
+Step = collections.namedtuple('Step', ['round', 'level', 'tactic', 'i', 'j', 'colour'])
+Grade = collections.namedtuple('Grade', ['status', 'score', 'rounds', 'level', 'board', 'steps'])
+
+
+# Line tactics take a line as bitmasks, like unruly_bitboard.line_updates, and
+# return (must_be_black, must_be_white). A mask which disagrees with the line
+# means a conflict.
+
+def two_in_a_row(black, white, length):
+    full = (1 << length) - 1
+    black_pairs, white_pairs = black & (black >> 1), white & (white >> 1)
+    return ((white_pairs << 2) | (white_pairs >> 1)) & full, ((black_pairs << 2) | (black_pairs >> 1)) & full
+
+
+def fill_in_holes(black, white, length):
+    full = (1 << length) - 1
+    return ((white << 1) & (white >> 1)) & full, ((black << 1) & (black >> 1)) & full
+
+
+def complete_line(black, white, length):
+    n = length // 2
+    unknown = ((1 << length) - 1) & ~(black | white)
+    whites, blacks = white.bit_count(), black.bit_count()
+    if whites > n or blacks > n:
+        return white, black
+    if whites == n:
+        return unknown, 0
+    if blacks == n:
+        return 0, unknown
+    return 0, 0
+
+
+def nearly_complete_line(black, white, length):
+    n = length // 2
+    full = (1 << length) - 1
+    unknown = full & ~(black | white)
+    must_be_black = must_be_white = 0
+    if white.bit_count() == n - 1:
+        possible_whites = triple_intersection(full & ~white)
+        if possible_whites is not None:
+            must_be_black = unknown & ~possible_whites
+    if black.bit_count() == n - 1:
+        possible_blacks = triple_intersection(full & ~black)
+        if possible_blacks is not None:
+            must_be_white = unknown & ~possible_blacks
+    return must_be_black, must_be_white
+
+
+def whole_line(black, white, length):
+    return line_tables.line_updates(black, white, length)
+
+
+LOOKAHEAD = 'lookahead'
+
+LEVELS = [
+    Level('pairs', 1, (two_in_a_row, fill_in_holes)),
+    Level('counts', 2, (complete_line,)),
+    Level('near-counts', 4, (nearly_complete_line,)),
+    Level('lines', 8, (whole_line,)),
+    Level(LOOKAHEAD, 16, ()),
+]
+
+
+class Grader:
+    def __init__(self, board, levels=LEVELS):
+        self.levels = levels
+        self.board = BitBoard.from_board(board)
+        lines = self.board.rows + self.board.cols
+        # Bit k of stale[level] is set if line k has changed since that level last looked at it
+        self.stale = [(1 << lines) - 1] * len(levels)
+        self.steps = []
+        self.rounds = 0
+        self.score = 0
+        self.hardest = -1
+
+    def line_deductions(self, level):
+        """{(i, j): (colour, tactic name)} for every square the level's line
+        tactics fill in, looking only at stale lines"""
+        board = self.board
+        found = {}
+        stale, self.stale[level] = self.stale[level], 0
+        for line in bits(stale):
+            black, white = board.black[line], board.white[line]
+            for tactic in self.levels[level].tactics:
+                must_be_black, must_be_white = tactic(black, white, board.lengths[line])
+                clash = must_be_black & (white | must_be_white)
+                if clash:
+                    raise board.conflict(line, next(bits(clash)), BLACK)
+                clash = must_be_white & black
+                if clash:
+                    raise board.conflict(line, next(bits(clash)), WHITE)
+                for c, mask in ((BLACK, must_be_black & ~black), (WHITE, must_be_white & ~white)):
+                    for k in bits(mask):
+                        square = board.square(line, k)
+                        previous = found.setdefault(square, (c, tactic.__name__))
+                        if previous[0] != c:
+                            raise board.conflict(line, k, c)
+        return found
+
+    def lookahead_deductions(self):
+        """{(i, j): (colour, 'lookahead')} for every unknown square where one
+        colour leads to a conflict
+
+        Propagation only ever adds squares, so if giving one square a colour
+        forces some other square to a colour without a conflict, giving that
+        other square the colour directly won't find a conflict either, and
+        there's no need to try it."""
+        board = self.board
+        probe = Propagator(board.rows, board.cols, line_tables.line_updates)
+        probe.black, probe.white = list(board.black), list(board.white)
+        consistent = set()
+        found = {}
+        for i in range(board.rows):
+            for j in bits(((1 << board.cols) - 1) & ~(board.black[i] | board.white[i])):
+                outcomes = lookahead.probe(probe, i, j, consistent)
+                if not outcomes:
+                    raise board.conflict(i, j, BLACK)
+                if len(outcomes) == 1:
+                    found[(i, j)] = (next(iter(outcomes)), LOOKAHEAD)
+                for filled in outcomes.values():
+                    if filled is not None:
+                        consistent.update(filled)
+        return found
+
+    def round(self):
+        """Apply the easiest level which fills anything in, or return False"""
+        for level, (name, weight, tactics) in enumerate(self.levels):
+            if name == LOOKAHEAD:
+                found = self.lookahead_deductions()
+            else:
+                found = self.line_deductions(level)
+            if found:
+                break
+        else:
+            return False
+        self.rounds += 1
+        self.score += weight
+        self.hardest = max(self.hardest, level)
+        board = self.board
+        for (i, j), (c, tactic) in found.items():
+            board.set(i, j, c)
+            self.steps.append(Step(self.rounds, name, tactic, i, j, unruly.char(c)))
+            for stale in range(len(self.stale)):
+                self.stale[stale] |= 1 << i | 1 << (board.rows + j)
+        return True
+
+    def grade(self):
+        status = 'stuck'
+        try:
+            while not self.board.solved():
+                if not self.round():
+                    break
+            else:
+                status = 'solved'
+        except ValueError:
+            status = 'conflict'
+        level = None if self.hardest < 0 else self.levels[self.hardest].name
+        return Grade(status, self.score, self.rounds, level, self.board.to_board(), self.steps)
+
+
+def grade(board, levels=LEVELS):
+    """The Grade of a board, using the given levels of reasoning"""
+    return Grader(board, levels).grade()
+
+
+def grade_rows(rows, levels=LEVELS, trace=False):
+    """grade() a board given as row strings, as a dict for JSON"""
+    result = grade(unruly.read_board(rows), levels)
+    record = dict(
+        status=result.status,
+        score=result.score,
+        rounds=result.rounds,
+        level=result.level,
+        board=unruly.board_to_str(result.board),
+    )
+    if trace:
+        record['steps'] = [step._asdict() for step in result.steps]
+    return record
+
+
+def chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def grade_all(boards, levels=LEVELS, trace=False, workers=1, chunk=10000):
+    """Yield grade_rows() of each board (row strings), in order"""
+    if workers <= 1:
+        for rows in boards:
+            yield grade_rows(rows, levels, trace)
+        return
+    with multiprocessing.Pool(workers) as pool:
+        for batch in chunks(boards, chunk):
+            yield from pool.starmap(grade_rows, [(rows, levels, trace) for rows in batch], chunksize=64)
+
+
+def test_grade():
+    from pathlib import Path
+    for path in sorted(Path('test_data').glob('board?')):
+        with path.open() as f:
+            board = unruly.read_board(f.readlines())
+        with path.with_suffix('.soln').open() as f:
+            solution = unruly.read_board(f.readlines())
+        result = grade(board, LEVELS[:3])
+        # The first three levels are the four tactics, which solve these boards
+        assert result.status == 'solved' and result.board == solution, path
+        unknowns = sum(c == UNKNOWN for row in board for c in row)
+        assert len(result.steps) == len({(s.i, s.j) for s in result.steps}) == unknowns, path
+        assert [s.round for s in result.steps] == sorted(s.round for s in result.steps)
+        assert result.steps[-1].round == result.rounds
+        assert result.score == sum(
+            next(level.weight for level in LEVELS if level.name == name)
+            for name in {s.round: s.level for s in result.steps}.values())
+        assert all(solution[s.i][s.j] == unruly.char_to_enum(s.colour) for s in result.steps)
+    assert grade(unruly.read_board(['BBB_', '____', '____', '____'])).status == 'conflict'
+    assert grade(unruly.read_board(['____'] * 4)).status == 'stuck'
+
+
+def test_levels():
+    # The tactics can't solve the untactical puzzles, but more reasoning can
+    from pathlib import Path
+    for path in sorted(Path('found').glob('*')):
+        with path.open() as f:
+            board = unruly.read_board(f.readlines())
+        assert grade(board, LEVELS[:3]).status == 'stuck', path
+        result = grade(board)
+        assert result.status == 'solved', path
+        assert result.level in ('lines', LOOKAHEAD), path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('files', nargs='*')
+    parser.add_argument('--max-level', choices=[level.name for level in LEVELS], default=LEVELS[-1].name,
+                        help="hardest level of reasoning to use")
+    parser.add_argument('--trace', action='store_true', help="include every step in the output")
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args()
+    levels = LEVELS[:[level.name for level in LEVELS].index(args.max_level) + 1]
+    for index, record in enumerate(grade_all(read_files(args.files), levels, args.trace, args.workers)):
+        print(json.dumps(dict(index=index, **record)))
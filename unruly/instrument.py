@@ -0,0 +1,143 @@
+"""
+Counters, timers and trace callbacks for looking inside the solvers
+
+The instrumented functions take an optional stats argument. When it's None
+(the default), they do no extra work beyond checking that. When it's a Stats,
+they record into it:
+
+ * counters: stats.count(name, k) adds k to a running total
+ * timers: `with stats.timer(name):` adds the wall-clock time taken to a
+   total, and counts the calls; timed(stats, name, f, *args) does the same
+   for a single call, and is just f(*args) when stats is None
+ * samples: stats.sample(name, value) keeps a list of values, for
+   trajectories and distributions
+ * events: stats.event(name, **fields) passes the event to the trace
+   callback, if the Stats was given one, as trace(name, fields)
+
+as_dict() turns all of this into something json.dump can write. These are
+instrumented:
+
+ * unruly.propagate: frontier pops, and for each tactic the time it takes,
+   the updates it suggests and the squares it actually fills in, with a
+   'fill' event for every square
+ * unruly_z3.solve_board and minimize_z3: the latency of every check(), and
+   for minimisation the clues removed and kept, with a 'clue' event for each
+ * untactical_z3.find_puzzles: check() latency for each kind of check, the
+   number of iterations (and of refutations), and the iterations it took to
+   find each puzzle, with 'puzzle' and 'refuted' events
+
+The Net solvers use the hook in net/engines.py instead (see engines.Recorder).
+
+Every entry point with instrumentation has the same command line flags, from
+add_arguments(): --stats FILE writes the statistics there as JSON when it's
+done, and --trace prints every event to stderr as a line of JSON.
+"""
+
+import json
+import sys
+import time
+
+
+class Timer:
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stats.add_time(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class Stats:
+    def __init__(self, trace=None):
+        """trace, if given, is called as trace(name, fields) for every event"""
+        self.counters = {}
+        self.timers = {}
+        self.samples = {}
+        self.trace = trace
+
+    def count(self, name, k=1):
+        self.counters[name] = self.counters.get(name, 0) + k
+
+    def timer(self, name):
+        return Timer(self, name)
+
+    def add_time(self, name, seconds):
+        calls, total, longest = self.timers.get(name, (0, 0.0, 0.0))
+        self.timers[name] = (calls + 1, total + seconds, max(longest, seconds))
+
+    def sample(self, name, value):
+        self.samples.setdefault(name, []).append(value)
+
+    def event(self, name, **fields):
+        if self.trace is not None:
+            self.trace(name, fields)
+
+    def as_dict(self):
+        return dict(
+            counters=dict(self.counters),
+            timers={
+                name: dict(calls=calls, seconds=total, mean=total / calls, max=longest)
+                for name, (calls, total, longest) in self.timers.items()
+            },
+            samples=dict(self.samples),
+        )
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.as_dict(), f, indent=2)
+            f.write("\n")
+
+
+def timed(stats, name, function, *args):
+    """function(*args), timed under name if stats isn't None"""
+    if stats is None:
+        return function(*args)
+    with stats.timer(name):
+        return function(*args)
+
+
+def print_event(name, fields):
+    print(json.dumps(dict(event=name, **fields)), file=sys.stderr)
+
+
+def add_arguments(parser):
+    parser.add_argument('--stats', help="write counters and timings to this file as JSON")
+    parser.add_argument('--trace', action='store_true', help="print every traced event to stderr as JSON")
+
+
+def from_args(args):
+    """A Stats for the flags from add_arguments, or None if neither was given"""
+    if args.stats is None and not args.trace:
+        return None
+    return Stats(trace=print_event if args.trace else None)
+
+
+def finish(stats, args):
+    if stats is not None and args.stats is not None:
+        stats.dump(args.stats)
+
+
+def test_stats(tmp_path):
+    events = []
+    stats = Stats(trace=lambda name, fields: events.append((name, fields)))
+    stats.count('a')
+    stats.count('a', 2)
+    for _ in range(3):
+        with stats.timer('t'):
+            pass
+    assert timed(stats, 't', max, 1, 2) == 2
+    assert timed(None, 't', max, 1, 2) == 2
+    stats.sample('s', 1)
+    stats.event('e', x=1)
+    stats.dump(tmp_path / 'stats.json')
+    with open(tmp_path / 'stats.json') as f:
+        exported = json.load(f)
+    assert exported['counters'] == {'a': 3}
+    assert exported['timers']['t']['calls'] == 4
+    assert exported['samples'] == {'s': [1]}
+    assert events == [('e', {'x': 1})]
@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+
+"""
+Precomputed tables of valid Unruly rows, for line-at-a-time reasoning
+
+A row (or column) of length 2n is valid if it has n squares of each colour and
+no three in a row of the same colour. valid_rows(n) lists every valid row as an
+integer bitmask, with bit j set if square j is white, and caches the list on
+disk under line_tables/ (next to this file).
+
+For a partial row, given as a pair of masks (black, white) like the lines of a
+unruly_bitboard.BitBoard, LineTable.forced() finds every square which has the
+same colour in every valid completion. This is the strongest deduction that
+can be made from a single line, and includes everything the four tactics in
+unruly.py can deduce. For n up to EXACT_N, forced() is a single lookup in a
+table indexed by the partial row (read as a base 3 number, with the digits
+BLACK, WHITE, UNKNOWN), built once with a dynamic programme over the digits and
+cached on disk (EXACT_N is 7, where the table takes 24MB; n = 8 needs 215MB,
+so ask for it with exact=True). Above that, it combines the valid completions
+with NumPy while there aren't too many of them, and otherwise runs a dynamic
+programme over the squares of the row, which takes time proportional to n^2.
+
+line_updates() has the same interface as unruly_bitboard.line_updates, so it
+can be dropped into a BitBoard or Propagator:
+
+  BitBoard.from_board(board, updates=line_tables.line_updates)
+"""
+
+import argparse
+import functools
+from pathlib import Path
+
+import numpy as np
+
+import unruly
+from unruly import BLACK, WHITE, UNKNOWN
+
+
+EXACT_N = 7
+# Above this many valid rows, forced() uses forced_by_search()
+MAX_ROWS = 100000
+# Without an exact table, forced() remembers this many recent answers
+MEMO_SIZE = 100000
+CACHE_DIR = Path(__file__).parent / 'line_tables'
+
+# POW3_BYTE[b] is byte b read as a base 3 number, with bit j as digit j
+POW3_BYTE = [sum(3 ** j for j in range(8) if b >> j & 1) for b in range(256)]
+
+
+def base3(mask):
+    """mask, with bit j read as base 3 digit j"""
+    result, scale = 0, 1
+    while mask:
+        result += POW3_BYTE[mask & 255] * scale
+        mask >>= 8
+        scale *= 6561
+    return result
+
+
+def generate_rows(n):
+    """Every valid row of length 2n, as white masks, in increasing order"""
+    length = 2 * n
+    rows = []
+
+    def extend(j, white, whites, run_colour, run_length):
+        if j == length:
+            rows.append(white)
+            return
+        for c in (BLACK, WHITE):
+            count = whites + (c == WHITE)
+            if count > n or (j + 1 - count) > n:
+                continue
+            if c == run_colour and run_length == 2:
+                continue
+            extend(j + 1, white | (c << j), count, c, run_length + 1 if c == run_colour else 1)
+
+    extend(0, 0, 0, None, 0)
+    return sorted(rows)
+
+
+def valid_rows(n, cache_dir=CACHE_DIR):
+    """Every valid row of length 2n, as a sorted NumPy array of white masks"""
+    path = Path(cache_dir) / f'rows_{2 * n}.npy'
+    if path.exists():
+        return np.load(path)
+    rows = np.array(generate_rows(n), dtype=np.uint64)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    np.save(path, rows)
+    return rows
+
+
+def build_table(n, rows):
+    """(ok, must_be_black, must_be_white) for every partial row, by base 3 index"""
+    length = 2 * n
+    full = (1 << length) - 1
+    size = 3 ** length
+    dtype = np.uint32 if length > 16 else np.uint16
+    ok = np.zeros(size, dtype=bool)
+    all_white = np.zeros(size, dtype=dtype)
+    any_white = np.zeros(size, dtype=dtype)
+    indices = [base3(int(row)) for row in rows]
+    ok[indices] = True
+    all_white[indices] = rows.astype(dtype)
+    any_white[indices] = rows.astype(dtype)
+    # After step k, every partial row with unknowns only in squares 0 to k is done
+    for k in range(length):
+        shape = (3 ** (length - k - 1), 3, 3 ** k)
+        ok_k, all_k, any_k = ok.reshape(shape), all_white.reshape(shape), any_white.reshape(shape)
+        ok0, ok1 = ok_k[:, BLACK, :], ok_k[:, WHITE, :]
+        all_k[:, 2, :] = np.where(ok0 & ok1, all_k[:, BLACK, :] & all_k[:, WHITE, :],
+                                  np.where(ok0, all_k[:, BLACK, :], all_k[:, WHITE, :]))
+        any_k[:, 2, :] = any_k[:, BLACK, :] | any_k[:, WHITE, :]
+        ok_k[:, 2, :] = ok0 | ok1
+    must_be_black = (~any_white & full).astype(dtype)
+    must_be_black[~ok] = 0
+    all_white[~ok] = 0
+    return ok, must_be_black, all_white
+
+
+class LineTable:
+    def __init__(self, n, exact=None, cache_dir=CACHE_DIR):
+        """exact is whether to build the full lookup table (by default, if n is
+        at most EXACT_N)"""
+        self.n = n
+        self.length = 2 * n
+        self.full = (1 << self.length) - 1
+        self.rows = valid_rows(n, cache_dir)
+        if exact is None:
+            exact = n <= EXACT_N
+        self.table = None
+        # Per table, so that each length has its own bound
+        self.memo = functools.lru_cache(maxsize=MEMO_SIZE)(self.compute_forced)
+        if exact:
+            path = Path(cache_dir) / f'forced_{self.length}.npz'
+            if path.exists():
+                with np.load(path) as data:
+                    self.table = (data['ok'], data['must_be_black'], data['must_be_white'])
+            else:
+                self.table = build_table(n, self.rows)
+                ok, must_be_black, must_be_white = self.table
+                np.savez(path, ok=ok, must_be_black=must_be_black, must_be_white=must_be_white)
+
+    def completions(self, black, white):
+        """Every valid row which agrees with the partial row (black, white)"""
+        rows = self.rows
+        return rows[((rows & np.uint64(white)) == white) & ((rows & np.uint64(black)) == 0)]
+
+    def forced(self, black, white):
+        """(must_be_black, must_be_white) masks for a partial row, covering every
+        square which is the same colour in every completion, or None if there
+        aren't any completions
+
+        Without an exact table, the most recent MEMO_SIZE answers are
+        remembered, so a search which keeps seeing the same partial rows only
+        works each one out once."""
+        if self.table is not None:
+            unknown = self.full & ~(black | white)
+            index = base3(white) + 2 * base3(unknown)
+            ok, must_be_black, must_be_white = self.table
+            if not ok[index]:
+                return None
+            return int(must_be_black[index]), int(must_be_white[index])
+        return self.memo(black, white)
+
+    def compute_forced(self, black, white):
+        if len(self.rows) <= MAX_ROWS:
+            completions = self.completions(black, white)
+            if len(completions) == 0:
+                return None
+            all_white = int(np.bitwise_and.reduce(completions))
+            any_white = int(np.bitwise_or.reduce(completions))
+            return self.full & ~any_white, all_white
+        return self.forced_by_search(black, white)
+
+    def forced_by_search(self, black, white):
+        """forced(), by a dynamic programme over the squares of the row
+
+        A state is (whites so far, colour of the last square, length of the run
+        it ends)."""
+        n, length = self.n, self.length
+        # forward[j] is the set of states reachable after the first j squares
+        forward = [{(0, None, 0)}]
+        for j in range(length):
+            states = set()
+            for (whites, colour, run) in forward[-1]:
+                for c in self.allowed(black, white, j):
+                    state = self.step(whites, colour, run, c, j)
+                    if state is not None:
+                        states.add(state)
+            forward.append(states)
+        # Walk backwards, keeping the states from which the row can be finished
+        alive = {state for state in forward[length] if state[0] == n}
+        if not alive:
+            return None
+        colours = [set() for _ in range(length)]
+        for j in range(length - 1, -1, -1):
+            previous = set()
+            for (whites, colour, run) in forward[j]:
+                for c in self.allowed(black, white, j):
+                    if self.step(whites, colour, run, c, j) in alive:
+                        previous.add((whites, colour, run))
+                        colours[j].add(c)
+            alive = previous
+        must_be_black = sum(1 << j for j in range(length) if colours[j] == {BLACK})
+        must_be_white = sum(1 << j for j in range(length) if colours[j] == {WHITE})
+        return must_be_black, must_be_white
+
+    @staticmethod
+    def allowed(black, white, j):
+        if black >> j & 1:
+            return (BLACK,)
+        if white >> j & 1:
+            return (WHITE,)
+        return (BLACK, WHITE)
+
+    def step(self, whites, colour, run, c, j):
+        whites += c == WHITE
+        if whites > self.n or j + 1 - whites > self.n:
+            return None
+        if c == colour:
+            if run == 2:
+                return None
+            return whites, c, run + 1
+        return whites, c, 1
+
+
+tables = {}
+
+
+def get_table(n):
+    if n not in tables:
+        tables[n] = LineTable(n)
+    return tables[n]
+
+
+def line_updates(black, white, length):
+    """Drop-in replacement for unruly_bitboard.line_updates, using every
+    deduction which can be made from the line on its own"""
+    if length % 2:
+        import unruly_bitboard
+        return unruly_bitboard.line_updates(black, white, length)
+    forced = get_table(length // 2).forced(black, white)
+    if forced is None:
+        # Disagree with every square, so that the caller reports a conflict
+        full = (1 << length) - 1
+        return full, full
+    return forced
+
+
+def test_valid_rows(tmp_path):
+    # Known counts of valid rows of length 2, 4, 6, 8, 10
+    assert [len(valid_rows(n, tmp_path)) for n in range(1, 6)] == [2, 6, 14, 34, 84]
+    assert (valid_rows(3, tmp_path) == generate_rows(3)).all()
+
+
+def test_forced(tmp_path):
+    import itertools
+    import unruly_bitboard
+    n = 3
+    exact = LineTable(n, exact=True, cache_dir=tmp_path)
+    computed = LineTable(n, exact=False, cache_dir=tmp_path)
+    searched = LineTable(n, exact=False, cache_dir=tmp_path)
+    searched.rows = searched.rows[:0]
+    for line in itertools.product(range(3), repeat=2 * n):
+        black = sum(1 << j for j, c in enumerate(line) if c == BLACK)
+        white = sum(1 << j for j, c in enumerate(line) if c == WHITE)
+        completions = exact.completions(black, white)
+        forced = exact.forced(black, white)
+        assert forced == computed.forced(black, white) == searched.forced_by_search(black, white), line
+        if len(completions) == 0:
+            assert forced is None
+            continue
+        all_white = int(np.bitwise_and.reduce(completions))
+        any_white = int(np.bitwise_or.reduce(completions))
+        assert forced == (exact.full & ~any_white, all_white), line
+        # At least as strong as the tactics, wherever they don't find a conflict
+        must_be_black, must_be_white = unruly_bitboard.line_updates(black, white, 2 * n)
+        if not must_be_black & white and not must_be_white & black:
+            assert must_be_black & ~forced[0] == 0 and must_be_white & ~forced[1] == 0, line
+
+
+def test_search():
+    import unruly_search
+    from unruly_bitboard import BitBoard
+    for path in sorted(Path('test_data').glob('board?')) + sorted(Path('found').glob('*')):
+        with path.open() as f:
+            board = unruly.read_board(f.read().split())
+        expected = unruly_search.solve_board(board)
+        assert unruly_search.count_solutions(board, updates=line_updates) == 1, path
+        assert next(unruly_search.solutions(board, updates=line_updates)) == expected, path
+        # Line-at-a-time propagation agrees with the solution wherever it fills something in
+        propagated = BitBoard.from_board(board, line_updates).propagate().to_board()
+        assert all(c in (UNKNOWN, e) for row, e_row in zip(propagated, expected) for c, e in zip(row, e_row))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('n', type=int, nargs='+', help="build and cache the tables for rows of length 2n")
+    args = parser.parse_args()
+    for n in args.n:
+        table = LineTable(n)
+        print(f"{2 * n}: {len(table.rows)} valid rows" + (", exact table" if table.table is not None else ""))
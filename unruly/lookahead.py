@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+
+"""
+Lookahead (probing) on top of the tactics
+
+When the tactics reach a fixpoint, try each unknown square both ways: give it
+a colour, propagate, and see what happens. If one colour leads to a conflict,
+the square must be the other colour. If neither colour does, any square which
+comes out the same colour both ways must be that colour. If both colours lead
+to a conflict, the board has no solution. This repeats until a full pass over
+the board fixes nothing.
+
+Probing works on a single unruly_bitboard.Propagator, using assign() and
+retract(), so no board is ever copied. Squares are probed most constrained
+first (fewest unknowns in their row and column), since those are the ones
+most likely to be forced. Every probe is a propagation, so the whole thing
+takes polynomial time: this is still a tactic, just a stronger one, and
+classify() uses it to split boards which the tactics can't solve into those
+which lookahead can and those which need search.
+
+The tactics used are the Propagator's updates: the four tactics from
+unruly.py by default, or line_tables.line_updates for whole-line reasoning.
+"""
+
+import argparse
+import fileinput
+
+import unruly
+from unruly import BLACK, WHITE, UNKNOWN
+from unruly_bitboard import Propagator, bits, line_updates
+
+
+def probe_order(p):
+    """The unknown squares of p, most constrained first"""
+    unknowns = [p.lengths[line] - (p.black[line] | p.white[line]).bit_count() for line in range(len(p.lengths))]
+    squares = [
+        (i, j)
+        for i in range(p.rows)
+        for j in bits(((1 << p.cols) - 1) & ~(p.black[i] | p.white[i]))
+    ]
+    squares.sort(key=lambda square: unknowns[square[0]] + unknowns[p.rows + square[1]])
+    return squares
+
+
+def probe(p, i, j, known=None):
+    """Try both colours for unknown square (i, j) of a propagated Propagator
+
+    Returns {colour: squares filled in}, with the filled squares as (i, j,
+    colour), for each colour which doesn't lead to a conflict. known is an
+    optional set of (i, j, colour) which are already known not to lead to a
+    conflict: those aren't tried again, and get None instead of their squares.
+    p is left as it was."""
+    outcomes = {}
+    for c in (BLACK, WHITE):
+        if known is not None and (i, j, c) in known:
+            outcomes[c] = None
+            continue
+        try:
+            p.assign(i, j, c)
+            mark = p.checkpoints[-1]
+            outcomes[c] = [(ii, jj, p.get(ii, jj)) for (ii, jj, _) in p.trail[mark:]]
+        except ValueError:
+            pass
+        p.retract()
+    return outcomes
+
+
+def lookahead(p):
+    """Probe the unknown squares of a propagated Propagator, filling in
+    everything that probing proves, until a pass over the board finds nothing
+
+    Raises the tactics' ValueError if some square can't be either colour.
+    Returns p."""
+    progress = True
+    while progress:
+        progress = False
+        for (i, j) in probe_order(p):
+            if p.get(i, j) != UNKNOWN:
+                continue
+            outcomes = probe(p, i, j)
+            if not outcomes:
+                raise p.conflict(i, j, BLACK)
+            if len(outcomes) == 1:
+                ((c, _),) = outcomes.items()
+                forced = [(i, j, c)]
+            else:
+                forced = set(outcomes[BLACK]) & set(outcomes[WHITE])
+            if forced:
+                for (ii, jj, c) in forced:
+                    if p.get(ii, jj) == UNKNOWN:
+                        p.set(ii, jj, c)
+                p.propagate()
+                progress = True
+    return p
+
+
+def propagate(board, updates=line_updates):
+    """unruly.propagate with lookahead: fills in board, or raises ValueError"""
+    result = lookahead(Propagator.from_board(board, updates).propagate()).to_board()
+    for i, row in enumerate(result):
+        board[i][:] = row
+    return board
+
+
+def classify(board, updates=line_updates):
+    """'tactical' if the tactics solve the board, 'lookahead' if they do with
+    lookahead, 'search' if neither does, or 'conflict' if either finds the
+    board has no solution"""
+    p = Propagator.from_board(board, updates)
+    try:
+        if p.propagate().solved():
+            return 'tactical'
+        if lookahead(p).solved():
+            return 'lookahead'
+    except ValueError:
+        return 'conflict'
+    return 'search'
+
+
+def test_probe():
+    with open('found/6x6') as f:
+        board = unruly.read_board(f.readlines())
+    p = Propagator.from_board(board).propagate()
+    before = (list(p.black), list(p.white), len(p.trail))
+    squares = probe_order(p)
+    assert len(squares) == sum(row.count(UNKNOWN) for row in p.to_board())
+    outcomes = probe(p, *squares[0])
+    assert (list(p.black), list(p.white), len(p.trail)) == before
+    assert outcomes and all(squares[0] + (c,) in filled for c, filled in outcomes.items())
+
+
+def test_lookahead():
+    from pathlib import Path
+    import unruly_search
+    for path in sorted(Path('found').glob('*')):
+        with path.open() as f:
+            board = unruly.read_board(f.readlines())
+        solution = unruly_search.solve_board(board)
+        result = propagate([row[:] for row in board])
+        # Never wrong, and at least as strong as the tactics
+        assert all(c in (UNKNOWN, s) for row, s_row in zip(result, solution) for c, s in zip(row, s_row)), path
+        tactics = unruly.propagate([row[:] for row in board])
+        assert all(t in (UNKNOWN, c) for row, t_row in zip(result, tactics) for c, t in zip(row, t_row)), path
+        assert classify(board) == ('lookahead' if result == solution else 'search'), path
+    assert classify(unruly.read_board(['BB_B', '____', '____', '____'])) == 'conflict'
+    with open('test_data/board1') as f:
+        assert classify(unruly.read_board(f.readlines())) == 'tactical'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('files', nargs='*')
+    args = parser.parse_args()
+    board = unruly.read_board(line for line in fileinput.input(args.files) if line.strip())
+    kind = classify(board)
+    print(kind)
+    if kind != 'conflict':
+        print(unruly.board_to_str(propagate(board)))
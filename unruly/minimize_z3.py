@@ -5,15 +5,21 @@
 Minimize the number of clues in an Unruly puzzle while keeping the solution unique.
 """
 
+import argparse
 import fileinput
 
-from z3 import Function, IntSort, Solver, sat, Or
+from z3 import Bool, Solver, sat, Implies
 
+import instrument
 import unruly
-from unruly_z3 import solve_board
+from z3_encoding import DEFAULT_ENCODING, ENCODINGS, make_grid, not_this
 
 
-def minimize(board, expected_solution):
+def minimize(board, expected_solution, encoding=DEFAULT_ENCODING, stats=None):
+    """Remove every clue which can go without letting in another solution
+
+    stats is an optional instrument.Stats, which gets the time of each check(),
+    the number of clues removed and kept, and a 'clue' event for each one."""
     size = len(board)
     clues = [
         (i, j)
@@ -23,55 +29,99 @@ def minimize(board, expected_solution):
     for (i, j) in clues:
         value = board[i][j]
         board[i][j] = 2
-        if solve_board(board, exclusions=[expected_solution]) is not None:
+        if solve_board(board, exclusions=[expected_solution], encoding=encoding, stats=stats) is not None:
             board[i][j] = value
+        if stats is not None:
+            record_clue(stats, i, j, board[i][j] == 2)
+    return board
+
+
+def minimize_incremental(board, expected_solution, encoding=DEFAULT_ENCODING, stats=None):
+    """Same as minimize, but using a single incremental Z3 solver
+
+    The Unruly rules and the exclusion of expected_solution are only added once.
+    Each clue is guarded by a Boolean literal, and removing a clue is checked by
+    leaving its literal out of the assumptions, so that anything Z3 learns
+    carries over from one check to the next. stats is as for minimize."""
+    size = len(board)
+    solution = make_grid(encoding, 'solution', size)
+    s = Solver()
+    s.add(solution.domain())
+    s.add(solution.rules())
+    s.add(not_this(solution, expected_solution, size))
+    clues = {}
+    for i in range(size):
+        for j in range(size):
+            if board[i][j] != 2:
+                clues[(i, j)] = Bool(f"clue_{i}_{j}")
+                s.add(Implies(clues[(i, j)], solution.has(i, j, board[i][j])))
+    kept = dict(clues)
+    for (i, j) in clues:
+        del kept[(i, j)]
+        if instrument.timed(stats, 'check', s.check, *kept.values()) == sat:
+            kept[(i, j)] = clues[(i, j)]
+        else:
+            board[i][j] = 2
+        if stats is not None:
+            record_clue(stats, i, j, board[i][j] == 2)
     return board
 
-def solve_board(board, exclusions=None):
+
+def record_clue(stats, i, j, removed):
+    stats.count("clues removed" if removed else "clues kept")
+    stats.event('clue', square=[i, j], removed=removed)
+
+
+def solve_board(board, exclusions=None, encoding=DEFAULT_ENCODING, stats=None):
     if exclusions is None:
         exclusions = []
     size = len(board[0])
-    n = size // 2
-    solution = Function('solution', IntSort(), IntSort(), IntSort())
+    solution = make_grid(encoding, 'solution', size)
     s = Solver()
+    s.add(solution.domain())
     for i, row in enumerate(board):
         for j, c in enumerate(row):
             if c < 2:
-                s.add(solution(i, j) == c)
-            else:
-                s.add(0 <= solution(i, j))
-                s.add(solution(i, j) <= 1)
-    for i in range(size):
-        s.add(sum(solution(i, j) for j in range(size)) == n)
-        s.add(sum(solution(j, i) for j in range(size)) == n)
-    for i in range(size):
-        for j in range(size - 2):
-            row_sum = solution(i, j) + solution(i, j + 1) + solution(i, j + 2)
-            col_sum = solution(j, i) + solution(j + 1, i) + solution(j + 2, i)
-            s.add(0 < row_sum)
-            s.add(row_sum < 3)
-            s.add(0 < col_sum)
-            s.add(col_sum < 3)
+                s.add(solution.has(i, j, c))
+    s.add(solution.rules())
     for exclusion in exclusions:
-        s.add(Or(*(
-            solution(i, j) != exclusion[i][j]
-            for i in range(size) for j in range(size)
-        )))
-    if s.check() == sat:
-        m = s.model()
-        board = [
-            [ m.evaluate(solution(i, j)).as_long() for j in range(size) ]
-            for i in range(size)
-        ]
-        return board
+        s.add(not_this(solution, exclusion, size))
+    if instrument.timed(stats, 'check', s.check) == sat:
+        return solution.board(s.model())
     else:
         return None
 
 
-if __name__ == '__main__':
-    board = unruly.read_board(fileinput.input())
+def test_minimize_incremental():
+    with open('found/6x6') as f:
+        board = unruly.read_board(f.readlines())
     solution = solve_board(board)
-    board = minimize(board, solution)
+    expected = minimize([row[:] for row in board], solution)
+    for encoding in ENCODINGS:
+        stats = instrument.Stats()
+        minimized = minimize_incremental([row[:] for row in board], solution, encoding, stats)
+        assert minimized == expected, encoding
+        removed = sum(c == 2 for row in minimized for c in row) - sum(c == 2 for row in board for c in row)
+        assert stats.counters["clues removed"] == removed
+        assert stats.timers['check'][0] == removed + stats.counters["clues kept"]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--encoding', choices=ENCODINGS, default=DEFAULT_ENCODING)
+    parser.add_argument('files', nargs='*')
+    parser.add_argument('--cache', help="SQLite database of results to consult and extend (see solve_cache.py)")
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    board = unruly.read_board(fileinput.input(args.files))
+    stats = instrument.from_args(args)
+    if args.cache is None:
+        solution = solve_board(board, encoding=args.encoding, stats=stats)
+        board = minimize_incremental(board, solution, args.encoding, stats)
+    else:
+        import solve_cache
+        board = solve_cache.Cache(args.cache).minimize_z3(board, args.encoding)
     blanks = sum(c == 2 for row in board for c in row)
     print(f"Found a subset with {blanks} empty squares")
-    print(unruly.board_to_str(board))
\ No newline at end of file
+    print(unruly.board_to_str(board))
+    instrument.finish(stats, args)
@@ -0,0 +1,335 @@
+#!/usr/bin/env python
+
+"""
+Validated gate tiles for building Unruly boards out of planar 3-SAT formulas
+
+sat_to_unruly.py lays out a board as a grid of SIZE x SIZE tiles, each a
+partial board read from gates/tiles/. Every tile has the same border: each of
+its four sides, read clockwise, is the string SIDE (so the border looks the same
+after a quarter turn), except where a tile leaves the middle two squares of a
+side unknown. That pair of squares is a port, and the tile on the other side of
+it always has a port facing it. A tile's name starts with its ports (L, R, T and
+B): LR carries a signal across, LB turns one from the left downwards, and so on.
+
+The first square of a port, reading clockwise, carries the signal. SIDE has
+different colours either side of a port, so the second square is always the
+other colour. Next to each port, the two squares just inside the tile are the
+same colour as each other (a rung), so the four squares of two facing ports can
+only be completed with each square the opposite colour from the one it faces:
+the signal on both sides of the join is the same. Apart from ports, the unknown
+squares of different tiles are too far apart to share a line of three, so
+whether a board of tiles can be completed depends only on each tile's relation:
+which signals it allows on its ports together. This module works the relations
+out by trying every completion of each tile, with its neighbours' borders
+around it and their ports and rungs unknown, checks that the ports always work
+as above, and checks that each tile has the relation its kind promises:
+
+ * wire: two ways to complete the ports, each the colour-swap of the other, so
+   a wire or a fork copies (or inverts) one bit to all its ports
+ * copy, not: a wire with two ports of the same, or opposite, colour
+ * clause: every combination but one, whichever one that is
+ * end: every combination, for the last port of a variable
+ * blank: no ports, and the tile has a completion (it's all clues)
+
+Turning a tile a quarter turn clockwise takes its L port to T, T to R, and so
+on, and keeps its relation, so only the tiles in ROTATIONS' values were
+searched for (by gates_z3.py) and the rest are turned copies of them. The
+hand-drawn gadgets from the talk in gates/ are not used: they're a sketch of the
+idea, and don't keep to the balance rule. sat_to_unruly.py takes care of that
+instead.
+"""
+
+import argparse
+import itertools
+from pathlib import Path
+
+import unruly
+from unruly import BLACK, WHITE, UNKNOWN
+
+SIZE = 10
+TILE_DIR = Path(__file__).parent / 'gates' / 'tiles'
+
+# Each side of every tile, read clockwise from its first corner
+SIDE = 'WBBWBWWBW'
+
+# The clockwise index of a port's first square along its side
+PORT_INDEX = SIZE // 2 - 1
+
+KINDS = {
+    'LR': 'wire',
+    'TB': 'copy',
+    'TB_not': 'not',
+    'LB': 'wire',
+    'RB': 'wire',
+    'LT': 'wire',
+    'RT': 'wire',
+    'LRB': 'wire',
+    'LRT': 'wire',
+    'LRB_clause': 'clause',
+    'LRT_clause': 'clause',
+    'T_end': 'end',
+    'B_end': 'end',
+    'blank': 'blank',
+}
+
+# Tiles which are other tiles turned clockwise by a number of quarter turns
+ROTATIONS = {
+    'LR': ('TB', 1),
+    'LT': ('LB', 1),
+    'RT': ('LB', 2),
+    'RB': ('LB', 3),
+    'LRT': ('LRB', 2),
+    'LRT_clause': ('LRB_clause', 2),
+    'B_end': ('T_end', 2),
+}
+
+
+def side_square(side, k):
+    """The square at clockwise index k along a side of a tile"""
+    return {
+        'T': (0, k),
+        'R': (k, SIZE - 1),
+        'B': (SIZE - 1, SIZE - 1 - k),
+        'L': (SIZE - 1 - k, 0),
+    }[side]
+
+
+def inwards(side, square, steps=1):
+    (i, j), (di, dj) = square, {'T': (1, 0), 'R': (0, -1), 'B': (-1, 0), 'L': (0, 1)}[side]
+    return i + steps * di, j + steps * dj
+
+
+# (signal square, partner square) of each port; the squares just inside them,
+# which have to be the same colour; and the neighbour's port and rung facing them
+PORTS = {side: (side_square(side, PORT_INDEX), side_square(side, PORT_INDEX + 1)) for side in 'LRTB'}
+RUNGS = {side: tuple(inwards(side, square) for square in PORTS[side]) for side in 'LRTB'}
+FACING = {side: tuple(inwards(side, square, -1) for square in PORTS[side]) for side in 'LRTB'}
+RUNGS_FACING = {side: tuple(inwards(side, square, -2) for square in PORTS[side]) for side in 'LRTB'}
+
+
+def ports_of(name):
+    """The ports of a tile, from its name"""
+    prefix = name.split('_')[0]
+    return '' if prefix == 'blank' else prefix
+
+
+def ring_index(i, j):
+    """(side, clockwise index) of border square (i, j), or of the square of a
+    neighbour just outside the tile (which is the same as the square on the
+    opposite side of this tile)"""
+    i, j = i % SIZE, j % SIZE
+    if i == 0 and j < SIZE - 1:
+        return 'T', j
+    if j == SIZE - 1 and i < SIZE - 1:
+        return 'R', i
+    if i == SIZE - 1 and j > 0:
+        return 'B', SIZE - 1 - j
+    if j == 0 and i > 0:
+        return 'L', SIZE - 1 - i
+    raise ValueError(f"({i}, {j}) isn't on the border")
+
+
+def ring_colour(i, j, side=SIDE):
+    """The colour every tile has at border square (i, j), or at the square of
+    a neighbour just outside the tile"""
+    return unruly.char_to_enum(side[ring_index(i, j)[1]])
+
+
+def is_border(i, j):
+    return i in (0, SIZE - 1) or j in (0, SIZE - 1)
+
+
+def surround(tile, ports, side=SIDE):
+    """The tile as {(i, j): colour}, with a border of its neighbours' squares
+    (unknown where they face a port, along with the rungs behind them)"""
+    squares = {}
+    for i in range(-1, SIZE + 1):
+        for j in range(-1, SIZE + 1):
+            if i in (-1, SIZE) and j in (-1, SIZE):
+                continue
+            if 0 <= i < SIZE and 0 <= j < SIZE:
+                squares[(i, j)] = tile[i][j]
+            else:
+                squares[(i, j)] = ring_colour(i, j, side)
+    for p in ports:
+        for square in FACING[p] + RUNGS_FACING[p]:
+            squares[square] = UNKNOWN
+    return squares
+
+
+def triples(squares):
+    """Every line of three squares within squares"""
+    for (i, j) in squares:
+        for (di, dj) in ((0, 1), (1, 0)):
+            triple = [(i + k * di, j + k * dj) for k in range(3)]
+            if all(square in squares for square in triple):
+                yield triple
+
+
+def completions(squares, ports):
+    """Yield every way to fill in the unknown squares without three in a row,
+    with the neighbours' rungs behind their ports each a pair of one colour"""
+    rung = {RUNGS_FACING[p][1]: RUNGS_FACING[p][0] for p in ports}
+    # The neighbours' rungs last, so that each rung's second square comes after
+    # its first
+    unknowns = sorted((square for square, c in squares.items() if c == UNKNOWN),
+                      key=lambda s: (s in rung, s))
+    lines = {square: [] for square in unknowns}
+    for triple in triples(squares):
+        for square in triple:
+            if square in lines:
+                lines[square].append(triple)
+    squares = dict(squares)
+    for (x, y, z) in triples(squares):
+        if squares[x] == squares[y] == squares[z] != UNKNOWN:
+            return
+
+    def fill(k):
+        if k == len(unknowns):
+            yield {square: squares[square] for square in unknowns}
+            return
+        square = unknowns[k]
+        colours = (BLACK, WHITE)
+        if square in rung:
+            colours = (squares[rung[square]],)
+        for c in colours:
+            squares[square] = c
+            if not any(squares[x] == squares[y] == squares[z] != UNKNOWN for (x, y, z) in lines[square]):
+                yield from fill(k + 1)
+        squares[square] = UNKNOWN
+
+    yield from fill(0)
+
+
+def relation(tile, ports, side=SIDE):
+    """The set of port colour tuples (in the order of ports) which the tile can
+    be completed with. Raises ValueError if some completion gives a port's two
+    squares the same colour, or a port a square the same colour as the one
+    facing it."""
+    result = set()
+    for filled in completions(surround(tile, ports, side), ports):
+        for p in ports:
+            signal, partner = PORTS[p]
+            if filled[signal] == filled[partner]:
+                raise ValueError(f"Port {p} isn't always two colours")
+            if any(filled[s] == filled[f] for s, f in zip(PORTS[p], FACING[p])):
+                raise ValueError(f"Port {p} doesn't always flip the squares facing it")
+        result.add(tuple(filled[PORTS[p][0]] for p in ports))
+    return result
+
+
+def check_tile(name, tile, side=SIDE):
+    """Check that a tile fits the border and has the relation of its kind, and
+    return the relation"""
+    ports = ports_of(name)
+    kind = KINDS[name]
+    if len(tile) != SIZE or any(len(row) != SIZE for row in tile):
+        raise ValueError(f"{name} isn't {SIZE}x{SIZE}")
+    port_squares = {square for p in ports for square in PORTS[p]}
+    for i, j in itertools.product(range(SIZE), repeat=2):
+        if (i, j) in port_squares:
+            expected = UNKNOWN
+        elif is_border(i, j):
+            expected = ring_colour(i, j, side)
+        else:
+            continue
+        if tile[i][j] != expected:
+            raise ValueError(f"{name} has {unruly.char(tile[i][j])} at ({i}, {j}) instead of {unruly.char(expected)}")
+    for p in ports:
+        (a, b), (c, d) = RUNGS[p]
+        if tile[a][b] == UNKNOWN or tile[a][b] != tile[c][d]:
+            raise ValueError(f"{name} has no rung inside port {p}")
+    found = relation(tile, ports, side)
+    everything = set(itertools.product((BLACK, WHITE), repeat=len(ports)))
+    if kind in ('wire', 'copy', 'not'):
+        ok = len(found) == 2 and {tuple(map(unruly.other, t)) for t in found} == found
+        if kind == 'copy':
+            ok = ok and all(t[0] == t[1] for t in found)
+        elif kind == 'not':
+            ok = ok and all(t[0] != t[1] for t in found)
+    elif kind == 'clause':
+        ok = len(everything - found) == 1
+    elif kind == 'end':
+        ok = found == everything
+    else:
+        ok = found == {()}
+    if not ok:
+        raise ValueError(f"{name} should be a {kind} tile, but allows {sorted(found)}")
+    return found
+
+
+def rotate(tile):
+    """A tile turned a quarter turn clockwise"""
+    return [list(row) for row in zip(*tile[::-1])]
+
+
+def rotated(name, tiles):
+    """The tile for name, from tiles (a {name: tile} dict) or by turning one"""
+    if name not in ROTATIONS:
+        return tiles[name]
+    tile, turns = ROTATIONS[name]
+    tile = tiles[tile]
+    for _ in range(turns):
+        tile = rotate(tile)
+    return tile
+
+
+def read_tile(name, directory=TILE_DIR):
+    with open(Path(directory) / name) as f:
+        return unruly.read_board(line for line in f if line.strip())
+
+
+def write_tile(name, tile, directory=TILE_DIR):
+    with open(Path(directory) / name, 'w') as f:
+        f.write(unruly.board_to_str(tile) + "\n")
+
+
+def load(directory=TILE_DIR):
+    """{name: (tile, relation)} for every tile, checking each of them"""
+    if not Path(directory).is_dir():
+        raise FileNotFoundError(f"No tile directory {directory}")
+    tiles = {}
+    for name in KINDS:
+        tile = read_tile(name, directory)
+        tiles[name] = (tile, check_tile(name, tile))
+    return tiles
+
+
+def test_load():
+    tiles = load()
+    assert set(tiles) == set(KINDS)
+    for name, (tile, found) in tiles.items():
+        assert all(len(t) == len(ports_of(name)) for t in found)
+        # The turned tiles on disk are the turned tiles
+        assert rotated(name, {n: t for n, (t, _) in tiles.items()}) == tile
+    # The tiles have to be found relative to this file, not the current directory
+    try:
+        load('no such directory')
+    except FileNotFoundError:
+        pass
+    else:
+        assert False, "A missing tile directory went unnoticed"
+
+
+def test_broken_tile():
+    tile, found = load()['LR']
+    assert len(found) == 2
+    # Filling in the wire with one of its completions leaves only one colour
+    filled = next(completions(surround(tile, 'LR'), 'LR'))
+    broken = [[filled[(i, j)] if 0 < i < SIZE - 1 and 0 < j < SIZE - 1 and c == UNKNOWN else c
+               for j, c in enumerate(row)] for i, row in enumerate(tile)]
+    assert len(relation(broken, 'LR')) == 1
+    try:
+        check_tile('LR', broken)
+    except ValueError:
+        pass
+    else:
+        assert False, "A broken wire passed the check"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tiles', type=Path, default=TILE_DIR, help="directory to read the tiles from")
+    args = parser.parse_args()
+    for name, (tile, found) in load(args.tiles).items():
+        print(name, KINDS[name], " ".join("".join(map(unruly.char, t)) for t in sorted(found)))
@@ -0,0 +1,476 @@
+#!/usr/bin/env python
+
+"""
+Compile a planar 3-SAT formula into an Unruly board
+
+The board has a solution if and only if the formula is satisfiable. It's built
+from the tiles in sat_gates.py, in the usual layout for planar 3-SAT: the
+variables sit along one row of tiles, in the order of the embedding, and each
+clause is a bar above or below that row, joined to its three variables by
+vertical legs. Bars nest without crossing, so a clause's bar goes one row of
+tiles further out than the highest bar nested inside it.
+
+In more detail, each variable is a run of wire tiles along the variable row,
+one column per leg, with a fork wherever a leg leaves. Above the variable row
+(and below it, for the clauses below) is a row of polarity tiles, which either
+copy a leg's signal or invert it, so that the signal reaching each clause is
+the one the clause tile forbids exactly when its literal is false. Legs go up
+through copy tiles to their clause's bar; the bar is a corner, wires, the
+clause tile (at the middle leg), wires, and a corner. Every other tile is
+blank, and so is a border of tiles all the way round.
+
+That grid G isn't balanced, so the board is four copies of it:
+
+  G                          G with colours swapped, reflected left to right
+  G swapped, upside down     G rotated by a half turn
+
+Each row and column then has a copy of each square and of its opposite, and
+the copies meet along blank borders, where no line of three can go wrong. A
+solution of G gives a solution of the board, and the top left quarter of a
+solution of the board is a solution of G, so the board has a solution if and
+only if the formula is satisfiable. The board has many solutions when it has
+any, so these are instances for solvers to decide, not puzzles with unique
+solutions.
+
+The board is written a row at a time. Only the layout is kept, which is a few
+numbers per literal and clause, so even formulas with millions of clauses
+never have the board in memory. Laying out a formula takes time near-linear in
+its size (sorting the legs), and writing the board takes time linear in its
+area: the number of literals times the depth to which the clauses nest.
+
+The formula is read in DIMACS CNF format. The embedding comes from comment
+lines (in the same file, or in a file of its own given by --embedding):
+
+  c order 3 1 2 4     variables from left to right (default: 1, 2, 3...)
+  c below 2 5         clauses (numbered from 1) to put below the variables
+
+with every other clause above them. Within those constraints, the legs at each
+variable are ordered so that bars nest wherever possible, and a ValueError says
+which clauses cross otherwise. To make a random planar formula instead:
+
+  sat_to_unruly.py --random 10000 --seed 1 --cnf formula.cnf > board.txt
+
+which also writes the formula and its embedding to formula.cnf, for checking
+the answer with a SAT solver.
+"""
+
+import argparse
+import random
+import sys
+
+import sat_gates
+import unruly
+import unruly_search
+from unruly import BLACK, WHITE
+
+SIZE = sat_gates.SIZE
+UP, DOWN = 0, 1
+SWAP = str.maketrans('BW', 'WB')
+
+# For each side, the tiles of a clause's bar at its first, middle and last legs,
+# and the port of each of those tiles which the leg comes in by
+BARS = {
+    UP: (('RB', 'B', 'R'), ('LRB_clause', 'B', None), ('LB', 'B', 'L')),
+    DOWN: (('RT', 'T', 'R'), ('LRT_clause', 'T', None), ('LT', 'T', 'L')),
+}
+LEG_PORT = {UP: 'T', DOWN: 'B'}
+# The port of the clause tile each leg joins it at
+CLAUSE_PORT = ('L', None, 'R')
+
+
+def read_dimacs(lines):
+    """(number of variables, clauses, order, clauses below) from DIMACS CNF
+    lines, with the embedding comments described above"""
+    variables = None
+    clauses = []
+    literals = []
+    order = None
+    below = set()
+    for line in lines:
+        words = line.split()
+        if not words or words[0] == '%':
+            continue
+        if words[0] == 'c':
+            if len(words) > 1 and words[1] == 'order':
+                order = (order or []) + [int(w) for w in words[2:]]
+            elif len(words) > 1 and words[1] == 'below':
+                below.update(int(w) for w in words[2:])
+            elif len(words) > 1 and words[1] == 'above':
+                below.difference_update(int(w) for w in words[2:])
+            continue
+        if words[0] == 'p':
+            variables = int(words[2])
+            continue
+        for word in words:
+            literal = int(word)
+            if literal:
+                literals.append(literal)
+            else:
+                clauses.append(literals)
+                literals = []
+    if literals:
+        clauses.append(literals)
+    if variables is None:
+        variables = max((abs(literal) for clause in clauses for literal in clause), default=0)
+    return variables, clauses, order, below
+
+
+def write_dimacs(f, variables, clauses, order=None, below=()):
+    f.write(f"p cnf {variables} {len(clauses)}\n")
+    if order is not None:
+        f.write("c order " + " ".join(map(str, order)) + "\n")
+    if below:
+        f.write("c below " + " ".join(map(str, sorted(below))) + "\n")
+    for clause in clauses:
+        f.write(" ".join(map(str, clause)) + " 0\n")
+
+
+class Layout:
+    """Where each tile of the board for a formula goes
+
+    The legs are numbered by column, left to right. For each leg this keeps
+    its side, clause, place in the clause (0, 1 or 2, from the left), whether
+    it's its variable's first or last leg, and its polarity tile; for each
+    clause, its columns and how far out its bar is. The polarity tiles depend
+    on the tiles' relations, so they're only chosen given tiles (from
+    sat_gates.load), which writing out the board needs too."""
+
+    def __init__(self, variables, clauses, order=None, below=(), tiles=None):
+        if order is None:
+            order = range(1, variables + 1)
+        order = list(order)
+        if sorted(order) != list(range(1, variables + 1)):
+            raise ValueError(f"The order should list variables 1 to {variables} once each")
+        position = {v: k for k, v in enumerate(order)}
+        below = set(below)
+
+        self.literals = []
+        self.clause_side = []
+        legs = []
+        for number, clause in enumerate(clauses, 1):
+            if any(abs(literal) not in position for literal in clause):
+                raise ValueError(f"Clause {number} has a variable which isn't between 1 and {variables}")
+            literals = sorted(set(clause), key=lambda literal: position[abs(literal)])
+            if not literals:
+                raise ValueError(f"Clause {number} is empty")
+            if any(-literal in literals for literal in literals):
+                continue
+            if len(literals) > 3:
+                raise ValueError(f"Clause {number} has more than three literals")
+            while len(literals) < 3:
+                literals.insert(0, literals[0])
+            c = len(self.literals)
+            side = DOWN if number in below else UP
+            self.literals.append(literals)
+            self.clause_side.append(side)
+            lo, hi = position[abs(literals[0])], position[abs(literals[2])]
+            for t, literal in enumerate(literals):
+                x = position[abs(literal)]
+                # At each variable: bars ending there (innermost first), then
+                # any middle legs, then bars starting there (outermost first)
+                if lo < x == hi:
+                    key = (0, hi - lo, -c)
+                elif x == lo < hi:
+                    key = (2, lo - hi, c)
+                else:
+                    key = (1, 0, c)
+                legs.append((x, side, key, t, c))
+        legs.sort()
+
+        self.width = len(legs)
+        self.leg_side = [side for (_, side, _, _, _) in legs]
+        self.leg_clause = [c for (_, _, _, _, c) in legs]
+        self.leg_place = [t for (_, _, _, t, _) in legs]
+        self.first = [k == 0 or legs[k - 1][0] != legs[k][0] for k in range(self.width)]
+        self.last = [k == self.width - 1 or legs[k + 1][0] != legs[k][0] for k in range(self.width)]
+        self.columns = [[None] * 3 for _ in self.literals]
+        for k, (_, _, _, t, c) in enumerate(legs):
+            self.columns[c][t] = k
+        self.variable_order = order
+        self.leg_variable = [order[x] for (x, _, _, _, _) in legs]
+
+        self.level = [0] * len(self.literals)
+        self.levels = {UP: 0, DOWN: 0}
+        for side in (UP, DOWN):
+            self.nest(side)
+        self.tiles = tiles
+        self.polarity = [None] * self.width
+        if tiles is not None:
+            self.choose_polarities()
+
+    def nest(self, side):
+        """Work out how far out each clause's bar goes, checking that no two
+        clauses on this side cross"""
+        stack = []
+        deepest = [0]
+        for k in range(self.width):
+            if self.leg_side[k] != side:
+                continue
+            c, t = self.leg_clause[k], self.leg_place[k]
+            if t == 0:
+                stack.append(c)
+                deepest.append(0)
+                continue
+            if stack[-1] != c:
+                raise ValueError(f"Clauses {self.number(c)} and {self.number(stack[-1])} cross")
+            if t == 2:
+                stack.pop()
+                self.level[c] = deepest.pop() + 1
+                deepest[-1] = max(deepest[-1], self.level[c])
+        self.levels[side] = deepest[0]
+
+    def number(self, c):
+        """A clause's literals, for error messages"""
+        return "(" + " ".join(map(str, self.literals[c])) + ")"
+
+    def diff(self, name, p, q):
+        """Whether tile name gives ports p and q opposite colours"""
+        _, found = self.tiles[name]
+        ports = sat_gates.ports_of(name)
+        t = next(iter(found))
+        return int(t[ports.index(p)] != t[ports.index(q)])
+
+    def variable_tile(self, k):
+        ports = ('' if self.first[k] else 'L') + ('' if self.last[k] else 'R') + LEG_PORT[self.leg_side[k]]
+        return ports + '_end' if len(ports) == 1 else ports
+
+    def choose_polarities(self):
+        """Pick the polarity tile of each leg, so that the clause tile sees the
+        colour it forbids exactly when the leg's literal is false
+
+        A variable's value is the colour of its first leg's port (white for
+        true); the colour of each port along a wire is that, or the opposite,
+        depending only on the tiles in between."""
+        copy = self.diff('TB', 'T', 'B')
+        offset = 0
+        for k in range(self.width):
+            name = self.variable_tile(k)
+            side = self.leg_side[k]
+            leg_port = LEG_PORT[side]
+            if self.first[k]:
+                offset = 0
+            else:
+                offset ^= self.diff(name, 'L', leg_port)
+            c, t = self.leg_clause[k], self.leg_place[k]
+            corner, corner_in, corner_out = BARS[side][t]
+            clause = BARS[side][1][0]
+            parity = offset ^ ((self.level[c] - 1) * copy & 1)
+            if t != 1:
+                parity ^= self.diff(corner, corner_in, corner_out)
+                wires = abs(self.columns[c][1] - k) - 1
+                parity ^= wires * self.diff('LR', 'L', 'R') & 1
+                port = CLAUSE_PORT[t]
+            else:
+                port = corner_in
+            literal = self.literals[c][t]
+            false = BLACK if literal > 0 else WHITE
+            ports = sat_gates.ports_of(clause)
+            forbidden = self.forbidden(clause)[ports.index(port)]
+            self.polarity[k] = 'TB' if forbidden ^ false ^ parity == copy else 'TB_not'
+            if not self.last[k]:
+                offset ^= self.diff(name, leg_port, 'R')
+
+    def forbidden(self, name):
+        _, found = self.tiles[name]
+        everything = {(a, b, c) for a in (BLACK, WHITE) for b in (BLACK, WHITE) for c in (BLACK, WHITE)}
+        (result,) = everything - found
+        return result
+
+    @property
+    def tile_rows(self):
+        return self.levels[UP] + self.levels[DOWN] + 5
+
+    @property
+    def variable_row(self):
+        return self.levels[UP] + 2
+
+    def tile_row(self, r):
+        """The names of the tiles in row r of G, from left to right"""
+        names = ['blank'] * (self.width + 2)
+        variable_row = self.variable_row
+        if r in (0, self.tile_rows - 1):
+            return names
+        if r == variable_row:
+            for k in range(self.width):
+                names[k + 1] = self.variable_tile(k)
+            return names
+        side = UP if r < variable_row else DOWN
+        level = abs(r - variable_row) - 1
+        for k in range(self.width):
+            if self.leg_side[k] == side:
+                names[k + 1] = self.polarity[k] if level == 0 else None
+        if level == 0:
+            return names
+        bar = False
+        for k in range(self.width):
+            if names[k + 1] is None:
+                c, t = self.leg_clause[k], self.leg_place[k]
+                if self.level[c] > level:
+                    names[k + 1] = 'TB'
+                    continue
+                if self.level[c] == level:
+                    names[k + 1] = BARS[side][t][0]
+                    bar = t < 2
+                    continue
+            names[k + 1] = 'LR' if bar else 'blank'
+        return names
+
+    def rows(self, reverse=False):
+        """Yield the rows of G as strings, top to bottom (or bottom to top)"""
+        text = {name: [''.join(map(unruly.char, row)) for row in tile] for name, (tile, _) in self.tiles.items()}
+        order = range(self.tile_rows)
+        for r in reversed(order) if reverse else order:
+            names = self.tile_row(r)
+            for i in reversed(range(SIZE)) if reverse else range(SIZE):
+                yield ''.join([text[name][i] for name in names])
+
+    def board_rows(self):
+        """Yield the rows of the board: G and its three copies"""
+        for row in self.rows():
+            yield row + row.translate(SWAP)[::-1]
+        for row in self.rows(reverse=True):
+            yield row.translate(SWAP) + row[::-1]
+
+    def board(self):
+        return unruly.read_board(self.board_rows())
+
+    def assignment(self, solution):
+        """{variable: True or False} read off a solution of the board"""
+        result = {v: False for v in self.variable_order}
+        for k in range(self.width):
+            if self.first[k]:
+                i, j = sat_gates.PORTS[LEG_PORT[self.leg_side[k]]][0]
+                i += SIZE * self.variable_row
+                j += SIZE * (k + 1)
+                result[self.leg_variable[k]] = solution[i][j] == WHITE
+        return result
+
+
+def random_formula(clauses, rng, ratio=3.0, depth=8):
+    """A random planar formula with about ratio clauses per variable, and bars
+    nested no more than depth deep on each side
+
+    Returns (number of variables, clauses, order, clauses below). Each side is
+    built left to right, keeping a stack of clauses still waiting for legs:
+    at each variable, some clauses waiting for their last leg get it, the
+    innermost one waiting for a middle leg might get that, and some new
+    clauses start."""
+    result = []
+    below = set()
+    stacks = {UP: [], DOWN: []}
+    started = 0
+    opening = ratio / 2 / (1 + ratio / 2)
+    x = 0
+    while started < clauses or stacks[UP] or stacks[DOWN]:
+        x += 1
+        for side, stack in stacks.items():
+            finishing = started == clauses
+            while stack and len(stack[-1]) == 2 and (finishing or rng.random() < 0.5):
+                literals = stack.pop() + [x]
+                result.append([v if rng.random() < 0.5 else -v for v in literals])
+                if side == DOWN:
+                    below.add(len(result))
+            if stack and len(stack[-1]) == 1 and (finishing or rng.random() < 0.5):
+                stack[-1].append(x)
+            while started < clauses and len(stack) < depth and rng.random() < opening:
+                stack.append([x])
+                started += 1
+    variables = x
+    order = list(range(1, variables + 1))
+    rng.shuffle(order)
+    # Rename the variables so that the k-th from the left is order[k]
+    rename = {k + 1: v for k, v in enumerate(order)}
+    result = [[rename[abs(v)] * (1 if v > 0 else -1) for v in clause] for clause in result]
+    return variables, result, order, below
+
+
+def satisfiable(variables, clauses):
+    """Brute force, for testing"""
+    import itertools
+    return any(
+        all(any((literal > 0) == values[abs(literal) - 1] for literal in clause) for clause in clauses)
+        for values in itertools.product((False, True), repeat=variables))
+
+
+def test_layout():
+    layout = Layout(3, [[1, 2, 3]])
+    assert (layout.width, layout.tile_rows, layout.variable_row) == (3, 6, 3)
+    assert layout.tile_row(1) == ['blank', 'RB', 'LRB_clause', 'LB', 'blank']
+    assert layout.tile_row(3) == ['blank', 'T_end', 'T_end', 'T_end', 'blank']
+    assert layout.tile_row(4) == ['blank'] * 5
+    # The second clause is nested inside the first, so its bar is lower
+    layout = Layout(4, [[1, 2, 4], [-4, 3, 2]])
+    assert layout.level == [2, 1]
+    assert layout.tile_row(layout.variable_row) == ['blank', 'T_end', 'RT', 'LT', 'T_end', 'RT', 'LT', 'blank']
+    assert layout.tile_row(1) == ['blank', 'RB', 'LRB_clause', 'LR', 'LR', 'LR', 'LB', 'blank']
+    assert layout.tile_row(2) == ['blank', 'TB', 'TB', 'RB', 'LRB_clause', 'LB', 'TB', 'blank']
+
+
+def test_crossing():
+    try:
+        Layout(4, [[1, 3, 4], [2, 3, 4]])
+    except ValueError as e:
+        assert 'cross' in str(e)
+    else:
+        assert False, "Crossing clauses weren't noticed"
+
+
+def test_compile():
+    tiles = sat_gates.load()
+    formulas = [
+        (3, [[1, 2, 3]], ()),
+        (3, [[1, -2, 3], [-1], [2]], {2}),
+        (3, [[1, -2, 3], [-1], [2], [-3, 2]], {2}),
+        (2, [[1, 2], [-1, 2], [1, -2], [-1, -2]], {3, 4}),
+        (1, [[1], [-1]], ()),
+    ]
+    for variables, clauses, below in formulas:
+        layout = Layout(variables, clauses, below=below, tiles=tiles)
+        board = layout.board()
+        assert len(board) == 2 * SIZE * layout.tile_rows and len(board[0]) == 2 * SIZE * (layout.width + 2)
+        solvable = unruly_search.count_solutions(board, limit=1) == 1
+        assert solvable == satisfiable(variables, clauses), clauses
+        if solvable:
+            values = layout.assignment(next(unruly_search.solutions(board)))
+            assert all(any((literal > 0) == values[abs(literal)] for literal in clause) for clause in clauses)
+
+
+def test_random_formula():
+    import io
+    variables, clauses, order, below = random_formula(200, random.Random(0), depth=3)
+    assert len(clauses) == 200 and all(len({abs(v) for v in clause}) == 3 for clause in clauses)
+    f = io.StringIO()
+    write_dimacs(f, variables, clauses, order, below)
+    assert read_dimacs(f.getvalue().splitlines()) == (variables, clauses, order, below)
+    layout = Layout(variables, clauses, order, below)
+    assert max(layout.levels.values()) <= 3
+    names = [name for r in range(layout.tile_rows) for name in layout.tile_row(r)]
+    assert names.count('LRB_clause') + names.count('LRT_clause') == len(clauses)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('formula', nargs='?', help="DIMACS CNF file (default: standard input)")
+    parser.add_argument('--embedding', help="file with the order and below comments, if not in the formula")
+    parser.add_argument('--random', type=int, metavar='CLAUSES', help="compile a random planar formula instead")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--ratio', type=float, default=3.0, help="clauses per variable, for --random")
+    parser.add_argument('--depth', type=int, default=8, help="deepest nesting of clauses, for --random")
+    parser.add_argument('--cnf', help="write the random formula and its embedding to this file")
+    parser.add_argument('--tiles', default=sat_gates.TILE_DIR, help="directory to read the tiles from")
+    args = parser.parse_args()
+    if args.random is not None:
+        variables, clauses, order, below = random_formula(args.random, random.Random(args.seed), args.ratio, args.depth)
+        if args.cnf:
+            with open(args.cnf, 'w') as f:
+                write_dimacs(f, variables, clauses, order, below)
+    else:
+        with open(args.formula) if args.formula else sys.stdin as f:
+            variables, clauses, order, below = read_dimacs(f)
+        if args.embedding:
+            with open(args.embedding) as f:
+                _, _, order, below = read_dimacs(f)
+    layout = Layout(variables, clauses, order, below, sat_gates.load(args.tiles))
+    out = sys.stdout
+    for row in layout.board_rows():
+        out.write(row + "\n")
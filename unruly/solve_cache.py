@@ -0,0 +1,312 @@
+"""
+Persistent cache of solver results, keyed by the board's symmetry class
+
+Minimisation, regeneration and reporting keep asking the same questions about
+the same boards (and boards equivalent to them under symmetry.images), so
+Cache remembers the answers in an SQLite database, with an in-process LRU
+memo in front of it. Each entry is keyed by symmetry.key of the board plus the
+name and version of the solver which produced it, and holds:
+
+ * status: solved, stuck or conflict for the tactics; solved, unsat or
+   non-unique for the exact solvers (as in unruly_batch.py)
+ * board: the propagated board, solution or minimised puzzle, if there is one
+ * count and limit: the number of solutions, where we stopped counting at
+   limit (None if we counted them all)
+ * seconds: how long the solver took
+
+Boards are stored in the orientation of the canonical representative, and
+turned back to match the board in the query, so a cached answer for a board
+also answers every rotation, reflection and colour swap of it. Once the
+database holds more than max_entries results, the least recently used ones are
+dropped.
+
+The methods propagate, lookahead, count_solutions, solve_board, solve_z3 and
+minimize_z3 are drop-in replacements for the solvers they're named after.
+"""
+
+import collections
+import sqlite3
+import time
+
+import symmetry
+import unruly
+import unruly_bitboard
+import unruly_search
+from unruly import UNKNOWN
+
+
+# Bump these when a solver changes in a way which could change its answers
+VERSIONS = {
+    'tactics': 1,
+    'lookahead': 1,
+    'search': 1,
+    'z3': 1,
+    'minimize-z3': 1,
+}
+
+Result = collections.namedtuple('Result', ['status', 'board', 'count', 'limit', 'seconds'])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key BLOB NOT NULL,
+    solver TEXT NOT NULL,
+    status TEXT NOT NULL,
+    board TEXT,
+    count INTEGER,
+    count_limit INTEGER,
+    seconds REAL,
+    used REAL NOT NULL,
+    PRIMARY KEY (key, solver)
+)
+"""
+
+
+def solver_id(solver, variant=None):
+    name = solver if variant is None else f"{solver}-{variant}"
+    return f"{name}@{VERSIONS[solver]}"
+
+
+class Cache:
+    def __init__(self, path=None, max_entries=1000000, memo_size=100000):
+        """path is the SQLite database, or None to keep results in memory only"""
+        self.db = None
+        if path is not None:
+            self.db = sqlite3.connect(str(path), timeout=60, isolation_level=None)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute(SCHEMA)
+        self.max_entries = max_entries
+        self.memo = collections.OrderedDict()
+        self.memo_size = memo_size
+        self.puts = 0
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    def lookup(self, key, solver):
+        """The Result stored for a canonical key, in the canonical orientation"""
+        result = self.memo.get((key, solver))
+        if result is not None:
+            self.memo.move_to_end((key, solver))
+            return result
+        if self.db is None:
+            return None
+        row = self.db.execute(
+            "SELECT status, board, count, count_limit, seconds FROM results WHERE key = ? AND solver = ?",
+            (key, solver)).fetchone()
+        if row is None:
+            return None
+        self.db.execute("UPDATE results SET used = ? WHERE key = ? AND solver = ?", (time.time(), key, solver))
+        status, board, count, limit, seconds = row
+        if board is not None:
+            board = unruly.read_board(board.split("\n"))
+        result = Result(status, board, count, limit, seconds)
+        self.remember(key, solver, result)
+        return result
+
+    def remember(self, key, solver, result):
+        self.memo[(key, solver)] = result
+        self.memo.move_to_end((key, solver))
+        while len(self.memo) > self.memo_size:
+            self.memo.popitem(last=False)
+
+    def store(self, key, solver, result):
+        self.remember(key, solver, result)
+        if self.db is None:
+            return
+        board = None if result.board is None else unruly.board_to_str(result.board)
+        self.db.execute(
+            "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, solver, result.status, board, result.count, result.limit, result.seconds, time.time()))
+        self.puts += 1
+        if self.puts % 1000 == 0:
+            self.evict()
+
+    def evict(self):
+        (entries,) = self.db.execute("SELECT COUNT(*) FROM results").fetchone()
+        if entries > self.max_entries:
+            self.db.execute(
+                "DELETE FROM results WHERE rowid IN (SELECT rowid FROM results ORDER BY used LIMIT ?)",
+                (entries - self.max_entries,))
+
+    def get(self, board, solver):
+        """The Result stored for a board (or any image of it), turned to match it"""
+        key, t = symmetry.canonical_form(board)
+        result = self.lookup(key, solver)
+        if result is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if result.board is not None:
+            # A copy, even for the identity, so callers can't change what's cached
+            board = symmetry.transform(result.board, symmetry.inverse(t))
+            result = result._replace(board=[row[:] for row in board])
+        return result
+
+    def put(self, board, solver, result):
+        key, t = symmetry.canonical_form(board)
+        if result.board is not None:
+            board = symmetry.transform(result.board, t)
+            result = result._replace(board=[row[:] for row in board])
+        self.store(key, solver, result)
+
+    def timed(self, board, solver, compute):
+        """Look up a board, or else call compute() to get (status, board, count,
+        limit) and store it"""
+        result = self.get(board, solver)
+        if result is None:
+            start = time.perf_counter()
+            result = Result(*compute(), seconds=time.perf_counter() - start)
+            self.put(board, solver, result)
+        return result
+
+    def propagate(self, board):
+        """Drop-in replacement for unruly.propagate, via the bitboard propagator"""
+        def compute():
+            result = [row[:] for row in board]
+            try:
+                unruly_bitboard.propagate(result)
+            except ValueError:
+                return 'conflict', None, None, None
+            status = 'stuck' if any(UNKNOWN in row for row in result) else 'solved'
+            return status, result, None, None
+        result = self.timed(board, solver_id('tactics'), compute)
+        if result.status == 'conflict':
+            raise ValueError("Conflict (the tactics break this board)")
+        for i, row in enumerate(result.board):
+            board[i][:] = row
+        return board
+
+    def lookahead(self, board):
+        """Drop-in replacement for lookahead.propagate"""
+        import lookahead
+
+        def compute():
+            result = [row[:] for row in board]
+            try:
+                lookahead.propagate(result)
+            except ValueError:
+                return 'conflict', None, None, None
+            status = 'stuck' if any(UNKNOWN in row for row in result) else 'solved'
+            return status, result, None, None
+        result = self.timed(board, solver_id('lookahead'), compute)
+        if result.status == 'conflict':
+            raise ValueError("Conflict (lookahead breaks this board)")
+        for i, row in enumerate(result.board):
+            board[i][:] = row
+        return board
+
+    def search(self, board, limit):
+        """Result from unruly_search, counting solutions up to limit"""
+        solver = solver_id('search')
+        result = self.get(board, solver)
+        if result is not None:
+            if (result.limit is None or result.count < result.limit
+                    or (limit is not None and limit <= result.limit)):
+                return result
+            # We stopped counting too soon last time, so this doesn't count as a hit
+            self.hits -= 1
+            self.misses += 1
+        start = time.perf_counter()
+        count, first = 0, None
+        for solution in unruly_search.solutions(board):
+            count += 1
+            if first is None:
+                first = solution
+            if limit is not None and count >= limit:
+                break
+        status = 'unsat' if count == 0 else 'solved' if count == 1 else 'non-unique'
+        if limit is not None and count < limit:
+            limit = None
+        result = Result(status, first, count, limit, time.perf_counter() - start)
+        self.put(board, solver, result)
+        return result
+
+    def count_solutions(self, board, limit=None):
+        """Drop-in replacement for unruly_search.count_solutions"""
+        count = self.search(board, limit).count
+        return count if limit is None else min(count, limit)
+
+    def solve_board(self, board):
+        """Drop-in replacement for unruly_search.solve_board (without exclusions)"""
+        return self.search(board, 1).board
+
+    def solve_z3(self, board, encoding=None):
+        """Drop-in replacement for minimize_z3.solve_board (without exclusions)"""
+        from minimize_z3 import solve_board
+        from z3_encoding import DEFAULT_ENCODING
+        if encoding is None:
+            encoding = DEFAULT_ENCODING
+
+        def compute():
+            solution = solve_board(board, encoding=encoding)
+            if solution is None:
+                return 'unsat', None, 0, 1
+            return 'solved', solution, 1, 1
+        return self.timed(board, solver_id('z3', encoding), compute).board
+
+    def minimize_z3(self, board, encoding=None):
+        """Drop-in replacement for minimize_z3.minimize_incremental, which also
+        finds the solution
+
+        Equivalent boards give equivalent minimised puzzles, though not always
+        the ones minimize_incremental would give, since it removes clues in
+        row-major order."""
+        from minimize_z3 import minimize_incremental
+        from z3_encoding import DEFAULT_ENCODING
+        if encoding is None:
+            encoding = DEFAULT_ENCODING
+
+        def compute():
+            solution = self.solve_z3(board, encoding)
+            if solution is None:
+                return 'unsat', None, 0, 1
+            return 'solved', minimize_incremental([row[:] for row in board], solution, encoding), 1, 1
+        result = self.timed(board, solver_id('minimize-z3', encoding), compute)
+        if result.board is None:
+            raise ValueError("No solution")
+        return result.board
+
+
+def test_cache(tmp_path):
+    with open('found/6x6') as f:
+        board = unruly.read_board(f.readlines())
+    cache = Cache(tmp_path / 'cache.sqlite')
+    assert cache.count_solutions(board, limit=2) == 1
+    assert cache.misses == 1
+    solution = unruly_search.solve_board(board)
+    # Every image of the board is answered from the cache, turned the right way
+    for t, image in enumerate(symmetry.images(board)):
+        assert cache.solve_board(image) == symmetry.transform(solution, t)
+    assert cache.misses == 1
+    # Changing an answer doesn't change the cache, even for the canonical image
+    _, t = symmetry.canonical_form(board)
+    canonical = symmetry.transform(board, t)
+    cache.solve_board(canonical)[0][0] = UNKNOWN
+    assert cache.solve_board(canonical) == symmetry.transform(solution, t)
+    cache.close()
+    # ...including by a new Cache, from disk
+    cache = Cache(tmp_path / 'cache.sqlite')
+    assert cache.count_solutions(symmetry.rotate(board)) == 1
+    assert cache.hits == 1
+    # A count capped at a lower limit isn't good enough for a higher one
+    empty = [[UNKNOWN] * 4 for _ in range(4)]
+    assert cache.count_solutions(empty, limit=2) == 2
+    assert cache.count_solutions(empty) == 90
+    assert cache.count_solutions(empty, limit=5) == 5
+    assert cache.misses == 2
+    assert cache.propagate([row[:] for row in board]) == unruly.propagate([row[:] for row in board])
+
+
+def test_eviction(tmp_path):
+    cache = Cache(tmp_path / 'cache.sqlite', max_entries=10, memo_size=5)
+    for k in range(1000):
+        board = [[(k >> (i * 4 + j)) & 1 for j in range(4)] for i in range(4)]
+        cache.put(board, 'test', Result('solved', board, 1, None, 0.0))
+    assert len(cache.memo) == 5
+    (entries,) = cache.db.execute("SELECT COUNT(*) FROM results").fetchone()
+    assert entries == 10
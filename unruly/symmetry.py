@@ -0,0 +1,212 @@
+"""
+Symmetries of Unruly boards
+
+The rules of Unruly don't change if you rotate or reflect the board, or swap
+black and white, so every board belongs to a family of up to 16 equivalent
+boards. canonical() picks one representative of each family, so that it can be
+used to deduplicate puzzles; key() does the same job faster, using NumPy, and
+canonical_form() also says which symmetry takes a board to its representative.
+A single row or column has only four symmetries (reversing it and swapping
+colours): see line_images() and line_key().
+
+Rather than finding equivalent boards after the fact, a search can look only
+for the least board in each family (in row-major order, with BLACK < WHITE <
+UNKNOWN). lex_leader() gives the Z3 constraints for this, and
+symmetry_breaking.mzn the MiniZinc ones.
+"""
+
+import numpy as np
+
+import unruly
+from unruly import BLACK, WHITE, UNKNOWN
+
+
+def rotate(board):
+    """Rotate a board a quarter turn clockwise"""
+    return [list(row) for row in zip(*board[::-1])]
+
+
+def reflect(board):
+    return [row[::-1] for row in board]
+
+
+def swap_colour(c):
+    return c if c == UNKNOWN else 1 - c
+
+
+def swap_colours(board):
+    swap = {BLACK: WHITE, WHITE: BLACK, UNKNOWN: UNKNOWN}
+    return [[swap[c] for c in row] for row in board]
+
+
+def rotations_and_reflections(board):
+    """The 8 images of a board (of anything) under rotation and reflection"""
+    result = []
+    for _ in range(4):
+        result.append(board)
+        result.append(reflect(board))
+        board = rotate(board)
+    return result
+
+
+def images(board):
+    """All 16 images of a board under rotation, reflection and colour swap
+
+    Symmetric boards will appear more than once. Image t is colour-swapped if
+    t >= 8."""
+    return rotations_and_reflections(board) + rotations_and_reflections(swap_colours(board))
+
+
+def transform(board, t):
+    """Image t of a board, as numbered by images()"""
+    if t >= 8:
+        board = swap_colours(board)
+    return rotations_and_reflections(board)[t % 8]
+
+
+def inverse(t):
+    """The image number which undoes transform(board, t)"""
+    index = [[(i, j) for j in range(3)] for i in range(3)]
+    image = rotations_and_reflections(index)[t % 8]
+    for u in range(8):
+        if rotations_and_reflections(image)[u] == index:
+            return u + (t & 8)
+
+
+def canonical(board):
+    """The same string for every board in a family of equivalent boards"""
+    return min(unruly.board_to_str(b) for b in images(board))
+
+
+def array_images(a):
+    """images() for a NumPy array of boards, along its last two axes"""
+    result = []
+    for b in (a, np.where(a == UNKNOWN, a, 1 - a).astype(a.dtype)):
+        for _ in range(4):
+            result.append(b)
+            result.append(b[..., ::-1])
+            b = np.rot90(b, -1, axes=(-2, -1))
+    return result
+
+
+def shape_prefix(shape):
+    return f"{shape[-2]}x{shape[-1]}:".encode()
+
+
+def canonical_form(board):
+    """Return (key, t): key() of the board, and the index in images() of the
+    image it came from"""
+    a = np.asarray(board, dtype=np.uint8)
+    return min(
+        (shape_prefix(image.shape) + image.tobytes(), t)
+        for t, image in enumerate(array_images(a))
+    )
+
+
+def key(board):
+    """The same bytes for every board in a family of equivalent boards"""
+    return canonical_form(board)[0]
+
+
+def keys(boards):
+    """key() of every board in an (N, rows, cols) array"""
+    boards = np.asarray(boards, dtype=np.uint8)
+    flat = [
+        (shape_prefix(image.shape), np.ascontiguousarray(image).reshape(len(boards), -1))
+        for image in array_images(boards)
+    ]
+    return [min(prefix + image[k].tobytes() for prefix, image in flat) for k in range(len(boards))]
+
+
+def line_images(line):
+    """The 4 images of a row or column: itself, reversed, colour-swapped, both"""
+    line = list(line)
+    swapped = [swap_colour(c) for c in line]
+    return [line, line[::-1], swapped, swapped[::-1]]
+
+
+def line_key(line):
+    return min(tuple(image) for image in line_images(line))
+
+
+def line_keys(lines):
+    """line_key() of every line in an (N, length) array, as integers"""
+    lines = np.asarray(lines, dtype=np.int64)
+    swapped = np.where(lines == UNKNOWN, lines, 1 - lines)
+    powers = 3 ** np.arange(lines.shape[-1], dtype=np.int64)[::-1]
+    return np.min([
+        image @ powers for image in (lines, lines[:, ::-1], swapped, swapped[:, ::-1])
+    ], axis=0)
+
+
+def lex_leader(grid, cells=None):
+    """Z3 constraints that grid is the least of its images
+
+    Compares the first cells squares in row-major order (all of them by
+    default), with BLACK < WHITE < UNKNOWN. Adding these to a search over grids
+    whose constraints are symmetric keeps exactly one grid from each family."""
+    # Imported here so that deduplicating boards doesn't need Z3
+    from z3 import And, BoolVal, Implies, Not, Or
+    size = grid.size
+    order = [(i, j) for i in range(size) for j in range(size)][:cells]
+    colours = range(grid.states)
+    index = [[(i, j) for j in range(size)] for i in range(size)]
+    coordinates = rotations_and_reflections(index)
+    constraints = []
+    for t in range(1, 16):
+        source, swap = coordinates[t % 8], t >= 8
+
+        def image_has(i, j, c):
+            ii, jj = source[i][j]
+            return grid.has(ii, jj, swap_colour(c) if swap else c)
+
+        equal_so_far = BoolVal(True)
+        for (i, j) in order:
+            # grid[i][j] <= image[i][j]
+            constraints.append(Implies(equal_so_far, And(*(
+                Not(And(grid.has(i, j, c), image_has(i, j, d)))
+                for c in colours for d in colours if c > d
+            ))))
+            equal_so_far = And(equal_so_far, Or(*(
+                And(grid.has(i, j, c), image_has(i, j, c)) for c in colours
+            )))
+    return constraints
+
+
+def test_canonical():
+    with open('found/6x6') as f:
+        board = unruly.read_board(f.readlines())
+    assert len({unruly.board_to_str(b) for b in images(board)}) == 16
+    for b in images(board):
+        assert canonical(b) == canonical(board)
+        assert key(b) == key(board)
+    assert canonical(rotate(board)) != canonical(board[1:] + board[:1])
+    assert key(rotate(board)) != key(board[1:] + board[:1])
+    # canonical_form says which image is the representative
+    k, t = canonical_form(board)
+    assert key(images(board)[t]) == k == shape_prefix((6, 6)) + bytes(sum(images(board)[t], []))
+    assert keys(images(board) + [board[1:] + board[:1]]) == [k] * 16 + [key(board[1:] + board[:1])]
+    assert len({line_key(image) for image in line_images(board[0])}) == 1
+    lines = [board[0], board[0][::-1], board[1]]
+    assert line_keys(lines).tolist()[:2] == [line_keys([line_key(board[0])])[0]] * 2
+    for t in range(16):
+        assert transform(board, t) == images(board)[t]
+        assert transform(transform(board, t), inverse(t)) == board
+
+
+def test_lex_leader():
+    from z3 import Not, Or, Solver, sat
+    from z3_encoding import ENCODINGS, make_grid
+    families = {key(np.array(b).reshape(2, 2)) for b in np.ndindex(3, 3, 3, 3)}
+    for encoding in ENCODINGS:
+        grid = make_grid(encoding, 'grid', 2, states=3)
+        s = Solver()
+        s.add(grid.domain())
+        s.add(lex_leader(grid))
+        found = []
+        while s.check() == sat:
+            board = grid.board(s.model())
+            found.append(key(board))
+            s.add(Or(*(Not(grid.has(i, j, c)) for i, row in enumerate(board) for j, c in enumerate(row))))
+        # Exactly one board from each family
+        assert sorted(found) == sorted(families), encoding
@@ -18,21 +18,27 @@ solver does not guess or backtrack, and so there may be Unruly boards with uniqu
 solutions which it can't solve.
 """
 
+import argparse
 import fileinput
 from pathlib import Path
 
+import instrument
+
 
 BLACK = 0
 WHITE = 1
 UNKNOWN = 2
 
 
+ENUMS = {
+    '_': UNKNOWN,
+    'B': BLACK,
+    'W': WHITE,
+}
+
+
 def char_to_enum(c):
-    return {
-            '_': UNKNOWN,
-            'B': BLACK,
-            'W': WHITE
-            }[c]
+    return ENUMS[c]
 
 
 def other(c):
@@ -45,7 +51,7 @@ def other(c):
 
 
 def read_board(lines):
-    return [[char_to_enum(c) for c in line.rstrip("\n")] for line in lines]
+    return [[ENUMS[c] for c in line.rstrip("\n")] for line in lines]
 
 
 def char(e):
@@ -157,39 +163,70 @@ def complete_line(line, i):
     return []
 
 
+PROPAGATORS = [
+    two_in_a_row,
+    fill_in_holes,
+    complete_line,
+]
+
+
 def all_updates(board, i, j):
-    propagators = [
-            two_in_a_row,
-            fill_in_holes,
-            complete_line,
-        ]
     updates = []
     row = board[i]
     col = [r[j] for r in board]
-    for p in propagators:
+    for p in PROPAGATORS:
         updates.extend([(c, i, jj) for (c, jj) in p(row, j)])
         updates.extend([(c, ii, j) for (c, ii) in p(col, i)])
     return updates
 
 
-def propagate(board):
+def updates_by_tactic(board, i, j, stats):
+    """all_updates, as a list of (tactic name, updates), timing each tactic"""
+    row = board[i]
+    col = [r[j] for r in board]
+    result = []
+    for p in PROPAGATORS:
+        with stats.timer(p.__name__):
+            updates = [(c, i, jj) for (c, jj) in p(row, j)] + [(c, ii, j) for (c, ii) in p(col, i)]
+        stats.count(f"{p.__name__} updates", len(updates))
+        result.append((p.__name__, updates))
+    return result
+
+
+def propagate(board, stats=None):
+    """Apply the tactics until nothing changes, filling in board
+
+    stats is an optional instrument.Stats, which gets the number of frontier
+    pops, and for each tactic the time it takes, how many updates it suggests
+    and how many squares it fills in, with a 'fill' event for each square."""
     frontier = [(i, j)
             for i in range(len(board)) for j in range(len(board[i]))
             if board[i][j] != UNKNOWN]
+    pops = 0
     while len(frontier) > 0:
         (i, j) = frontier.pop(0)
-        for (c, ii, jj) in all_updates(board, i, j):
-            if ii < 0 or ii >= len(board):
-                continue
-            elif jj < 0 or jj >= len(board[ii]):
-                continue
-            elif board[ii][jj] == c:
-                continue
-            elif board[ii][jj] == UNKNOWN:
-                board[ii][jj] = c
-                frontier.append((ii, jj))
-            else:
-                raise ValueError(f"""
+        if stats is None:
+            tactics = [(None, all_updates(board, i, j))]
+        else:
+            pops += 1
+            stats.count("frontier pops")
+            tactics = updates_by_tactic(board, i, j, stats)
+        for tactic, updates in tactics:
+            for (c, ii, jj) in updates:
+                if ii < 0 or ii >= len(board):
+                    continue
+                elif jj < 0 or jj >= len(board[ii]):
+                    continue
+                elif board[ii][jj] == c:
+                    continue
+                elif board[ii][jj] == UNKNOWN:
+                    board[ii][jj] = c
+                    frontier.append((ii, jj))
+                    if stats is not None:
+                        stats.count(f"{tactic} filled")
+                        stats.event('fill', tactic=tactic, square=[ii, jj], colour=char(c), source=[i, j], pop=pops)
+                else:
+                    raise ValueError(f"""
 Conflict at {(ii, jj)}!
 
 Update from {(i, j)} implies should be {char(c)}, but is already {char(board[ii][jj])}.
@@ -215,7 +252,38 @@ def test_solutions():
         assert solution == expected, infile
 
 
+def test_stats():
+    import instrument
+    with open(Path('test_data') / 'board1') as f:
+        board = read_board(f.readlines())
+    events = []
+    stats = instrument.Stats(trace=lambda name, fields: events.append(fields))
+    solution = propagate([row[:] for row in board], stats)
+    assert solution == propagate([row[:] for row in board])
+    filled = sum(c != UNKNOWN for row in solution for c in row) - sum(c != UNKNOWN for row in board for c in row)
+    counters = stats.counters
+    assert sum(counters.get(f"{p.__name__} filled", 0) for p in PROPAGATORS) == len(events) == filled
+    assert counters["frontier pops"] == sum(c != UNKNOWN for row in solution for c in row)
+    assert stats.timers['two_in_a_row'][0] == counters["frontier pops"]
+
+
 if __name__ == '__main__':
-    board = read_board(fileinput.input())
-    board = propagate(board)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('files', nargs='*')
+    parser.add_argument('--cache', help="SQLite database of results to consult and extend (see solve_cache.py)")
+    parser.add_argument('--lookahead', action='store_true',
+                        help="when the tactics get stuck, carry on by probing squares (see lookahead.py)")
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    board = read_board(fileinput.input(args.files))
+    stats = instrument.from_args(args)
+    if args.cache is None:
+        board = propagate(board, stats)
+    else:
+        import solve_cache
+        board = solve_cache.Cache(args.cache).propagate(board)
+    if args.lookahead:
+        import lookahead
+        board = lookahead.propagate(board)
     print(board_to_str(board))
+    instrument.finish(stats, args)
@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+
+"""
+Run one of the Unruly solvers over a stream of boards in a single process
+
+Each of unruly.py, unruly_z3.py, minimize_z3.py and board_to_dzn.py reads one
+board and prints one result, so grading lots of boards that way spends most of
+its time starting Python and importing Z3. This reads any number of boards,
+either as plain text separated by blank lines or as JSON lines (a list of row
+strings, a single string with newlines, or an object with a "board" key), and
+hands them out to a pool of worker processes. Only a bounded number of boards
+are in flight at once, so the input can be arbitrarily long, and results are
+written in input order as soon as they're ready, as JSON lines:
+
+  {"index": 0, "status": "solved", "time": 0.0012, "board": "WBBW\\n..."}
+
+The status is one of:
+
+ * solved: the tactics (with lookahead, for the lookahead solver) solved the
+   board, or it has exactly one solution
+ * stuck: the tactics reached a fixpoint with unknown squares left
+ * conflict: the tactics found the board is broken
+ * unsat: the board has no solution
+ * non-unique: the board has more than one solution
+ * converted: the board was converted to MiniZinc data (the dzn solver)
+ * error: the board couldn't be read or the solver failed
+"""
+
+import argparse
+import collections
+import json
+import multiprocessing
+import sys
+import time
+from pathlib import Path
+
+import unruly
+import unruly_bitboard
+from unruly import UNKNOWN
+
+
+def solve_tactics(board, cache=None):
+    # Same tactics as unruly.propagate, but faster, and it catches every conflict
+    propagate = unruly_bitboard.propagate if cache is None else cache.propagate
+    try:
+        board = propagate(board)
+    except ValueError:
+        return 'conflict', board
+    if any(UNKNOWN in row for row in board):
+        return 'stuck', board
+    return 'solved', board
+
+
+def solve_lookahead(board, cache=None):
+    import lookahead
+    propagate = lookahead.propagate if cache is None else cache.lookahead
+    try:
+        board = propagate(board)
+    except ValueError:
+        return 'conflict', board
+    if any(UNKNOWN in row for row in board):
+        return 'stuck', board
+    return 'solved', board
+
+
+def solve_search(board, cache=None):
+    if cache is not None:
+        result = cache.search(board, 2)
+        return result.status, board if result.board is None else result.board
+    import unruly_search
+    solutions = []
+    for solution in unruly_search.solutions(board):
+        solutions.append(solution)
+        if len(solutions) > 1:
+            return 'non-unique', solutions[0]
+    if not solutions:
+        return 'unsat', board
+    return 'solved', solutions[0]
+
+
+def solve_z3(board, cache=None):
+    # Only import Z3 if we need it: it takes longer to import than the tactics
+    # take to solve thousands of boards
+    from minimize_z3 import solve_board
+    solution = solve_board(board) if cache is None else cache.solve_z3(board)
+    if solution is None:
+        return 'unsat', board
+    if solve_board(board, exclusions=[solution]) is not None:
+        return 'non-unique', solution
+    return 'solved', solution
+
+
+def solve_minimize(board, cache=None):
+    import unruly_search
+    status, solution = solve_search(board, cache)
+    if status != 'solved':
+        return status, board
+    if cache is None:
+        return 'solved', unruly_search.minimize(board)
+    return 'solved', unruly_search.minimize(board, count=cache.count_solutions)
+
+
+def solve_dzn(board, cache=None):
+    rows = unruly.board_to_str(board).split("\n")
+    return 'converted', f"n = {len(rows[0]) // 2};\npuzzle = \n{unruly.board_to_minizinc(rows)}"
+
+
+SOLVERS = {
+    'tactics': solve_tactics,
+    'lookahead': solve_lookahead,
+    'search': solve_search,
+    'z3': solve_z3,
+    'minimize': solve_minimize,
+    'dzn': solve_dzn,
+}
+
+
+def read_boards(lines):
+    """Yield each board in a stream, as a list of row strings"""
+    rows = []
+    for line in lines:
+        line = line.strip()
+        if line[:1] in ('[', '{', '"'):
+            if rows:
+                yield rows
+                rows = []
+            record = json.loads(line)
+            if isinstance(record, dict):
+                record = record['board']
+            if isinstance(record, str):
+                record = record.split("\n")
+            yield [row if isinstance(row, str) else unruly.board_to_str([row]) for row in record]
+        elif line:
+            rows.append(line)
+        elif rows:
+            yield rows
+            rows = []
+    if rows:
+        yield rows
+
+
+def read_files(files):
+    """Yield each board in each of files (or stdin, if there aren't any)
+
+    A board never runs on from the end of one file into the next."""
+    if not files:
+        yield from read_boards(sys.stdin)
+    for name in files:
+        with open(name) as f:
+            yield from read_boards(f)
+
+
+caches = {}
+
+
+def get_cache(path):
+    """One solve_cache.Cache per path per process"""
+    if path not in caches:
+        import solve_cache
+        caches[path] = solve_cache.Cache(path)
+    return caches[path]
+
+
+def solve_one(solver, rows, cache=None):
+    """Solve a board given as row strings, returning (status, result, seconds)
+
+    cache is the path of a solve_cache database to consult, if any."""
+    start = time.perf_counter()
+    try:
+        board = unruly.read_board(rows)
+        status, result = SOLVERS[solver](board, None if cache is None else get_cache(cache))
+    except Exception as e:
+        return 'error', f"{type(e).__name__}: {e}", time.perf_counter() - start
+    if not isinstance(result, str):
+        result = unruly.board_to_str(result)
+    return status, result, time.perf_counter() - start
+
+
+def batch(boards, solver='tactics', workers=1, in_flight=None, cache=None):
+    """Yield a result dict for each board in boards (row strings), in order
+
+    With more than one worker, at most in_flight boards (by default four per
+    worker) are handed out at a time."""
+    if workers <= 1:
+        for index, rows in enumerate(boards):
+            status, result, seconds = solve_one(solver, rows, cache)
+            yield dict(index=index, status=status, time=seconds, board=result)
+        return
+    if in_flight is None:
+        in_flight = 4 * workers
+    pending = collections.deque()
+    with multiprocessing.Pool(workers) as pool:
+        for index, rows in enumerate(boards):
+            if len(pending) >= in_flight:
+                yield result_dict(*pending.popleft())
+            pending.append((index, pool.apply_async(solve_one, (solver, rows, cache))))
+        while pending:
+            yield result_dict(*pending.popleft())
+
+
+def result_dict(index, async_result):
+    status, result, seconds = async_result.get()
+    return dict(index=index, status=status, time=seconds, board=result)
+
+
+def test_read_boards():
+    lines = ["_BB_\n", "____\n", "\n", "\n", "W___\n", "___B\n",
+             '["B_", "_W"]\n', '{"board": "BW\\nWB"}\n', "[[0, 2], [2, 1]]\n"]
+    assert list(read_boards(lines)) == [
+        ["_BB_", "____"], ["W___", "___B"], ["B_", "_W"], ["BW", "WB"], ["B_", "_W"]]
+
+
+def test_batch():
+    boards, expected = [], []
+    for path in sorted(Path('test_data').glob('board?')):
+        with path.open() as f:
+            boards.append(f.read().split())
+        with path.with_suffix('.soln').open() as f:
+            expected.append(f.read().strip())
+    boards.append(['____'] * 4)
+    boards.append(['BBB_'] + ['____'] * 3)
+    for workers in (1, 2):
+        results = list(batch(boards, 'search', workers=workers, in_flight=2))
+        assert [r['index'] for r in results] == list(range(len(boards)))
+        assert [r['status'] for r in results] == ['solved'] * len(expected) + ['non-unique', 'unsat']
+        assert [r['board'] for r in results[:len(expected)]] == expected
+    for solver in ('tactics', 'lookahead'):
+        statuses = [r['status'] for r in batch(boards, solver)]
+        assert statuses[-2:] == ['stuck', 'conflict'], solver
+
+
+def test_cache(tmp_path):
+    boards = [['____'] * 4, ['BBB_'] + ['____'] * 3, ['_BB_'] + ['____'] * 3]
+    for solver in ('tactics', 'lookahead', 'search', 'minimize'):
+        expected = list(batch(boards, solver))
+        for _ in range(2):
+            results = list(batch(boards, solver, cache=tmp_path / 'cache.sqlite'))
+            assert [(r['status'], r['board']) for r in results] == [(r['status'], r['board']) for r in expected]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('files', nargs='*')
+    parser.add_argument('--solver', choices=SOLVERS, default='tactics')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--in-flight', type=int, help="boards handed out at once (default: 4 per worker)")
+    parser.add_argument('--cache', help="SQLite database of results to consult and extend (see solve_cache.py)")
+    args = parser.parse_args()
+    for result in batch(read_files(args.files), args.solver, args.workers, args.in_flight, args.cache):
+        print(json.dumps(result), flush=True)
@@ -0,0 +1,350 @@
+#!/usr/bin/env python
+
+"""
+Bitboard version of the tactical solver in unruly.py
+
+Every row and column is stored as a pair of integer bitmasks (one for the black
+squares and one for the white squares), so the four tactics can be applied to a
+whole line at once:
+
+ * _BB_ -> WBBW and B_B -> BWB are shifts and ANDs of a line's colour mask
+ * the n and n-1 tactics are popcounts, plus an interval intersection of the
+   places where a line of three could still go
+
+Only lines which have changed since they were last examined are re-examined,
+so there's no re-slicing of columns and no O(n) list pops. The result is the
+same board, and the same ValueError on a conflict, as unruly.propagate. The one
+difference is that unruly.propagate only notices a conflict when two tactics
+disagree within the same update, and otherwise can return a board which breaks
+the rules; this version raises the ValueError in that case too.
+
+Propagator is a BitBoard which keeps an undo trail, for search drivers and
+clue-removal loops: assign() fills in one square and re-propagates only from
+its row and column, and retract() undoes the last assign() and everything it
+forced.
+"""
+
+import fileinput
+from collections import deque
+from pathlib import Path
+
+import unruly
+from unruly import BLACK, WHITE, UNKNOWN
+
+
+def bits(mask):
+    """Yield the index of every set bit in mask"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def caps(mask, full):
+    """Squares which must be the other colour because of pairs or gaps in mask"""
+    pairs = mask & (mask >> 1)
+    gaps = (mask << 1) & (mask >> 1)
+    return ((pairs << 2) | (pairs >> 1) | gaps) & full
+
+
+def triple_intersection(free):
+    """Squares common to every line of three which fits into free
+
+    Returns None if there's nowhere a line of three could go."""
+    starts = free & (free >> 1) & (free >> 2)
+    if not starts:
+        return None
+    first = (starts & -starts).bit_length() - 1
+    last = starts.bit_length() - 1
+    if last > first + 2:
+        return 0
+    return ((1 << (first + 3)) - 1) & ~((1 << last) - 1)
+
+
+def line_updates(black, white, length):
+    """Apply the four tactics to a single line
+
+    Returns a pair of masks (must_be_black, must_be_white). The pair and gap
+    tactics are also applied to filled squares, so a mask which disagrees with
+    the line means that the line can't be completed."""
+    n = length // 2
+    full = (1 << length) - 1
+    unknown = full & ~(black | white)
+    must_be_black = caps(white, full)
+    must_be_white = caps(black, full)
+    whites = white.bit_count()
+    blacks = black.bit_count()
+    if n and whites > n:
+        return white, must_be_white
+    if n and blacks > n:
+        return must_be_black, black
+    # Same order of precedence as unruly.complete_line
+    if whites == n:
+        must_be_black |= unknown
+    elif blacks == n:
+        must_be_white |= unknown
+    elif whites == n - 1:
+        possible_whites = triple_intersection(full & ~white)
+        if possible_whites is not None:
+            must_be_black |= unknown & ~possible_whites
+    elif blacks == n - 1:
+        possible_blacks = triple_intersection(full & ~black)
+        if possible_blacks is not None:
+            must_be_white |= unknown & ~possible_blacks
+    return must_be_black, must_be_white
+
+
+class Conflict(ValueError):
+    """The ValueError raised when the tactics find a conflict
+
+    Search drivers raise and catch these in their inner loops, so the message,
+    which shows the whole board, is only built when it's asked for."""
+
+    def __init__(self, square, kind, index, c, current, black, white, cols):
+        super().__init__(square, kind, index, c, current, black, white, cols)
+
+    def __str__(self):
+        square, kind, index, c, current, black, white, cols = self.args
+        board = [[BLACK if b >> j & 1 else WHITE if w >> j & 1 else UNKNOWN for j in range(cols)]
+                 for b, w in zip(black, white)]
+        return f"""
+Conflict at {square}!
+
+Update from {kind} {index} implies should be {unruly.char(c)}, but is already {unruly.char(current)}.
+
+Full board:
+{unruly.board_to_str(board)}"""
+
+
+class BitBoard:
+    """A partial Unruly board stored as row and column bitmasks
+
+    Lines 0 to rows - 1 are the rows, and lines rows to rows + cols - 1 are the
+    columns. Bit j of a row mask is square j of that row, and bit i of a column
+    mask is square i of that column."""
+
+    def __init__(self, rows, cols, updates=line_updates):
+        """updates is the function which finds the squares a line forces, such
+        as line_tables.line_updates for line-at-a-time reasoning"""
+        self.rows = rows
+        self.cols = cols
+        self.updates = updates
+        self.lengths = [cols] * rows + [rows] * cols
+        self.black = [0] * (rows + cols)
+        self.white = [0] * (rows + cols)
+        self.dirty = deque()
+        self.queued = [False] * (rows + cols)
+
+    @classmethod
+    def from_board(cls, board, updates=line_updates):
+        bb = cls(len(board), len(board[0]) if board else 0, updates)
+        for i, row in enumerate(board):
+            for j, c in enumerate(row):
+                if c != UNKNOWN:
+                    bb.set(i, j, c)
+        return bb
+
+    def get(self, i, j):
+        if self.black[i] >> j & 1:
+            return BLACK
+        if self.white[i] >> j & 1:
+            return WHITE
+        return UNKNOWN
+
+    def set(self, i, j, c):
+        """Fill in square (i, j) and mark its row and column for re-examination"""
+        col = self.rows + j
+        if c == BLACK:
+            self.black[i] |= 1 << j
+            self.black[col] |= 1 << i
+        else:
+            self.white[i] |= 1 << j
+            self.white[col] |= 1 << i
+        self.mark(i)
+        self.mark(col)
+
+    def mark(self, line):
+        if not self.queued[line]:
+            self.queued[line] = True
+            self.dirty.append(line)
+
+    def square(self, line, k):
+        """Convert square k of a line to board coordinates"""
+        if line < self.rows:
+            return line, k
+        return k, line - self.rows
+
+    def to_board(self):
+        return [[self.get(i, j) for j in range(self.cols)] for i in range(self.rows)]
+
+    def conflict(self, line, k, c):
+        i, j = self.square(line, k)
+        kind = "row" if line < self.rows else "column"
+        index = line if line < self.rows else line - self.rows
+        return Conflict((i, j), kind, index, c, self.get(i, j), self.black[:self.rows], self.white[:self.rows],
+                        self.cols)
+
+    def propagate(self):
+        """Apply the tactics to every marked line until a fixpoint is reached"""
+        while self.dirty:
+            line = self.dirty.popleft()
+            self.queued[line] = False
+            black, white = self.black[line], self.white[line]
+            must_be_black, must_be_white = self.updates(black, white, self.lengths[line])
+            clash = must_be_black & (white | must_be_white)
+            if clash:
+                raise self.conflict(line, next(bits(clash)), BLACK)
+            clash = must_be_white & black
+            if clash:
+                raise self.conflict(line, next(bits(clash)), WHITE)
+            for k in bits(must_be_black & ~black):
+                self.set(*self.square(line, k), BLACK)
+            for k in bits(must_be_white & ~white):
+                self.set(*self.square(line, k), WHITE)
+        return self
+
+    def solved(self):
+        return all(
+            (self.black[i] | self.white[i]).bit_count() == self.cols
+            for i in range(self.rows)
+        )
+
+
+class Propagator(BitBoard):
+    """A BitBoard which can be changed one square at a time
+
+    Every filled square goes onto a trail, so that assign() only re-examines the
+    lines affected by the change, and retract() can undo everything since the
+    matching assign() without copying the board. Squares from the original
+    board are below the first checkpoint, and can't be retracted."""
+
+    def __init__(self, rows, cols, updates=line_updates):
+        super().__init__(rows, cols, updates)
+        # (i, j, forced) for every filled square, in the order they were filled
+        self.trail = []
+        self.checkpoints = []
+
+    @classmethod
+    def from_board(cls, board, updates=line_updates):
+        p = cls(len(board), len(board[0]) if board else 0, updates)
+        for i, row in enumerate(board):
+            for j, c in enumerate(row):
+                if c != UNKNOWN:
+                    p.set(i, j, c, forced=False)
+        return p
+
+    def set(self, i, j, c, forced=True):
+        super().set(i, j, c)
+        self.trail.append((i, j, forced))
+
+    def unset(self, i, j):
+        col = self.rows + j
+        self.black[i] &= ~(1 << j)
+        self.white[i] &= ~(1 << j)
+        self.black[col] &= ~(1 << i)
+        self.white[col] &= ~(1 << i)
+
+    def assign(self, i, j, c):
+        """Fill in square (i, j) and propagate the consequences
+
+        Sets a checkpoint first, so a later retract() undoes both the assignment
+        and everything it forced. If the tactics find a conflict, the ValueError
+        is raised with the board part-way through propagation, and retract()
+        should be called to clean up."""
+        self.checkpoints.append(len(self.trail))
+        current = self.get(i, j)
+        if current == c:
+            return self
+        if current != UNKNOWN:
+            raise self.conflict(i, j, c)
+        self.set(i, j, c, forced=False)
+        return self.propagate()
+
+    def retract(self):
+        """Undo everything since the most recent checkpoint"""
+        mark = self.checkpoints.pop()
+        while len(self.trail) > mark:
+            i, j, _ = self.trail.pop()
+            self.unset(i, j)
+        for line in self.dirty:
+            self.queued[line] = False
+        self.dirty.clear()
+        return self
+
+    def forced(self):
+        """Squares filled in by the tactics rather than given or assigned"""
+        return [(i, j, self.get(i, j)) for (i, j, forced) in self.trail if forced]
+
+
+def propagate(board):
+    """Drop-in replacement for unruly.propagate"""
+    result = BitBoard.from_board(board).propagate().to_board()
+    for i, row in enumerate(result):
+        board[i][:] = row
+    return board
+
+
+def test_line_updates():
+    line = [unruly.char_to_enum(c) for c in 'BWWBWB__BWWB_W']
+    black = sum(1 << j for j, c in enumerate(line) if c == BLACK)
+    white = sum(1 << j for j, c in enumerate(line) if c == WHITE)
+    unknown = ((1 << len(line)) - 1) & ~(black | white)
+    must_be_black, must_be_white = line_updates(black, white, len(line))
+    assert (must_be_black & unknown, must_be_white & unknown) == (1 << 12, 0)
+
+
+def test_matches_unruly():
+    paths = sorted(Path('test_data').glob('board?')) + sorted(Path('found').glob('*'))
+    for path in paths:
+        with path.open() as f:
+            lines = f.readlines()
+        expected = unruly.propagate(unruly.read_board(lines))
+        assert propagate(unruly.read_board(lines)) == expected, path
+
+
+def test_conflict():
+    import pickle
+    board = unruly.read_board(['_BB_', 'W___', 'W___', '____'])
+    try:
+        propagate(board)
+    except ValueError as e:
+        assert "Conflict at (0, 0)!" in str(e)
+        assert str(pickle.loads(pickle.dumps(e))) == str(e)
+    else:
+        assert False, "Expected a conflict"
+
+
+def test_assign_and_retract():
+    with open('test_data/board1') as f:
+        board = unruly.read_board(f.readlines())
+    p = Propagator.from_board(board).propagate()
+    with open('test_data/board1.soln') as f:
+        solution = unruly.read_board(f.readlines())
+    assert p.to_board() == solution
+    assert {(i, j) for (i, j, c) in p.forced()} == {
+        (i, j) for i, row in enumerate(board) for j, c in enumerate(row) if c == UNKNOWN
+    }
+
+    p = Propagator.from_board(unruly.read_board(['_B______'] + ['________'] * 7))
+    p.propagate()
+    p.assign(0, 2, BLACK)
+    assert unruly.board_to_str(p.to_board()[:1]) == "WBBW____"
+    assert sorted(p.forced()) == [(0, 0, WHITE), (0, 3, WHITE)]
+    try:
+        p.assign(0, 4, WHITE)
+        p.assign(0, 5, WHITE)
+    except ValueError:
+        p.retract()
+    else:
+        assert False, "Expected a conflict"
+    assert unruly.board_to_str(p.to_board()[:1]) == "WBBWWB__"
+    p.retract()
+    p.retract()
+    assert unruly.board_to_str(p.to_board()) == "_B______\n" + "\n".join(['________'] * 7)
+    assert p.forced() == []
+
+
+if __name__ == '__main__':
+    board = unruly.read_board(fileinput.input())
+    board = propagate(board)
+    print(unruly.board_to_str(board))
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+
+"""
+Batched tactical solver for many Unruly boards at once, using NumPy
+
+Takes an (N, rows, cols) array of boards, all of the same size, and applies the
+four tactics from unruly.py to every row and column of every board at once with
+whole-array operations. Each round works out every square which some tactic
+can fill in, then fills them all in; boards drop out of the batch as soon as
+they reach a fixpoint or hit a conflict.
+
+Along with the propagated boards, propagate_batch returns a status for each
+board: SOLVED, STUCK (a fixpoint with unknown squares left) or CONFLICT (the
+tactics disagree, so the board has no solution).
+"""
+
+import fileinput
+from pathlib import Path
+
+import numpy as np
+
+import unruly
+from unruly import BLACK, WHITE, UNKNOWN
+
+
+SOLVED = 0
+STUCK = 1
+CONFLICT = 2
+
+
+def caps(mask):
+    """Squares which must be the other colour because of pairs or gaps in mask"""
+    out = np.zeros_like(mask)
+    pairs = mask[..., :-1] & mask[..., 1:]
+    out[..., 2:] |= pairs[..., :-1]
+    out[..., :-2] |= pairs[..., 1:]
+    out[..., 1:-1] |= mask[..., :-2] & mask[..., 2:]
+    return out
+
+
+def triple_intersection(free):
+    """Squares common to every line of three which fits into free
+
+    Returns the intersection, and whether a line of three fits at all."""
+    length = free.shape[-1]
+    starts = free[..., :-2] & free[..., 1:-1] & free[..., 2:]
+    fits = starts.any(axis=-1)
+    first = np.argmax(starts, axis=-1)
+    last = length - 3 - np.argmax(starts[..., ::-1], axis=-1)
+    index = np.arange(length)
+    common = (index >= last[..., None]) & (index <= first[..., None] + 2)
+    return common, fits
+
+
+def line_updates(black, white):
+    """Apply the four tactics along the last axis
+
+    Returns (must_be_black, must_be_white, broken), where broken marks lines
+    which have more than n squares of one colour."""
+    length = black.shape[-1]
+    n = length // 2
+    must_be_black = caps(white)
+    must_be_white = caps(black)
+    broken = np.zeros(black.shape[:-1], dtype=bool)
+    if n == 0 or length < 3:
+        return must_be_black, must_be_white, broken
+    unknown = ~(black | white)
+    whites = white.sum(axis=-1)
+    blacks = black.sum(axis=-1)
+    broken = (whites > n) | (blacks > n)
+    # Same order of precedence as unruly.complete_line
+    all_white = whites == n
+    all_black = ~all_white & (blacks == n)
+    one_white = ~all_white & ~all_black & (whites == n - 1)
+    one_black = ~all_white & ~all_black & ~one_white & (blacks == n - 1)
+    possible_whites, white_fits = triple_intersection(~white)
+    possible_blacks, black_fits = triple_intersection(~black)
+    must_be_black |= unknown & all_white[..., None]
+    must_be_white |= unknown & all_black[..., None]
+    must_be_black |= unknown & ~possible_whites & (one_white & white_fits)[..., None]
+    must_be_white |= unknown & ~possible_blacks & (one_black & black_fits)[..., None]
+    return must_be_black, must_be_white, broken
+
+
+def board_updates(black, white):
+    """Apply the tactics to every row and column of a batch of boards
+
+    Returns (must_be_black, must_be_white, conflict), where conflict marks
+    boards on which the tactics disagree."""
+    row_black, row_white, row_broken = line_updates(black, white)
+    col_black, col_white, col_broken = line_updates(
+        black.swapaxes(1, 2), white.swapaxes(1, 2))
+    must_be_black = row_black | col_black.swapaxes(1, 2)
+    must_be_white = row_white | col_white.swapaxes(1, 2)
+    clash = (must_be_black & (white | must_be_white)) | (must_be_white & black)
+    conflict = clash.any(axis=(1, 2)) | row_broken.any(axis=1) | col_broken.any(axis=1)
+    return must_be_black, must_be_white, conflict
+
+
+def propagate_batch(boards):
+    """Apply the tactics to every board in an (N, rows, cols) array
+
+    Returns the propagated boards as a new uint8 array, and an array of
+    statuses (SOLVED, STUCK or CONFLICT), one per board."""
+    boards = np.array(boards, dtype=np.uint8)
+    if len(boards) == 0:
+        return boards, np.zeros(0, dtype=np.uint8)
+    black = boards == BLACK
+    white = boards == WHITE
+    status = np.full(len(boards), STUCK, dtype=np.uint8)
+    active = np.arange(len(boards))
+    while len(active) > 0:
+        b, w = black[active], white[active]
+        must_be_black, must_be_white, conflict = board_updates(b, w)
+        status[active[conflict]] = CONFLICT
+        new_black = must_be_black & ~b
+        new_white = must_be_white & ~w
+        changed = ~conflict & (new_black | new_white).any(axis=(1, 2))
+        active = active[changed]
+        black[active] = b[changed] | new_black[changed]
+        white[active] = w[changed] | new_white[changed]
+    result = np.full_like(boards, UNKNOWN)
+    result[black] = BLACK
+    result[white] = WHITE
+    solved = (status == STUCK) & (result != UNKNOWN).all(axis=(1, 2))
+    status[solved] = SOLVED
+    return result, status
+
+
+def test_matches_unruly():
+    paths = sorted(Path('test_data').glob('board?')) + sorted(Path('found').glob('*'))
+    for size in (6, 8, 10, 14, 16):
+        boards, expected = [], []
+        for path in paths:
+            with path.open() as f:
+                board = unruly.read_board(f.readlines())
+            if len(board) == size:
+                boards.append([row[:] for row in board])
+                expected.append(unruly.propagate(board))
+        result, status = propagate_batch(boards)
+        assert result.tolist() == expected
+        assert all((s == SOLVED) == (UNKNOWN not in sum(e, [])) for s, e in zip(status, expected))
+    result, status = propagate_batch([])
+    assert len(result) == len(status) == 0
+
+
+def test_conflict():
+    boards = [
+        unruly.read_board(['_BB_', 'W___', 'W___', '____']),
+        unruly.read_board(['_BB_', '____', '____', '____']),
+    ]
+    result, status = propagate_batch(boards)
+    assert status.tolist() == [CONFLICT, STUCK]
+    assert unruly.board_to_str(result[1]) == "WBBW\n____\n____\n____"
+
+
+if __name__ == '__main__':
+    board = unruly.read_board(fileinput.input())
+    result, status = propagate_batch([board])
+    print(unruly.board_to_str(result[0]))
@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+
+"""
+Packed binary corpus format for Unruly boards, with memory-mapped access
+
+Text files need parsing character by character, which for millions of boards
+takes longer than solving them. A packed corpus holds any number of boards of
+the same size, at 2 bits per square (BLACK, WHITE or UNKNOWN, four squares to a
+byte, each board padded to a whole number of bytes), optionally followed by a
+solution for each board in the same layout. The header is HEADER_SIZE bytes:
+
+  magic     4s   b'UNRL'
+  version   B    1
+  (padding) 3x
+  rows      I
+  cols      I
+  count     Q    number of boards
+  solutions Q    byte offset of the solutions, or 0 if there aren't any
+
+all little-endian. Corpus memory-maps a file: packed() gives zero-copy NumPy
+views of the packed bytes, and indexing or slicing unpacks just the boards
+asked for into a uint8 array which can go straight into
+unruly_numpy.propagate_batch.
+
+  unruly_packed.py pack corpus.bin found/8x8*        # text -> packed
+  unruly_packed.py unpack corpus.bin                # packed -> text
+"""
+
+import argparse
+import itertools
+import shutil
+import struct
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+import unruly
+from unruly_batch import read_boards, read_files
+
+
+MAGIC = b'UNRL'
+VERSION = 1
+HEADER = struct.Struct('<4sB3xIIQQ')
+HEADER_SIZE = HEADER.size
+SHIFTS = np.array([0, 2, 4, 6], dtype=np.uint8)
+
+
+def board_bytes(rows, cols):
+    return (rows * cols + 3) // 4
+
+
+def pack(boards):
+    """Pack an (N, rows, cols) array of boards into an (N, board_bytes) uint8 array"""
+    boards = np.asarray(boards, dtype=np.uint8)
+    count, rows, cols = boards.shape
+    nbytes = board_bytes(rows, cols)
+    cells = np.zeros((count, 4 * nbytes), dtype=np.uint8)
+    cells[:, :rows * cols] = boards.reshape(count, rows * cols)
+    return np.bitwise_or.reduce(cells.reshape(count, nbytes, 4) << SHIFTS, axis=2)
+
+
+def unpack(packed, rows, cols):
+    """Inverse of pack: (N, board_bytes) uint8 array to (N, rows, cols)"""
+    packed = np.asarray(packed, dtype=np.uint8)
+    cells = (packed[..., None] >> SHIFTS) & 3
+    cells = cells.reshape(packed.shape[:-1] + (-1,))[..., :rows * cols]
+    return cells.reshape(packed.shape[:-1] + (rows, cols))
+
+
+class Writer:
+    """Write boards to a packed corpus a chunk at a time
+
+    Solutions (if any) are spooled to a temporary file until close(), since
+    they go after all the boards."""
+
+    def __init__(self, path, rows, cols):
+        self.f = open(path, 'wb')
+        self.rows, self.cols = rows, cols
+        self.count = 0
+        self.solutions = None
+        self.f.write(bytes(HEADER_SIZE))
+
+    def write(self, boards, solutions=None):
+        boards = np.asarray(boards, dtype=np.uint8)
+        if boards.shape[1:] != (self.rows, self.cols):
+            raise ValueError(f"Expected {self.rows}x{self.cols} boards, got {boards.shape[1]}x{boards.shape[2]}")
+        if solutions is not None:
+            if self.solutions is None:
+                if self.count:
+                    raise ValueError("Either every board needs a solution, or none of them")
+                self.solutions = tempfile.TemporaryFile()
+            self.solutions.write(pack(solutions).tobytes())
+        elif self.solutions is not None:
+            raise ValueError("Either every board needs a solution, or none of them")
+        self.f.write(pack(boards).tobytes())
+        self.count += len(boards)
+
+    def close(self):
+        offset = 0
+        if self.solutions is not None:
+            offset = self.f.tell()
+            self.solutions.seek(0)
+            shutil.copyfileobj(self.solutions, self.f)
+            self.solutions.close()
+        self.f.seek(0)
+        self.f.write(HEADER.pack(MAGIC, VERSION, self.rows, self.cols, self.count, offset))
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def write(path, boards, solutions=None):
+    """Write a whole (N, rows, cols) array of boards (and solutions) to path"""
+    boards = np.asarray(boards, dtype=np.uint8)
+    with Writer(path, boards.shape[1], boards.shape[2]) as w:
+        w.write(boards, solutions)
+
+
+class Corpus:
+    """Read-only, memory-mapped packed corpus"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            magic, version, self.rows, self.cols, self.count, offset = HEADER.unpack(f.read(HEADER_SIZE))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a packed Unruly corpus")
+        nbytes = board_bytes(self.rows, self.cols)
+        data = np.memmap(path, dtype=np.uint8, mode='r')
+        self._boards = data[HEADER_SIZE:HEADER_SIZE + self.count * nbytes].reshape(self.count, nbytes)
+        if offset:
+            self._solutions = data[offset:offset + self.count * nbytes].reshape(self.count, nbytes)
+        else:
+            self._solutions = None
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        """Unpack a board, as a (rows, cols) array, or a slice of them"""
+        return unpack(self._boards[index], self.rows, self.cols)
+
+    def has_solutions(self):
+        return self._solutions is not None
+
+    def solution(self, index):
+        return unpack(self._solutions[index], self.rows, self.cols)
+
+    def packed(self, index=slice(None)):
+        """Zero-copy view of the packed bytes of a board or slice of boards"""
+        return self._boards[index]
+
+    def packed_solutions(self, index=slice(None)):
+        return self._solutions[index]
+
+    def chunks(self, size=65536):
+        """Yield (start, boards) for successive slices of up to size boards"""
+        for start in range(0, self.count, size):
+            yield start, self[start:start + size]
+
+
+def pack_text(boards, path, solutions=None, chunk=65536):
+    """Pack a stream of text boards (each a list of row strings) into path
+
+    solutions, if given, is a stream of solutions in the same order."""
+    boards = (unruly.read_board(rows) for rows in boards)
+    if solutions is None:
+        pairs = ((board, None) for board in boards)
+    else:
+        pairs = zip(boards, (unruly.read_board(rows) for rows in solutions), strict=True)
+    writer = None
+    while True:
+        block = list(itertools.islice(pairs, chunk))
+        if not block:
+            break
+        if writer is None:
+            writer = Writer(path, len(block[0][0]), len(block[0][0][0]))
+        for board, solution in block:
+            if len(board) != writer.rows or any(len(row) != writer.cols for row in board):
+                raise ValueError(f"Every board in a corpus must be {writer.rows}x{writer.cols}")
+        solutions = None if block[0][1] is None else [s for b, s in block]
+        writer.write([b for b, s in block], solutions)
+    if writer is None:
+        raise ValueError("No boards to pack")
+    writer.close()
+
+
+def unpack_text(corpus, solutions=False):
+    """Yield each board (or solution) in a Corpus as text"""
+    for start, boards in corpus.chunks():
+        if solutions:
+            boards = unpack(corpus.packed_solutions(slice(start, start + len(boards))), corpus.rows, corpus.cols)
+        for board in boards:
+            yield unruly.board_to_str(board)
+
+
+def test_round_trip(tmp_path):
+    paths = sorted(Path('test_data').glob('board?'))
+    boards, solutions = [], []
+    for path in paths:
+        with path.open() as f:
+            boards.append(unruly.read_board(f.read().split()))
+        with path.with_suffix('.soln').open() as f:
+            solutions.append(unruly.read_board(f.read().split()))
+    boards = [b for b in boards if len(b) == len(boards[0]) and len(b[0]) == len(boards[0][0])]
+    solutions = solutions[:len(boards)]
+    write(tmp_path / 'corpus', boards, solutions)
+    corpus = Corpus(tmp_path / 'corpus')
+    assert len(corpus) == len(boards)
+    assert corpus[:].tolist() == boards
+    assert corpus[len(boards) - 1].tolist() == boards[-1]
+    assert corpus.solution(0).tolist() == solutions[0]
+    assert corpus.packed().base is not None
+    # 7 squares don't fill a whole number of bytes
+    odd = np.random.default_rng(0).integers(3, size=(10, 1, 7))
+    assert (unpack(pack(odd), 1, 7) == odd).all()
+
+
+def test_pack_text(tmp_path):
+    with open('found/8x8') as f:
+        text = f.read().strip()
+    pack_text(read_boards((text + "\n\n" + text).splitlines(keepends=True)), tmp_path / 'corpus')
+    corpus = Corpus(tmp_path / 'corpus')
+    assert list(unpack_text(corpus)) == [text, text]
+    assert not corpus.has_solutions()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    pack_parser = subparsers.add_parser('pack', help="text boards (separated by blank lines) to a packed corpus")
+    pack_parser.add_argument('out', type=Path)
+    pack_parser.add_argument('files', nargs='*')
+    pack_parser.add_argument('--solutions', type=Path, help="text solutions, in the same order as the boards")
+    unpack_parser = subparsers.add_parser('unpack', help="packed corpus to text boards")
+    unpack_parser.add_argument('corpus', type=Path)
+    unpack_parser.add_argument('--solutions', action='store_true', help="print the solutions instead")
+    args = parser.parse_args()
+    if args.command == 'pack':
+        solutions = None
+        if args.solutions is not None:
+            solutions = read_files([args.solutions])
+        pack_text(read_files(args.files), args.out, solutions)
+    else:
+        for text in unpack_text(Corpus(args.corpus), args.solutions):
+            sys.stdout.write(text + "\n\n")
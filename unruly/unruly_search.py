@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+
+"""
+Exact Unruly solver and solution counter in pure Python
+
+This is a depth-first search which uses the tactics from unruly.py (via the
+bitboard Propagator in unruly_bitboard.py) to fill in everything they can after
+each guess, and backtracks by retracting the guess rather than copying the
+board. It guesses a square in the most-filled row, choosing the most-filled
+column within that row, since that's where the tactics are most likely to
+finish the job.
+
+Unlike unruly_z3.solve_board, this builds nothing per query, so it's suitable
+for the uniqueness checks in the inner loop of puzzle minimisation: use
+count_solutions(board, limit=2) to stop as soon as a second solution turns up.
+"""
+
+import argparse
+import fileinput
+from pathlib import Path
+
+import unruly
+from unruly import BLACK, WHITE, UNKNOWN
+from unruly_bitboard import Propagator, line_updates
+
+
+def choose_square(p):
+    """Pick an unknown square to guess, or return None if the board is full"""
+    best_row, best_count = None, None
+    for i in range(p.rows):
+        count = p.cols - (p.black[i] | p.white[i]).bit_count()
+        if count and (best_count is None or count < best_count):
+            best_row, best_count = i, count
+    if best_row is None:
+        return None
+    unknown = ((1 << p.cols) - 1) & ~(p.black[best_row] | p.white[best_row])
+    best_col, best_count = None, None
+    while unknown:
+        low = unknown & -unknown
+        unknown ^= low
+        j = low.bit_length() - 1
+        col = p.rows + j
+        count = p.rows - (p.black[col] | p.white[col]).bit_count()
+        if best_count is None or count < best_count:
+            best_col, best_count = j, count
+    return best_row, best_col
+
+
+def search(p):
+    """Yield every completion of a propagated Propagator, as a list of lists"""
+    square = choose_square(p)
+    if square is None:
+        yield p.to_board()
+        return
+    i, j = square
+    # Try the colour the row is shorter of first
+    if p.black[i].bit_count() <= p.white[i].bit_count():
+        colours = (BLACK, WHITE)
+    else:
+        colours = (WHITE, BLACK)
+    for c in colours:
+        try:
+            p.assign(i, j, c)
+        except ValueError:
+            p.retract()
+            continue
+        yield from search(p)
+        p.retract()
+
+
+def solutions(board, updates=line_updates):
+    """Yield every solution to a partial board
+
+    updates is passed on to the Propagator: line_tables.line_updates makes each
+    step of propagation stronger, at some cost per line."""
+    p = Propagator.from_board(board, updates)
+    try:
+        p.propagate()
+    except ValueError:
+        return
+    yield from search(p)
+
+
+def count_solutions(board, limit=None, updates=line_updates):
+    """Count the solutions to a partial board, stopping once we reach limit"""
+    count = 0
+    for _ in solutions(board, updates):
+        count += 1
+        if limit is not None and count >= limit:
+            break
+    return count
+
+
+def solve_board(board, exclusions=None):
+    """Find a solution which isn't one of exclusions, or None if there isn't one
+
+    Same interface as minimize_z3.solve_board."""
+    if exclusions is None:
+        exclusions = []
+    for solution in solutions(board):
+        if solution not in exclusions:
+            return solution
+    return None
+
+
+def minimize(board, count=count_solutions):
+    """Remove clues one at a time, as long as the solution stays unique
+
+    Same greedy order as minimize_z3.minimize, so gives the same answer. count
+    is the solution counter to use, such as solve_cache.Cache.count_solutions."""
+    size = len(board)
+    clues = [
+        (i, j)
+        for i in range(size) for j in range(size)
+        if board[i][j] != UNKNOWN
+    ]
+    for (i, j) in clues:
+        value = board[i][j]
+        board[i][j] = UNKNOWN
+        if count(board, limit=2) > 1:
+            board[i][j] = value
+    return board
+
+
+def test_solutions():
+    test_data = Path('test_data')
+    for infile in ['board1', 'board2', 'board3', 'board4', 'board5']:
+        with (test_data / infile).open() as f:
+            board = unruly.read_board(f.readlines())
+        with (test_data / (infile + '.soln')).open() as f:
+            expected = unruly.read_board(f.readlines())
+        assert count_solutions(board) == 1, infile
+        assert solve_board(board) == expected, infile
+        assert solve_board(board, exclusions=[expected]) is None, infile
+
+
+def test_minimize():
+    with open('found/6x6') as f:
+        board = unruly.read_board(f.readlines())
+    minimized = minimize([row[:] for row in board])
+    assert count_solutions(minimized) == 1
+    assert solve_board(minimized) == solve_board(board)
+    for i, row in enumerate(minimized):
+        for j, c in enumerate(row):
+            if c != UNKNOWN:
+                row[j] = UNKNOWN
+                assert count_solutions(minimized, limit=2) == 2
+                row[j] = c
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('files', nargs='*')
+    parser.add_argument('--cache', help="SQLite database of results to consult and extend (see solve_cache.py)")
+    args = parser.parse_args()
+    board = unruly.read_board(fileinput.input(args.files))
+    if args.cache is None:
+        solution = solve_board(board)
+    else:
+        import solve_cache
+        solution = solve_cache.Cache(args.cache).solve_board(board)
+    if solution is None:
+        print("No solution")
+    else:
+        print(unruly.board_to_str(solution))
@@ -4,43 +4,32 @@
 """
 Solve partial Unruly boards using the Z3 SMT solver from Microsoft Research
 """
+import argparse
 import fileinput
 from pathlib import Path
 
-from z3 import Function, IntSort, Solver, sat
+from z3 import Solver, sat
 
+import instrument
 import unruly
+from z3_encoding import DEFAULT_ENCODING, ENCODINGS, make_grid
 
 
-def solve_board(board):
+def solve_board(board, encoding=DEFAULT_ENCODING, stats=None):
+    """The solution of a board, or the board itself if there isn't one
+
+    stats is an optional instrument.Stats, which gets the time of check()"""
     size = len(board[0])
-    n = size // 2
-    solution = Function('solution', IntSort(), IntSort(), IntSort())
+    solution = make_grid(encoding, 'solution', size)
     s = Solver()
+    s.add(solution.domain())
     for i, row in enumerate(board):
         for j, c in enumerate(row):
             if c < 2:
-                s.add(solution(i, j) == c)
-            else:
-                s.add(0 <= solution(i, j))
-                s.add(solution(i, j) <= 1)
-    for i in range(size):
-        s.add(sum(solution(i, j) for j in range(size)) == n)
-        s.add(sum(solution(j, i) for j in range(size)) == n)
-    for i in range(size):
-        for j in range(size - 2):
-            row_sum = solution(i, j) + solution(i, j + 1) + solution(i, j + 2)
-            col_sum = solution(j, i) + solution(j + 1, i) + solution(j + 2, i)
-            s.add(0 < row_sum)
-            s.add(row_sum < 3)
-            s.add(0 < col_sum)
-            s.add(col_sum < 3)
-    if s.check() == sat:
-        m = s.model()
-        board = [
-            [ m.evaluate(solution(i, j)).as_long() for j in range(size) ]
-            for i in range(size)
-        ]
+                s.add(solution.has(i, j, c))
+    s.add(solution.rules())
+    if instrument.timed(stats, 'check', s.check) == sat:
+        board = solution.board(s.model())
     return board
 
 
@@ -49,13 +38,29 @@ def test_solutions():
     for infile in ['board1', 'board2', 'board3', 'board4', 'board5']:
         with (test_data / infile).open() as f:
             board = unruly.read_board(f.readlines())
-            solution = solve_board(board)
         with (test_data / (infile + '.soln')).open() as f:
             expected = unruly.read_board(f.readlines())
-        assert solution == expected, infile
+        for encoding in ENCODINGS:
+            solution = solve_board(board, encoding)
+            assert solution == expected, (infile, encoding)
+    stats = instrument.Stats()
+    solve_board(board, stats=stats)
+    assert stats.timers['check'][0] == 1
 
 
 if __name__ == '__main__':
-    board = unruly.read_board(fileinput.input())
-    board = solve_board(board)
-    print(unruly.board_to_str(board))
\ No newline at end of file
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--encoding', choices=ENCODINGS, default=DEFAULT_ENCODING)
+    parser.add_argument('files', nargs='*')
+    parser.add_argument('--cache', help="SQLite database of results to consult and extend (see solve_cache.py)")
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    board = unruly.read_board(fileinput.input(args.files))
+    stats = instrument.from_args(args)
+    if args.cache is None:
+        board = solve_board(board, args.encoding, stats)
+    else:
+        import solve_cache
+        board = solve_cache.Cache(args.cache).solve_z3(board, args.encoding) or board
+    print(unruly.board_to_str(board))
+    instrument.finish(stats, args)
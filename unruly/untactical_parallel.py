@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+
+"""
+Find lots of untactical Unruly puzzles at once, using several Z3 processes
+
+Each worker runs untactical_z3.find_puzzles with its own random seed and its
+own share of the search space: the possible values of the first few squares of
+the puzzle are dealt out between the workers. Puzzles stream back to this
+process, which throws away any that are symmetric images of puzzles we already
+have (including the ones already in found/), and writes the rest into found/
+until we have enough of them or run out of time.
+"""
+
+import argparse
+import itertools
+import multiprocessing
+import queue
+import time
+from pathlib import Path
+
+import symmetry
+import unruly
+from untactical_z3 import find_puzzles
+from z3_encoding import DEFAULT_ENCODING, ENCODINGS
+
+
+def partition(workers, size):
+    """Deal out the values of the first few squares between the workers
+
+    Returns a list of prefixes for each worker, or [None] for a single worker."""
+    if workers == 1:
+        return [None]
+    length = 0
+    while 3 ** length < workers and length < size * size:
+        length += 1
+    prefixes = list(itertools.product(range(3), repeat=length))
+    return [prefixes[k::workers] for k in range(workers)]
+
+
+def worker(n, encoding, seed, prefixes, learned, results):
+    puzzles = find_puzzles(n, encoding, seed=seed, prefixes=prefixes, progress=False, learned=learned)
+    for board, solution in puzzles:
+        results.put(board)
+    # Let the coordinator know this part of the search space is exhausted
+    results.put(None)
+
+
+def existing_puzzles(out, size):
+    seen = set()
+    for path in out.glob(f'{size}x{size}*'):
+        with path.open() as f:
+            board = unruly.read_board(line for line in f if line.strip())
+        seen.add(symmetry.key(board))
+    return seen
+
+
+def next_path(out, size):
+    path = out / f'{size}x{size}'
+    k = 1
+    while path.exists():
+        k += 1
+        path = out / f'{size}x{size}_{k}'
+    return path
+
+
+def generate(n, workers, count, deadline=None, encoding=DEFAULT_ENCODING, seed=0, out=Path('found'),
+             learned=None):
+    """Write up to count new puzzles into out, giving up after deadline seconds
+
+    If learned is a path, the workers share it as a store of refuted puzzles (see
+    untactical_z3.find_puzzles)."""
+    size = 2 * n
+    seen = existing_puzzles(out, size)
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(
+            target=worker,
+            args=(n, encoding, seed + k, prefixes, learned, results),
+            daemon=True,
+        )
+        for k, prefixes in enumerate(partition(workers, size))
+    ]
+    for p in processes:
+        p.start()
+    start = time.time()
+    running = len(processes)
+    written = []
+    try:
+        while len(written) < count and running > 0:
+            timeout = None if deadline is None else deadline - (time.time() - start)
+            if timeout is not None and timeout <= 0:
+                break
+            try:
+                board = results.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if board is None:
+                running -= 1
+                continue
+            key = symmetry.key(board)
+            if key in seen:
+                continue
+            seen.add(key)
+            path = next_path(out, size)
+            path.write_text(unruly.board_to_str(board) + "\n")
+            written.append(path)
+            print(path)
+    finally:
+        for p in processes:
+            p.terminate()
+    return written
+
+
+def test_partition():
+    for workers in [1, 2, 3, 5, 9, 10]:
+        parts = partition(workers, 6)
+        assert len(parts) == workers
+        if workers == 1:
+            continue
+        prefixes = [p for part in parts for p in part]
+        assert len(prefixes) == len(set(prefixes)) == 3 ** len(prefixes[0])
+        assert all(part for part in parts)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('n', type=int)
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--count', type=int, default=100)
+    parser.add_argument('--deadline', type=float, help="seconds")
+    parser.add_argument('--encoding', choices=ENCODINGS, default=DEFAULT_ENCODING)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', type=Path, default=Path('found'))
+    parser.add_argument('--learned', type=Path, default=Path(__file__).parent / 'learned',
+                        help="directory of refuted puzzles to load and extend")
+    args = parser.parse_args()
+    size = 2 * args.n
+    written = generate(args.n, args.workers, args.count, args.deadline, args.encoding, args.seed, args.out,
+                       args.learned / f'{size}x{size}')
+    print(f"Wrote {len(written)} new puzzles")
@@ -5,23 +5,75 @@
 Find Unruly boards which can't be solved using the four tactics using Z3.
 """
 
+import argparse
 import sys
+from pathlib import Path
 
-from z3 import Function, IntSort, Solver, sat, And, Implies, If, Or, Optimize
+from z3 import sat, set_param, And, Implies, Not, Or, Optimize
 
+import instrument
+import symmetry
 import unruly
+from z3_encoding import DEFAULT_ENCODING, ENCODINGS, Transposed, make_grid, not_this, yes_this
 
 
-def find_puzzle(n):
+def find_puzzle(n, encoding=DEFAULT_ENCODING, learned=None, symmetry_breaking=False, stats=None):
+    for board, solution in find_puzzles(n, encoding, learned=learned, symmetry_breaking=symmetry_breaking,
+                                        stats=stats):
+        print()
+        return board, solution
+    print()
+    print("Can't find any suitable puzzles :-(")
+    sys.exit(1)
+
+
+def find_puzzles(n, encoding=DEFAULT_ENCODING, seed=None, prefixes=None, progress=True, learned=None,
+                 symmetry_breaking=False, stats=None):
+    """Yield (puzzle, solution) pairs for untactical puzzles with unique solutions
+
+    After each puzzle is found, it's disallowed along with all its symmetric
+    images, and the search carries on. seed sets Z3's random seed, and prefixes
+    restricts the search to puzzles whose first few squares (in row-major order)
+    match one of the given lists of values, so that several searches can split
+    up the work between them.
+
+    When a puzzle turns out to have two solutions, we disallow every puzzle which
+    both solutions satisfy, and every image of those, not just that one puzzle
+    (see refute and not_within_images). If learned is
+    a path, these refutations are appended to it, and any already there are
+    loaded at the start, so that a restarted search can carry on from where the
+    last one stopped.
+
+    If symmetry_breaking is set, we only look for the least puzzle in each
+    family of symmetric puzzles (see symmetry.lex_leader).
+
+    stats is an optional instrument.Stats. It gets the time taken by each
+    check() (under 'check puzzle' for a new candidate, 'check alternative'
+    for a second solution and 'check refute' in refute), the number of
+    iterations and refutations, the iterations taken to find each puzzle
+    (the sample 'iterations per puzzle'), and 'puzzle' and 'refuted' events."""
+    if seed is not None:
+        set_param('smt.random_seed', seed)
+        set_param('sat.random_seed', seed)
     size = 2 * n
     s = Optimize()
-    puzzle = make_puzzle(size, s)
+    puzzle = make_puzzle(size, s, encoding)
     disallow_tactics(puzzle, n, size, s)
-    solution = solution_for(puzzle, size, s)
-    blank_count = sum(b2i(puzzle(i, j) == 2) for i in range(size) for j in range(size))
-    s.add(blank_count > 10)
-    # s.maximize(blank_count)
+    solution = solution_for(puzzle, size, s, encoding)
+    blanks = [puzzle.has(i, j, 2) for i in range(size) for j in range(size)]
+    s.add(puzzle.at_least(blanks, 11))
+    if symmetry_breaking:
+        s.add(symmetry.lex_leader(puzzle))
+    if learned is not None:
+        for pattern in load_learned(learned):
+            s.add(not_within_images(puzzle, pattern, size))
+    if prefixes is not None:
+        s.add(Or(*(
+            And(*(puzzle.has(*divmod(k, size), c) for k, c in enumerate(prefix)))
+            for prefix in prefixes
+        )))
     iterations = 0
+    since_last_puzzle = 0
     # with open('board1') as f:
     #     board1 = unruly.read_board(f.readlines())
     #     print(board1)
@@ -31,7 +83,10 @@ def find_puzzle(n):
     # save_assertions(s)
     while True:
         iterations += 1
-        if s.check() == sat:
+        since_last_puzzle += 1
+        if stats is not None:
+            stats.count('iterations')
+        if instrument.timed(stats, 'check puzzle', s.check) == sat:
             board = get_board(s, puzzle, size)
             # return board, board
             solution1 = get_board(s, solution, size)
@@ -39,61 +94,123 @@ def find_puzzle(n):
             s.push()
             s.add(yes_this(puzzle, board, size))
             s.add(not_this(solution, solution1, size))
-            if s.check() == sat:
+            if instrument.timed(stats, 'check alternative', s.check) == sat:
                 # print("Alternative solution found!")
                 solution2 = get_board(s, solution, size)
                 # Solution is not unique
-                if iterations % 10 == 0:
+                if progress and iterations % 10 == 0:
                     sys.stdout.write(".")
                     sys.stdout.flush()
+                pattern = refute(s, solution, solution1, solution2, size, stats)
                 s.pop()
-                s.add(not_this(puzzle, board, size))
+                if stats is not None:
+                    stats.count('refutations')
+                    stats.event('refuted', iteration=iterations,
+                                blanks=sum(c == 2 for row in pattern for c in row))
+                s.add(not_within_images(puzzle, pattern, size))
+                if learned is not None:
+                    save_learned(learned, pattern)
             else:
-                print()
-                return board, solution1
+                s.pop()
+                if stats is not None:
+                    stats.count('puzzles')
+                    stats.sample('iterations per puzzle', since_last_puzzle)
+                    stats.event('puzzle', iteration=iterations, board=unruly.board_to_str(board))
+                since_last_puzzle = 0
+                yield board, solution1
+                for image in symmetry.images(board):
+                    s.add(not_this(puzzle, image, size))
         else:
-            print()
-            print("Can't find any suitable puzzles :-(")
-            sys.exit(1)
+            return
 
 
-def save_assertions(s):
-    with open("assertions", "w") as f:
-        for a in s.assertions():
-            f.write(str(a) + "\n")
-                
+def refute(s, solution, solution1, solution2, size, stats=None):
+    """Find the weakest puzzle which both solution1 and some other solution satisfy
 
-def yes_this(variable, board, size):
-    return And(*(
-        variable(i, j) == board[i][j]
+    Any puzzle whose clues all agree with two different solutions has both as
+    solutions, so every puzzle whose clues are a subset of the returned pattern
+    can be disallowed. To make that set as big as possible, we keep looking for
+    another solution which differs from solution1 in a strict subset of the
+    squares where solution2 does, until there isn't one. Must be called with
+    the puzzle pinned down and solution1 disallowed, as in find_puzzles."""
+    different = differences(solution1, solution2, size)
+    while True:
+        s.push()
+        s.add(And(*(
+            solution.has(i, j, solution1[i][j])
+            for i in range(size) for j in range(size)
+            if (i, j) not in different
+        )))
+        s.add(Or(*(solution.has(i, j, solution1[i][j]) for (i, j) in different)))
+        if instrument.timed(stats, 'check refute', s.check) == sat:
+            different = differences(solution1, get_board(s, solution, size), size)
+            s.pop()
+        else:
+            s.pop()
+            break
+    return [
+        [2 if (i, j) in different else solution1[i][j] for j in range(size)]
+        for i in range(size)
+    ]
+
+
+def differences(board1, board2, size):
+    return {
+        (i, j)
         for i in range(size) for j in range(size)
-    ))
+        if board1[i][j] != board2[i][j]
+    }
 
 
-def not_this(variable, board, size):
+def not_within(puzzle, pattern, size):
+    """Disallow every puzzle whose clues all appear in pattern"""
     return Or(*(
-        variable(i, j) != board[i][j]
+        Not(puzzle.has(i, j, 2)) if pattern[i][j] == 2 else puzzle.has(i, j, 1 - pattern[i][j])
         for i in range(size) for j in range(size)
     ))
 
 
-def make_puzzle(size, s):
-    puzzle = Function('puzzle', IntSort(), IntSort(), IntSort())
+def not_within_images(puzzle, pattern, size):
+    """Disallow every puzzle whose clues all appear in some image of pattern"""
+    images = {tuple(map(tuple, image)) for image in symmetry.images(pattern)}
+    return And(*(not_within(puzzle, image, size) for image in sorted(images)))
+
+
+def load_learned(path):
+    """Read the patterns saved by save_learned, separated by blank lines"""
+    path = Path(path)
+    if not path.exists():
+        return []
+    with path.open() as f:
+        blocks = f.read().split("\n\n")
+    return [unruly.read_board(block.split()) for block in blocks if block.strip()]
+
+
+def save_learned(path, pattern):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # One write per pattern, so that parallel searches can share a file
+    with path.open("a") as f:
+        f.write(unruly.board_to_str(pattern) + "\n\n")
+
+
+def save_assertions(s):
+    with open("assertions", "w") as f:
+        for a in s.assertions():
+            f.write(str(a) + "\n")
+                
+
+def make_puzzle(size, s, encoding=DEFAULT_ENCODING):
     # Squares must be black, white or empty
-    for i in range(size):
-        for j in range(size):
-            # 0 = black, 1 = white, 2 = unknown
-            s.add(puzzle(i, j) >= 0)
-            s.add(puzzle(i, j) <= 2)
-            # Transpose puzzle to reduce code duplication
+    # 0 = black, 1 = white, 2 = unknown
+    puzzle = make_grid(encoding, 'puzzle', size, states=3)
+    s.add(puzzle.domain())
     return puzzle
 
 
 def disallow_tactics(puzzle, n, size, s):
-    transposed = Function('transposed', IntSort(), IntSort(), IntSort())
-    for i in range(size):
-        for j in range(size):
-            s.add(transposed(j, i) == puzzle(i, j))
+    # Transpose puzzle to reduce code duplication
+    transposed = Transposed(puzzle)
     for board in (puzzle, transposed):
         # "gaps" and "endcaps" tactics can't be applied
         no_gaps_or_endcaps(board, size, s)
@@ -101,74 +218,107 @@ def disallow_tactics(puzzle, n, size, s):
         no_half_complete_rows(board, n, s)
 
 
-def b2i(bool_expr):
-    """Convert a Z3 boolean expression to an integer, so I can sum it"""
-    return If(bool_expr, 1, 0)
-
-
 def no_gaps_or_endcaps(puzzle, size, s):
     for i in range(size):
         for j in range(size - 2):
-            a, b, c = puzzle(i, j), puzzle(i, j+1), puzzle(i, j+2)
-            s.add(Implies(
-                And(a < 2, a == c),
-                b == (1 - a)
-            ))
-            s.add(Implies(
-                And(a < 2, a == b),
-                c == (1 - a)
-            ))
-            s.add(Implies(
-                And(b < 2, b == c),
-                a == (1 - b)
-            ))
+            for c in (0, 1):
+                a, b, d = (puzzle.has(i, j + k, c) for k in range(3))
+                o = 1 - c
+                s.add(Implies(And(a, d), puzzle.has(i, j + 1, o)))
+                s.add(Implies(And(a, b), puzzle.has(i, j + 2, o)))
+                s.add(Implies(And(b, d), puzzle.has(i, j, o)))
 
 
 def no_half_complete_rows(puzzle, n, s):
     size = 2 * n
     for i in range(size):
-        black_count = sum(b2i(puzzle(i, j) == 0) for j in range(size))
-        white_count = sum(b2i(puzzle(i, j) == 1) for j in range(size))
+        blacks = [puzzle.has(i, j, 0) for j in range(size)]
+        whites = [puzzle.has(i, j, 1) for j in range(size)]
         # "n" tactic can't be applied
-        s.add((black_count == n) == (white_count == n))
-        s.add((black_count == n - 1) == (white_count == n - 1))
+        s.add(puzzle.exactly(blacks, n) == puzzle.exactly(whites, n))
+        s.add(puzzle.exactly(blacks, n - 1) == puzzle.exactly(whites, n - 1))
 
 
-def solution_for(puzzle, size, s):
-    solution = Function('solution', IntSort(), IntSort(), IntSort())
-    n = size // 2
+def solution_for(puzzle, size, s, encoding=DEFAULT_ENCODING):
+    solution = make_grid(encoding, 'solution', size)
+    s.add(solution.domain())
     for i in range(size):
         for j in range(size):
-            c = puzzle(i, j)
-            s.add(0 <= solution(i, j))
-            s.add(solution(i, j) <= 1)
-            s.add(Implies(c < 2, solution(i, j) == c))
-    for i in range(size):
-        s.add(sum(solution(i, j) for j in range(size)) == n)
-        s.add(sum(solution(j, i) for j in range(size)) == n)
-    for i in range(size):
-        for j in range(size - 2):
-            row_sum = solution(i, j) + solution(i, j + 1) + solution(i, j + 2)
-            col_sum = solution(j, i) + solution(j + 1, i) + solution(j + 2, i)
-            s.add(0 < row_sum)
-            s.add(row_sum < 3)
-            s.add(0 < col_sum)
-            s.add(col_sum < 3)
+            for c in (0, 1):
+                s.add(Implies(puzzle.has(i, j, c), solution.has(i, j, c)))
+    s.add(solution.rules())
     return solution
 
 
 def get_board(s, solution, size):
-    m = s.model()
-    board = [
-        [ m.evaluate(solution(i, j)).as_long() for j in range(size) ]
-        for i in range(size)
-    ]
-    return board
+    return solution.board(s.model())
+
+
+def test_not_within():
+    board = unruly.read_board(['B_W_', '____', '__B_', '____'])
+    pattern = unruly.read_board(['BBW_', '____', '__B_', 'W___'])
+    for encoding in ENCODINGS:
+        s = Optimize()
+        puzzle = make_puzzle(4, s, encoding)
+        s.add(not_within(puzzle, pattern, 4))
+        s.push()
+        s.add(yes_this(puzzle, board, 4))
+        assert s.check() != sat, encoding
+        s.pop()
+        board[1][1] = 0
+        s.add(yes_this(puzzle, board, 4))
+        assert s.check() == sat, encoding
+        board[1][1] = 2
+
+
+def test_refute():
+    board = unruly.read_board(['B___', '____', '__W_', '____'])
+    s = Optimize()
+    puzzle = make_puzzle(4, s)
+    solution = solution_for(puzzle, 4, s)
+    s.add(yes_this(puzzle, board, 4))
+    assert s.check() == sat
+    solution1 = get_board(s, solution, 4)
+    s.add(not_this(solution, solution1, 4))
+    assert s.check() == sat
+    pattern = refute(s, solution, solution1, get_board(s, solution, 4), 4)
+    assert all(c == 2 or c == p for row, prow in zip(board, pattern) for c, p in zip(row, prow))
+    # The learned clause rules out the board and all its images
+    s = Optimize()
+    puzzle = make_puzzle(4, s)
+    s.add(not_within_images(puzzle, pattern, 4))
+    for image in symmetry.images(board):
+        s.push()
+        s.add(yes_this(puzzle, image, 4))
+        assert s.check() != sat
+        s.pop()
+
+
+def test_stats():
+    stats = instrument.Stats()
+    # There are no untactical 4x4 puzzles, so this runs the whole search
+    assert list(find_puzzles(2, seed=0, progress=False, stats=stats)) == []
+    counters = stats.counters
+    assert counters['iterations'] == stats.timers['check puzzle'][0] == counters['refutations'] + 1
+    assert stats.timers['check alternative'][0] == counters['refutations']
+    assert 'puzzles' not in counters
 
 
 if __name__ == '__main__':
-    n = int(sys.argv[1])
-    board, solution = find_puzzle(n)
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('n', type=int)
+    parser.add_argument('--encoding', choices=ENCODINGS, default=DEFAULT_ENCODING)
+    parser.add_argument('--learned', type=Path, default=Path(__file__).parent / 'learned',
+                        help="directory of refuted puzzles to load and extend")
+    parser.add_argument('--symmetry-breaking', action='store_true',
+                        help="only search for the least puzzle in each symmetric family")
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    size = 2 * args.n
+    stats = instrument.from_args(args)
+    board, solution = find_puzzle(args.n, args.encoding, args.learned / f'{size}x{size}', args.symmetry_breaking,
+                                  stats)
     print(unruly.board_to_str(board))
     print()
-    print(unruly.board_to_str(solution))
\ No newline at end of file
+    print(unruly.board_to_str(solution))
+    instrument.finish(stats, args)
\ No newline at end of file
@@ -0,0 +1,174 @@
+"""
+Z3 encodings of Unruly boards, shared by unruly_z3.py, minimize_z3.py and untactical_z3.py
+
+A grid is a size x size array of Z3 variables, each of which takes one of
+`states` values: BLACK and WHITE for a solution, plus UNKNOWN for a puzzle. The
+drivers only build constraints through the grid's methods, so they don't need
+to know how a square is represented:
+
+ * IntGrid ('int') is the original encoding: an uninterpreted function from
+   (row, column) to the integers, with the rules written as linear arithmetic.
+   This makes Z3 reason in UF + LIA.
+ * BoolGrid ('bool') uses one Bool per square (two for a puzzle, at most one of
+   which can be true), cardinality constraints via PbEq and AtLeast, and the
+   no-three rule as clauses, so everything stays propositional.
+"""
+
+from z3 import And, AtLeast, AtMost, Bool, BoolVal, Function, If, IntSort, Not, Or, PbEq, Sum
+
+from unruly import BLACK, WHITE, UNKNOWN
+
+
+class IntGrid:
+    def __init__(self, name, size, states=2):
+        self.size = size
+        self.states = states
+        self.f = Function(name, IntSort(), IntSort(), IntSort())
+
+    def has(self, i, j, c):
+        """Square (i, j) is colour c"""
+        return self.f(i, j) == c
+
+    def domain(self):
+        return [
+            constraint
+            for i in range(self.size) for j in range(self.size)
+            for constraint in (0 <= self.f(i, j), self.f(i, j) < self.states)
+        ]
+
+    def exactly(self, literals, k):
+        return Sum([If(x, 1, 0) for x in literals]) == k
+
+    def at_least(self, literals, k):
+        return Sum([If(x, 1, 0) for x in literals]) >= k
+
+    def rules(self):
+        """Every row and column is balanced, with no lines of three"""
+        size, n, f = self.size, self.size // 2, self.f
+        constraints = []
+        for i in range(size):
+            constraints.append(sum(f(i, j) for j in range(size)) == n)
+            constraints.append(sum(f(j, i) for j in range(size)) == n)
+        for i in range(size):
+            for j in range(size - 2):
+                row_sum = f(i, j) + f(i, j + 1) + f(i, j + 2)
+                col_sum = f(j, i) + f(j + 1, i) + f(j + 2, i)
+                constraints.extend([0 < row_sum, row_sum < 3, 0 < col_sum, col_sum < 3])
+        return constraints
+
+    def value(self, model, i, j):
+        return model.evaluate(self.f(i, j)).as_long()
+
+    def board(self, model):
+        return [
+            [self.value(model, i, j) for j in range(self.size)]
+            for i in range(self.size)
+        ]
+
+
+class BoolGrid:
+    def __init__(self, name, size, states=2):
+        self.size = size
+        self.states = states
+        self.white = [[Bool(f"{name}_w_{i}_{j}") for j in range(size)] for i in range(size)]
+        if states == 2:
+            self.black = [[Not(w) for w in row] for row in self.white]
+        else:
+            self.black = [[Bool(f"{name}_b_{i}_{j}") for j in range(size)] for i in range(size)]
+
+    def has(self, i, j, c):
+        """Square (i, j) is colour c"""
+        if c == BLACK:
+            return self.black[i][j]
+        if c == WHITE:
+            return self.white[i][j]
+        if self.states == 2:
+            return BoolVal(False)
+        return And(Not(self.black[i][j]), Not(self.white[i][j]))
+
+    def domain(self):
+        if self.states == 2:
+            return []
+        return [
+            AtMost(self.black[i][j], self.white[i][j], 1)
+            for i in range(self.size) for j in range(self.size)
+        ]
+
+    def exactly(self, literals, k):
+        return PbEq([(x, 1) for x in literals], k)
+
+    def at_least(self, literals, k):
+        return AtLeast(*literals, k)
+
+    def rules(self):
+        """Every row and column is balanced, with no lines of three"""
+        size, n = self.size, self.size // 2
+        rows = self.white
+        cols = [list(col) for col in zip(*rows)]
+        constraints = []
+        for line in rows + cols:
+            constraints.append(self.exactly(line, n))
+            for j in range(size - 2):
+                triple = line[j:j + 3]
+                constraints.append(Or(*triple))
+                constraints.append(Or(*(Not(x) for x in triple)))
+        return constraints
+
+    def value(self, model, i, j):
+        if model.evaluate(self.white[i][j], model_completion=True):
+            return WHITE
+        if model.evaluate(self.black[i][j], model_completion=True):
+            return BLACK
+        return UNKNOWN
+
+    def board(self, model):
+        return [
+            [self.value(model, i, j) for j in range(self.size)]
+            for i in range(self.size)
+        ]
+
+
+class Transposed:
+    """View of a grid with rows and columns swapped"""
+
+    def __init__(self, grid):
+        self.grid = grid
+        self.size = grid.size
+        self.states = grid.states
+
+    def has(self, i, j, c):
+        return self.grid.has(j, i, c)
+
+    def exactly(self, literals, k):
+        return self.grid.exactly(literals, k)
+
+    def at_least(self, literals, k):
+        return self.grid.at_least(literals, k)
+
+
+ENCODINGS = {
+    'int': IntGrid,
+    'bool': BoolGrid,
+}
+
+DEFAULT_ENCODING = 'bool'
+
+
+def make_grid(encoding, name, size, states=2):
+    return ENCODINGS[encoding](name, size, states)
+
+
+def yes_this(grid, board, size):
+    """The grid is this board"""
+    return And(*(
+        grid.has(i, j, board[i][j])
+        for i in range(size) for j in range(size)
+    ))
+
+
+def not_this(grid, board, size):
+    """The grid isn't this board"""
+    return Or(*(
+        Not(grid.has(i, j, board[i][j]))
+        for i in range(size) for j in range(size)
+    ))